@@ -1,13 +1,16 @@
 import requests
 from bs4 import BeautifulSoup
+from grabber.http_client import HttpClient, get_client
 import csv
 import time
 import os
 
 
 class IvoryResidence:
-    def __init__(self, url="https://www.ivoryresidence.ro"):
+    def __init__(self, url="https://www.ivoryresidence.ro", parser="html.parser", client: HttpClient = None):
         self.url = url
+        self.parser = parser
+        self.client = client if client is not None else get_client()
         self.headers = {
             "authority": "www.ivoryresidence.ro",
             "method": "GET",
@@ -36,7 +39,7 @@ class IvoryResidence:
 
         full_url = self.url + "/" + page_url
         try:
-            response = requests.get(full_url, headers=self.headers)
+            response = self.client.get(full_url, headers=self.headers)
             response.raise_for_status()
             return response.content
         except requests.RequestException as e:
@@ -48,7 +51,7 @@ class IvoryResidence:
         if html_content is None:
             return {"apps": [], "links": []}
 
-        soup = BeautifulSoup(html_content, "html.parser")
+        soup = BeautifulSoup(html_content, self.parser)
 
         row_div = soup.find(
             "div", class_="row justify-content-center align-items-stretch"
@@ -101,7 +104,7 @@ class IvoryResidence:
         if html_content is None:
             return {}
 
-        soup = BeautifulSoup(html_content, "html.parser")
+        soup = BeautifulSoup(html_content, self.parser)
 
         title_element = soup.find("h1", class_="title")
         if title_element:
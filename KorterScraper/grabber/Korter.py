@@ -1,11 +1,19 @@
 from grabber.html_decoder import HtmlDecoder
-from bs4 import BeautifulSoup
-import requests
+from grabber.extraction_plan import ExtractionPlan, Field
+from grabber.page_cache import PageCache
+from grabber.http_client import HttpClient, get_client
+from grabber.crawl_engine import CrawlEngine
+from grabber.http_cache import HttpCache
+from grabber.resilience import DeadLetterQueue, get_resilience
+from grabber.listing_index import ListingIndex
+from grabber.crawl_frontier import CrawlFrontier
+from grabber.response_archive import ArchivedResponse, ResponseArchive, replay as replay_archive
+from grabber.result_sink import ResultSink
+from functools import partial
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
 import time
 import os
-import csv
 
 
 def extract_rooms(tags):
@@ -87,211 +95,540 @@ def normalize_price(price_str):
     return float(re.sub(r"[^\d,]", "", price_str).replace(",", "."))
 
 
+def clean_text(text):
+    # Remove zero-width joiners and any extra whitespace
+    cleaned_text = text.replace("\u200d", "").strip()
+    return cleaned_text
+
+
+def listing_tags(tags):
+    available_tags = []
+    for tag in tags:
+        tag = tag.get_text(strip=True)
+        if tag:
+            available_tags.append(clean_text(tag))
+    return available_tags
+
+
+# City pages: the pagination links
+KORTER_SEARCH_PLAN = ExtractionPlan(
+    {
+        "pages": Field(
+            "a",
+            "default-default-container-container-container-container-container-container-container-ul-li-link-class",
+            lambda links: [link["href"] for link in links if "href" in link.attrs],
+        ),
+    }
+)
+
+# Paginated city pages: the listing cards and the links inside them
+KORTER_PAGE_PLAN = ExtractionPlan(
+    {
+        "has_listings": Field(
+            "div",
+            "default-default-container-container-container-container-container-container-container-container-class",
+            bool,
+        ),
+        "urls": Field(
+            "a",
+            "default-default-container-container-container-container-container-container-container-container-link-class",
+            lambda links: [link["href"] for link in links if "href" in link.attrs],
+        ),
+    }
+)
+
+# Listing pages: the title and the text tags holding address, price, area, ...
+KORTER_LISTING_PLAN = ExtractionPlan(
+    {
+        "title": Field(
+            "h1",
+            "default-default-container-container-container-container-container-container-container-default-class",
+            lambda title: title.get_text(strip=True) if title else "N/A",
+            first=True,
+        ),
+        "tags": Field(
+            "div",
+            "default-default-container-container-container-container-container-container-container-container-container-container-class",
+            listing_tags,
+        ),
+    }
+)
+
+# The columns of the exported files, as parse_listing fills them
+KORTER_FIELDS = (
+    "title",
+    "complex",
+    "address",
+    "price",
+    "price_per_mp",
+    "rooms",
+    "square_footage",
+    "floor_no",
+    "bathrooms",
+    "bedrooms",
+)
+
+# one scraper per replay worker process, built on first use
+_replay_scraper = None
+
+
+def replay_listing(response: ArchivedResponse, parser: str = "html.parser"):
+    """
+    Extracts the record of an archived listing page in a replay worker.
+
+    :return: (url, record), or None for city pages and failed responses.
+    """
+    global _replay_scraper
+    if response.status_code != 200 or "/vanzare-apartamente-" in response.url:
+        return None
+
+    if _replay_scraper is None or _replay_scraper.parser != parser:
+        _replay_scraper = Korter(parser=parser)
+    return response.url, _replay_scraper.parse_listing(response.text)
+
+
 class Korter:
-    def __init__(self) -> None:
-        pass
+    def __init__(
+        self,
+        parser: str = "html.parser",
+        cache: PageCache = None,
+        client: HttpClient = None,
+        concurrency: int = 64,
+        per_host: int = 24,
+        http_cache: HttpCache = None,
+        dead_letters: DeadLetterQueue = None,
+        index: ListingIndex = None,
+        frontier: CrawlFrontier = None,
+        archive: ResponseArchive = None,
+        root_url: str = "https://korter.ro",
+        output_format: str = "csv",
+    ) -> None:
+        self.parser = parser
+        # the site the listing links are relative to; a stand-in server's
+        # address in load tests (see benchmarks/standin_server.py)
+        self.root_url = root_url
+        # byte-identical pages are only decoded and extracted once;
+        # pass PageCache(path=...) to keep the results between runs
+        self.cache = cache if cache is not None else PageCache()
+        # keep-alive connections shared with every other scraper in the process
+        self.client = client if client is not None else get_client()
+        # requests in flight during a crawl, in total and to one host
+        self.concurrency = concurrency
+        self.per_host = per_host
+        # pass HttpCache(path) to revalidate unchanged pages instead of
+        # downloading them again; with a PageCache path their extraction
+        # results are reused too
+        self.http_cache = http_cache
+        # pages that still failed after every retry; pass
+        # DeadLetterQueue(path) to re-drive them later with redrive()
+        self.dead_letters = (
+            dead_letters if dead_letters is not None else DeadLetterQueue()
+        )
+        # with a ListingIndex the crawl is incremental: detail pages are only
+        # fetched for new listings and the index's refresh fraction of known
+        # ones, and listings gone from a city are marked delisted
+        self.index = index
+        # with a CrawlFrontier a killed crawl resumes where it stopped: done
+        # pages and finished cities are not fetched again
+        self.frontier = frontier
+        # pass ResponseArchive(directory) to keep every response of a crawl
+        # and re-extract them later with replay(), without network
+        self.archive = archive
+        # "csv" or "jsonl"; records are written as they are done
+        self.output_format = output_format
+
+    def crawl_engine(self) -> CrawlEngine:
+        return CrawlEngine(
+            self.concurrency,
+            self.per_host,
+            http_cache=self.http_cache,
+            archive=self.archive,
+        )
+
+    def replay(self, path, workers: int = None) -> list:
+        """
+        Runs decoding and extraction over archived responses instead of the
+        site: every listing page in the archive is extracted again with the
+        current plans and regexes, in one process per CPU, and saved to one
+        CSV. The latest response of a listing archived more than once wins.
+
+        :param path: An archive file, a directory of them, or a list of either.
+        :param workers: Worker processes, one per CPU by default.
+        :return: The listing records.
+        """
+        records = {}
+        for item in replay_archive(
+            path, partial(replay_listing, parser=self.parser), workers
+        ):
+            if item is not None:
+                url, record = item
+                records[url] = record
+
+        all_apartments = list(records.values())
+        print(f"Replay complete. Processed: {len(all_apartments)}")
+        self.save_apartments_to_csv(all_apartments, "korter_replay")
+        return all_apartments
+
+    def dead_letter(self, url: str, kind: str, response, base_name: str) -> None:
+        """
+        Keeps a URL for redrive() if it failed for a reason that may pass
+        (429, 5xx, connection errors); a 404 is not retried.
+        """
+        if get_resilience().policy.retryable(response.status_code):
+            self.dead_letters.add(
+                url, kind, response.status_code, response.error, city=base_name
+            )
+
+    def result_sink(self, prefix: str, output_dir: str = "exported") -> ResultSink:
+        return ResultSink(
+            os.path.join(
+                output_dir,
+                f"{prefix}_all_apartments_{int(time.time())}.{self.output_format}",
+            ),
+            KORTER_FIELDS,
+        )
 
     def process_listings(
         self,
         base_url: str = "https://korter.ro/vanzare-apartamente-bucure%C8%99ti",
         base_name: str = "Bucuresti",
     ):
-        print(f"Using: {base_name} with {base_url} to pull listings...")
+        # written while the crawl runs; a crashed run leaves its records behind
+        with self.result_sink(base_name) as all_apartments:
+            fetched = asyncio.run(self.crawl_city(base_url, base_name, all_apartments=all_apartments))
 
-        first_page_html = requests.get(base_url)
-
-        if first_page_html.status_code == 200:
-            decoder = HtmlDecoder(first_page_html.text)
-            content = decoder.get_html()
-            soup = BeautifulSoup(content, "html.parser")
-
-            # Extract page numbers to find the last page
-            pages_container = soup.find_all(
-                "a",
-                class_="default-default-container-container-container-container-container-container-container-ul-li-link-class",
+        if fetched is not None:
+            print(f"Fetched: {len(all_apartments)}")
+            if self.index is not None:
+                print(self.index.summary())
+            print(self.cache.summary())
+            print(all_apartments.summary())
+        if self.frontier is not None:
+            # saved; the next run starts from scratch
+            self.frontier.clear()
+        self.report_dead_letters()
+
+    def report_dead_letters(self):
+        if len(self.dead_letters):
+            print(
+                f"{len(self.dead_letters)} pages failed after retries; "
+                "run redrive() to fetch only those."
             )
-            last_page = self.extract_listing_pages(pages_container)
-            print(f"Found last page number: {last_page}")
 
-            page_urls = [
-                f"{base_url}?page={page_num}" for page_num in range(1, last_page + 1)
-            ]
-            all_apartments = []
+    def redrive(self):
+        """
+        Fetches only the dead-lettered pages of earlier runs, not whole
+        cities, and saves what each city's pages yield to its own CSV. Pages
+        that fail again are dead-lettered again.
+        """
+        entries = self.dead_letters.take()
+        print(f"Re-driving {len(entries)} failed pages...")
+
+        # the re-drive is not part of the crawl the frontier may be resuming
+        frontier, self.frontier = self.frontier, None
+        try:
+            asyncio.run(self.crawl_dead_letters(entries))
+        finally:
+            self.frontier = frontier
+        # saved; the entries taken are not needed any more
+        self.dead_letters.ack()
+        print(f"Re-drive complete, still failing: {len(self.dead_letters)}")
+
+    async def crawl_dead_letters(self, entries: list):
+        cities = {}
+        for entry in entries:
+            cities.setdefault(entry.get("city") or "korter", []).append(entry)
+
+        async def redrive_city(base_name, city_entries):
+            with self.result_sink(f"{base_name}_redrive") as all_apartments:
+                await asyncio.gather(
+                    *(
+                        self.crawl_dead_letter(engine, entry, base_name, all_apartments)
+                        for entry in city_entries
+                    )
+                )
+            print(f"Re-driven {base_name}: {len(all_apartments)}")
+
+        async with self.crawl_engine() as engine:
+            await asyncio.gather(
+                *(redrive_city(name, city_entries) for name, city_entries in cities.items())
+            )
+            print(engine.summary())
 
-            # for url in page_urls:
-            #     result = self.fetch_and_process_page(url, all_apartments)
-            #     all_apartments.append(result)
+    async def crawl_dead_letter(
+        self, engine: CrawlEngine, entry: dict, base_name: str, all_apartments
+    ):
+        if entry["kind"] == "city":
+            await self.crawl_city(entry["url"], base_name, engine, all_apartments)
+        elif entry["kind"] == "page":
+            await self.crawl_page(engine, entry["url"], all_apartments, base_name)
+        else:
+            await self.crawl_listing(engine, entry["url"], all_apartments, base_name)
+
+    def process_cities(self, cities: dict):
+        """
+        Crawls all cities at once on one engine. Their requests share the
+        engine's limits and korter.ro's rate limiter, which keeps the total
+        rate at what the server tolerates instead of one city at a time.
+
+        :param cities: City name to its listing page URL.
+        """
+        asyncio.run(self.crawl_cities(cities))
+
+    async def crawl_cities(self, cities: dict):
+        async with self.crawl_engine() as engine:
+
+            async def crawl_and_save(base_name, base_url):
+                if self.frontier is not None and self.frontier.scope_done(base_name):
+                    print(f"{base_name} was saved before the interruption, skipping.")
+                    return
+
+                with self.result_sink(base_name) as all_apartments:
+                    fetched = await self.crawl_city(base_url, base_name, engine, all_apartments)
+                if fetched is not None:
+                    print(f"Fetched {base_name}: {len(all_apartments)}")
+                    print(all_apartments.summary())
+                    if self.frontier is not None:
+                        self.frontier.finish_scope(base_name)
+
+            await asyncio.gather(
+                *(crawl_and_save(name, url) for name, url in cities.items())
+            )
+            print(engine.summary())
+            if self.index is not None:
+                print(self.index.summary())
+            print(self.cache.summary())
+            self.report_dead_letters()
+
+        if self.frontier is not None:
+            # every city is saved; the next run starts from scratch
+            self.frontier.clear()
+
+    async def crawl_city(
+        self, base_url: str, base_name: str, engine: CrawlEngine = None, all_apartments=None
+    ):
+        """
+        Crawls every page of a city and every listing on them as tasks on one
+        event loop.
+
+        :param base_url: The city's listing page.
+        :param base_name: The city name, for the logs.
+        :param engine: A running engine to share; a new one is started if None.
+        :param all_apartments: Where each record goes as soon as it is done,
+            a ResultSink or a list; a new list if None.
+        :return: all_apartments, or None if the first page failed.
+        """
+        if engine is None:
+            async with self.crawl_engine() as engine:
+                all_apartments = await self.crawl_city(base_url, base_name, engine, all_apartments)
+                print(engine.summary())
+                return all_apartments
+
+        all_apartments = all_apartments if all_apartments is not None else []
 
-            with ThreadPoolExecutor(max_workers=6) as executor:
-                futures = {
-                    executor.submit(
-                        self.fetch_and_process_page, page_url, all_apartments
-                    ): page_url
-                    for page_url in page_urls
-                }
+        print(f"Using: {base_name} with {base_url} to pull listings...")
+        if self.index is not None:
+            self.index.begin(base_name)
 
-                for future in as_completed(futures):
-                    future.result()
+        if self.frontier is not None and self.frontier.has(base_name):
+            print(f"Resuming the interrupted crawl of {base_name}.")
+            if self.index is not None:
+                # listings done before the interruption are not seen again
+                self.index.incomplete(base_name)
+            # their records first, then this run's
+            for record in self.frontier.records(base_name):
+                all_apartments.append(record)
 
-            print(f"Fetched: {len(all_apartments)}")
-            print("Will begin data dump...")
-
-            csv_file = (
-                "exported/"
-                + base_name
-                + "_all_appartments_"
-                + str(int(time.time()))
-                + ".csv"
-            )
+        first_page_html = await engine.fetch(base_url)
 
-            self.save_apartments_to_csv(all_apartments, base_name)
-        else:
+        if first_page_html.status_code != 200:
             print(
                 f"Failed to retrieve the first page. Status code: {first_page_html.status_code}"
             )
+            self.dead_letter(base_url, "city", first_page_html, base_name)
+            return None
+
+        # Extract page numbers to find the last page
+        pages_container = (
+            await engine.parse(self.extract, KORTER_SEARCH_PLAN, first_page_html.text)
+        )["pages"]
+        last_page = self.extract_listing_pages(pages_container)
+        print(f"Found last page number: {last_page}")
+
+        page_urls = [f"{base_url}?page={page_num}" for page_num in range(1, last_page + 1)]
+        listing_urls = []
+        if self.frontier is not None:
+            # known URLs keep their state; only unfinished ones are crawled
+            self.frontier.add(page_urls, "page", base_name)
+            page_urls = self.frontier.pending(base_name, "page")
+            listing_urls = self.frontier.pending(base_name, "listing")
+
+        await asyncio.gather(
+            *(
+                self.crawl_page(engine, page_url, all_apartments, base_name)
+                for page_url in page_urls
+            ),
+            *(
+                self.crawl_listing(engine, url, all_apartments, base_name)
+                for url in listing_urls
+            ),
+        )
 
-    def save_apartments_to_csv(self, all_apartments, prefix, output_dir="exported"):
-        # Ensure the output directory exists
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        if all_apartments:
-            # Generate a unique filename with a timestamp
-            csv_file = os.path.join(
-                output_dir, f"{prefix}_all_apartments_{int(time.time())}.csv"
-            )
-
-            headers = all_apartments[0].keys()
-
-            # Write data to CSV file
-            with open(csv_file, mode="w", newline="", encoding="utf-8") as file:
-                writer = csv.DictWriter(file, fieldnames=headers)
-                writer.writeheader()
+        if self.index is not None:
+            delisted = self.index.finish(base_name)
+            if delisted:
+                print(f"Delisted in {base_name}: {delisted}")
 
-                for property_data in all_apartments:
-                    if property_data:
-                        row = {key: str(property_data.get(key, "")) for key in headers}
-                        writer.writerow(row)
+        return all_apartments
 
-            print(f"Data collection complete and saved to {csv_file}")
+    def save_apartments_to_csv(self, all_apartments, prefix, output_dir="exported"):
+        if all_apartments:
+            with self.result_sink(prefix, output_dir) as sink:
+                sink.extend(all_apartments)
+            print(f"Data collection complete and saved to {sink.path}")
         else:
             print("No apartments found")
 
-    def fetch_and_process_page(self, page_url, page_apartments):
+    async def crawl_page(
+        self,
+        engine: CrawlEngine,
+        page_url: str,
+        page_apartments: list,
+        base_name: str = None,
+    ):
         print(f"Processing URL: {page_url}")
-        page_html = requests.get(page_url)
+        page_html = await engine.fetch(page_url)
 
         if page_html.status_code == 200:
-            decoder = HtmlDecoder(page_html.text)
-            content = decoder.get_html()
-            soup = BeautifulSoup(content, "html.parser")
-
-            listings_container = soup.find_all(
-                "div",
-                class_="default-default-container-container-container-container-container-container-container-container-class",
-            )
-            if not listings_container:
+            fields = await engine.parse(self.extract, KORTER_PAGE_PLAN, page_html.text)
+            if not fields["has_listings"]:
                 print(f"Unable to process the listings container on {page_url}.")
-                return []
-
-            urls = []
-            for listing in listings_container:
-                self.extract_listing_urls(listing, urls)
-
-            if urls:
-                num_workers = len(urls)
-                with ThreadPoolExecutor(4) as executor:
-                    futures = [
-                        executor.submit(self.extract_listing_metadata, url)
-                        for url in urls
-                    ]
-                    for future in as_completed(futures):
-                        result = future.result()
-                        if result is not None:
-                            page_apartments.append(result)
-
+                return page_apartments
+
+            listing_urls = fields["urls"]
+            if self.frontier is not None:
+                # listings known from before an interruption are resumed by crawl_city()
+                listing_urls = self.frontier.add(listing_urls, "listing", base_name)
+
+            await asyncio.gather(
+                *(
+                    self.crawl_listing(engine, url, page_apartments, base_name)
+                    for url in listing_urls
+                )
+            )
+            if self.frontier is not None:
+                self.frontier.done(page_url, scope=base_name)
         else:
             print(
                 f"Failed to retrieve {page_url}. Status code: {page_html.status_code}"
             )
+            self.dead_letter(page_url, "page", page_html, base_name)
+            if self.index is not None:
+                # listings on this page were not seen; none can be delisted
+                self.index.incomplete(base_name)
+            if self.frontier is not None:
+                self.frontier.failed(page_url, base_name)
         return page_apartments
 
-    def clean_text(self, text):
-        # Remove zero-width joiners and any extra whitespace
-        cleaned_text = text.replace("\u200d", "").strip()
-        return cleaned_text
+    async def crawl_listing(
+        self,
+        engine: CrawlEngine,
+        url: str,
+        page_apartments: list,
+        base_name: str = None,
+    ):
+        listing_url = self.root_url + url
+        if self.index is not None:
+            record = self.index.reusable(listing_url)
+            if record is not None:
+                self.index.seen(base_name, listing_url)
+                page_apartments.append(record)
+                if self.frontier is not None:
+                    self.frontier.done(url, record, base_name)
+                return
 
-    def extract_listing_metadata(self, url: str):
         print(f"Processing metadata for: {url}")
-        metadata = {}
-        html = requests.get("https://korter.ro" + url)
+        if self.frontier is not None:
+            self.frontier.claim(url, base_name)
+        html = await engine.fetch(listing_url)
         if html.status_code == 200:
-            decoder = HtmlDecoder(html.text)
-            content = decoder.get_html()
-            listing = BeautifulSoup(content, "html.parser")
-
-            title_tag = listing.find(
-                "h1",
-                class_="default-default-container-container-container-container-container-container-container-default-class",
-            )
-            metadata["title"] = title_tag.get_text(strip=True) if title_tag else "N/A"
+            record = await engine.parse(self.parse_listing, html.text)
+            page_apartments.append(record)
+            if self.index is not None:
+                self.index.seen(base_name, listing_url, record)
+            if self.frontier is not None:
+                self.frontier.done(url, record, base_name)
+        else:
+            print(f"Unable to query: {url} - {html.status_code}")
+            self.dead_letter(url, "listing", html, base_name)
+            if self.index is not None and html.status_code not in (404, 410):
+                # still on the city page, only its details are missing
+                self.index.seen(base_name, listing_url)
+            if self.frontier is not None:
+                self.frontier.failed(url, base_name)
 
-            tags = listing.find_all(
-                "div",
-                class_="default-default-container-container-container-container-container-container-container-container-container-container-class",
-            )
-            available_tags = []
-            if tags:
-                for tag in tags:
-                    tag = tag.get_text(strip=True)
-                    if tag:
-                        available_tags.append(self.clean_text(tag))
-                    # for child in tag.find_all(recursive=False):  # `recursive=False` to avoid deep traversal
-                    #     # Extract text from each child element and append it
-                    #     child = child.get_text(strip=True)
-                    #     if child:
-                    #         available_tags.append(child)
-
-            metadata["complex"] = self.extract_complex_builder(metadata["title"])
-            metadata["address"] = available_tags[0] if available_tags[0] else "N/A"
-            metadata["price"] = 0
-            metadata["price_per_mp"] = 0
-            metadata["rooms"] = 0
-            metadata["square_footage"] = 0
-            metadata["floor_no"] = 0
-            metadata["bathrooms"] = 0
-            metadata["bedrooms"] = 0
-
-            regex_patterns = {
-                "price": r"[\d\s,]+€(?:\s*\+\s*TVA)?",
-                "price_per_mp": r"\d{1,3}(?:\s*\d{3})*(?:,\d+)?\s*€\s*/\s*m2",
-                "rooms": r"(\d+ camere|\d+ apartamnt|\d+ garsonier)",
-                "square_footage": r"\d+(\.\d+)?\s*m2",
-                "floor_no": r"etaj.*?(\d+)",
-                "bathrooms": r"(\d+)\s*(baie|băi)",
-                "bedrooms": r"\d+\s*(dormitor|dormitoare)",
-            }
-
-            for tag in available_tags:
-                for key, pattern in regex_patterns.items():
-                    match = re.search(pattern, tag, re.IGNORECASE)
-                    if match:
-                        metadata[key] = match.group()
-                        break
+    def clean_text(self, text):
+        return clean_text(text)
 
-            metadata["price"] = extract_price(available_tags)
-            metadata["price_per_mp"] = extract_price_per_mp(available_tags)
-            metadata["bathrooms"] = extract_bathrooms(available_tags)
-            metadata["bedrooms"] = extract_bedrooms(available_tags)
-            metadata["rooms"] = extract_rooms(available_tags)
-            metadata["square_footage"] = extract_square_footage(available_tags)
-            metadata["floor_no"] = extract_floor_no(available_tags)
+    def extract(self, plan: ExtractionPlan, html: str) -> dict:
+        decoder = HtmlDecoder(html, parser=self.parser)
+        key = self.cache.key(html, decoder.config_key(), plan.fingerprint)
+        return self.cache.get_or_compute(key, lambda: plan.extract(decoder))
 
+    def extract_listing_metadata(self, url: str):
+        print(f"Processing metadata for: {url}")
+        metadata = {}
+        html = self.client.get(self.root_url + url)
+        if html.status_code == 200:
+            metadata = self.parse_listing(html.text)
         else:
             print(f"Unable to query: {url} - {html.status_code}")
 
         return metadata
 
+    def parse_listing(self, html: str) -> dict:
+        metadata = {}
+        fields = self.extract(KORTER_LISTING_PLAN, html)
+        metadata["title"] = fields["title"]
+        available_tags = fields["tags"]
+
+        metadata["complex"] = self.extract_complex_builder(metadata["title"])
+        metadata["address"] = available_tags[0] if available_tags else "N/A"
+        metadata["price"] = 0
+        metadata["price_per_mp"] = 0
+        metadata["rooms"] = 0
+        metadata["square_footage"] = 0
+        metadata["floor_no"] = 0
+        metadata["bathrooms"] = 0
+        metadata["bedrooms"] = 0
+
+        regex_patterns = {
+            "price": r"[\d\s,]+€(?:\s*\+\s*TVA)?",
+            "price_per_mp": r"\d{1,3}(?:\s*\d{3})*(?:,\d+)?\s*€\s*/\s*m2",
+            "rooms": r"(\d+ camere|\d+ apartamnt|\d+ garsonier)",
+            "square_footage": r"\d+(\.\d+)?\s*m2",
+            "floor_no": r"etaj.*?(\d+)",
+            "bathrooms": r"(\d+)\s*(baie|băi)",
+            "bedrooms": r"\d+\s*(dormitor|dormitoare)",
+        }
+
+        for tag in available_tags:
+            for key, pattern in regex_patterns.items():
+                match = re.search(pattern, tag, re.IGNORECASE)
+                if match:
+                    metadata[key] = match.group()
+                    break
+
+        metadata["price"] = extract_price(available_tags)
+        metadata["price_per_mp"] = extract_price_per_mp(available_tags)
+        metadata["bathrooms"] = extract_bathrooms(available_tags)
+        metadata["bedrooms"] = extract_bedrooms(available_tags)
+        metadata["rooms"] = extract_rooms(available_tags)
+        metadata["square_footage"] = extract_square_footage(available_tags)
+        metadata["floor_no"] = extract_floor_no(available_tags)
+
+        return metadata
+
     def extract_complex_builder(self, title):
         parts = title.split("–")
         if parts:
@@ -304,8 +641,9 @@ class Korter:
         pages = []
         if listing:
             for item in listing:
-                if "href" in item.attrs:
-                    href = item["href"]
+                # the search plan hands over the hrefs, older callers the tags
+                href = item if isinstance(item, str) else item.attrs.get("href")
+                if href:
                     match = re.search(r"\?page=(\d+)", href)
                     if match:
                         page_number = int(match.group(1))
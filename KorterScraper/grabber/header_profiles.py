@@ -0,0 +1,145 @@
+import itertools
+import threading
+
+from requests.utils import DEFAULT_ACCEPT_ENCODING
+
+
+NAVIGATE_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+    # only what requests can decode, a br body we cannot read is worse than
+    # a slightly unusual header
+    "Accept-Encoding": DEFAULT_ACCEPT_ENCODING,
+    "Upgrade-Insecure-Requests": "1",
+    "Sec-Fetch-Dest": "document",
+    "Sec-Fetch-Mode": "navigate",
+    "Sec-Fetch-Site": "none",
+    "Sec-Fetch-User": "?1",
+}
+
+FIREFOX_ACCEPT = "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/png,image/svg+xml,*/*;q=0.8"
+SAFARI_ACCEPT = "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"
+
+
+def chromium(brand: str, version: str, platform: str, user_agent: str) -> dict:
+    profile = dict(NAVIGATE_HEADERS)
+    profile.update(
+        {
+            "User-Agent": user_agent,
+            "Accept-Language": "ro-RO,ro;q=0.9,en-US;q=0.8,en;q=0.7",
+            "sec-ch-ua": f'"{brand}";v="{version}", "Chromium";v="{version}", "Not)A;Brand";v="99"',
+            "sec-ch-ua-mobile": "?0",
+            "sec-ch-ua-platform": f'"{platform}"',
+        }
+    )
+    return profile
+
+
+def firefox(user_agent: str) -> dict:
+    profile = dict(NAVIGATE_HEADERS)
+    profile.update(
+        {
+            "User-Agent": user_agent,
+            "Accept": FIREFOX_ACCEPT,
+            "Accept-Language": "ro-RO,ro;q=0.8,en-US;q=0.5,en;q=0.3",
+            "Priority": "u=0, i",
+        }
+    )
+    return profile
+
+
+def safari(user_agent: str) -> dict:
+    profile = dict(NAVIGATE_HEADERS)
+    del profile["Upgrade-Insecure-Requests"]
+    profile.update(
+        {
+            "User-Agent": user_agent,
+            "Accept": SAFARI_ACCEPT,
+            "Accept-Language": "ro-RO,ro;q=0.9",
+        }
+    )
+    return profile
+
+
+# Complete header sets as the browsers send them on a top-level navigation,
+# so the User-Agent never disagrees with the client hints or Accept headers.
+BROWSER_PROFILES = (
+    chromium("Google Chrome", "127", "Windows",
+             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36"),
+    chromium("Google Chrome", "128", "Windows",
+             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36"),
+    chromium("Google Chrome", "128", "macOS",
+             "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36"),
+    chromium("Google Chrome", "127", "Linux",
+             "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36"),
+    chromium("Microsoft Edge", "128", "Windows",
+             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36 Edg/128.0.0.0"),
+    firefox("Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:129.0) Gecko/20100101 Firefox/129.0"),
+    firefox("Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:129.0) Gecko/20100101 Firefox/129.0"),
+    firefox("Mozilla/5.0 (X11; Linux x86_64; rv:129.0) Gecko/20100101 Firefox/129.0"),
+    safari("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.6 Safari/605.1.15"),
+)
+
+
+class HeaderProfilePool:
+    """
+    A fixed set of browser header profiles, built once per process. Picking one
+    is a counter increment (rotate) or a thread-local lookup (sticky), so
+    request setup no longer pays for building a User-Agent database.
+
+    The returned dicts are shared: merge them into a new dict, never modify
+    them.
+    """
+
+    def __init__(self, profiles=BROWSER_PROFILES, sticky: bool = False) -> None:
+        """
+        :param profiles: The header dicts to hand out.
+        :param sticky: If True, each thread keeps one profile per host, the
+            way one browser would keep its connection; otherwise every request
+            gets the next profile.
+        """
+        if not profiles:
+            raise ValueError("At least one header profile is required")
+
+        self.profiles = tuple(profiles)
+        self.sticky = sticky
+        self._counter = itertools.count()
+        self._local = threading.local()
+
+    def next(self) -> dict:
+        """
+        :return: The next profile, round robin; itertools.count is atomic, so
+            threads need no lock.
+        """
+        return self.profiles[next(self._counter) % len(self.profiles)]
+
+    def for_host(self, host: str) -> dict:
+        """
+        :param host: The host the request goes to.
+        :return: The profile to send to it.
+        """
+        if not self.sticky:
+            return self.next()
+
+        chosen = getattr(self._local, "profiles", None)
+        if chosen is None:
+            chosen = self._local.profiles = {}
+
+        profile = chosen.get(host)
+        if profile is None:
+            profile = chosen[host] = self.next()
+        return profile
+
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+
+def get_profiles() -> HeaderProfilePool:
+    """
+    :return: The process-wide pool, rotating per request.
+    """
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = HeaderProfilePool()
+        return _shared_pool
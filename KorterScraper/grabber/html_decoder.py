@@ -1,17 +1,183 @@
-from bs4 import BeautifulSoup, Comment
+from bs4 import BeautifulSoup, Comment, Doctype, NavigableString, Tag
+from bs4.builder import HTMLTreeBuilder
+import hashlib
 import json
 import re
 
+try:
+    import orjson
+except ImportError:  # optional, dump_json falls back to the json module
+    orjson = None
+
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+PUNCTUATION_PATTERN = re.compile(r"\s*([\[\]{}()|^$*+?.\\])\s*")
+EMPTY_TAG_NAME_PATTERN = re.compile(r"[a-z][a-z0-9]*")
+
+# Parser backends and the BeautifulSoup tree builder each one uses.
+# "lxml.html" makes get_soup return a native lxml tree wrapped in a small
+# find/find_all query object (see grabber/lxml_tree.py); get_html and
+# the JSON exports fall back to BeautifulSoup's lxml builder for it.
+PARSERS = {
+    "html.parser": "html.parser",
+    "lxml": "lxml",
+    "lxml.html": "lxml",
+}
+
+
+def _encode_json(value) -> str:
+    """Compact JSON encoding, through orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def split_list_attributes(name: str, attrs: dict) -> dict:
+    """
+    Splits multi-valued attributes (class, rel, ...) into lists, the way
+    BeautifulSoup's HTML tree builders do, for the tree-free backends.
+
+    :param name: The tag name.
+    :param attrs: The tag's attributes, modified in place.
+    :return: The same attributes dictionary.
+    """
+    list_attributes = HTMLTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES
+    for key in list_attributes["*"] | list_attributes.get(name, set()):
+        value = attrs.get(key)
+        if isinstance(value, str):
+            attrs[key] = value.split()
+    return attrs
+
+
+class MinifiedDoctype(Doctype):
+    """A doctype serialized without the line break BeautifulSoup puts after it."""
+
+    SUFFIX = ">"
+
+
+class PrunedSoup(BeautifulSoup):
+    """
+    A BeautifulSoup that drops comments and the subtrees of unwanted tags while
+    the tree builder is still tokenizing, so they never become objects. Works
+    with both the html.parser and lxml tree builders, which feed the soup the
+    same start/end/data events.
+    """
+
+    def __init__(self, *args, tags_to_remove=frozenset(), **kwargs) -> None:
+        self.tags_to_remove = tags_to_remove
+        self._skip_stack = []
+        super().__init__(*args, **kwargs)
+
+    def handle_starttag(self, name, *args, **kwargs):
+        if self._skip_stack or name in self.tags_to_remove:
+            if not self.builder.can_be_empty_element(name):
+                self._skip_stack.append(name)
+            return None
+
+        return super().handle_starttag(name, *args, **kwargs)
+
+    def handle_endtag(self, name, nsprefix=None) -> None:
+        if self._skip_stack:
+            if name in self._skip_stack:
+                while self._skip_stack.pop() != name:
+                    pass
+                return
+
+            # The end tag closes an element outside the pruned subtree, which
+            # implicitly closes the subtree as well.
+            if not any(tag.name == name for tag in self.tagStack):
+                return
+            self._skip_stack = []
+
+        super().handle_endtag(name, nsprefix)
+
+    def handle_data(self, data) -> None:
+        if not self._skip_stack:
+            super().handle_data(data)
+
+    def endData(self, containerClass=None) -> None:
+        if containerClass is not None and issubclass(containerClass, Comment):
+            self.current_data = []
+            return
+
+        super().endData(containerClass)
+
+
+class ClassPathTrie:
+    """
+    Interns the synthetic class paths of a page. A path is identified by the id
+    of its parent path plus one tag_map segment, so giving a node its path is a
+    single dict lookup instead of copying and joining the list of all its
+    ancestors. Class strings are built once per distinct path, and only when
+    asked for.
+    """
+
+    ROOT = 0
+
+    def __init__(self) -> None:
+        self._ids = {}
+        self._parents = [None]
+        self._segments = [None]
+        self._prefixes = [""]
+        self._class_names = [None]
+
+    def intern(self, parent_id: int, segment: str) -> int:
+        """
+        :param parent_id: The parent path id, ClassPathTrie.ROOT for top-level tags.
+        :param segment: The mapped tag name of the node.
+        :return: The id of the path parent + segment.
+        """
+        key = (parent_id, segment)
+        path_id = self._ids.get(key)
+        if path_id is None:
+            path_id = len(self._parents)
+            self._ids[key] = path_id
+            self._parents.append(parent_id)
+            self._segments.append(segment)
+            self._prefixes.append(None)
+            self._class_names.append(None)
+        return path_id
+
+    def class_name(self, path_id: int) -> str:
+        """
+        :param path_id: A path id returned by intern.
+        :return: The synthetic class, e.g. "default-default-container-class".
+        """
+        class_name = self._class_names[path_id]
+        if class_name is None:
+            pending = []
+            node = path_id
+            while self._prefixes[node] is None:
+                pending.append(node)
+                node = self._parents[node]
+
+            prefix = self._prefixes[node]
+            for node in reversed(pending):
+                segment = self._segments[node]
+                prefix = prefix + "-" + segment if prefix else segment
+                self._prefixes[node] = prefix
+
+            class_name = prefix + "-class"
+            self._class_names[path_id] = class_name
+        return class_name
+
 
 class HtmlDecoder:
-    def __init__(self, html: str = None, tag_map: dict = None) -> None:
+    def __init__(
+        self, html: str = None, tag_map: dict = None, parser: str = "html.parser"
+    ) -> None:
         """
         Initializes the HtmlDecoder with the optional tag map.
 
         :param html: The input HTML string to parse and modify.
         :param tag_map: A dictionary for mapping tag names to class names.
+        :param parser: The parser backend, one of PARSERS.
         """
+        if parser not in PARSERS:
+            raise ValueError(f"Unsupported parser backend: {parser}")
+
         self._html = html
+        self.parser = parser
 
         self.tag_map = (
             tag_map
@@ -33,7 +199,7 @@ class HtmlDecoder:
             }
         )
 
-        self.tags_to_remove = [
+        self.tags_to_remove = {
             "script",
             "style",
             "meta",
@@ -55,83 +221,92 @@ class HtmlDecoder:
             "base",
             "picture",
             "lazy-image-container",
-        ]
-
-        self.attributes_to_ignore = ["title", "target", "style"]
+        }
 
-    def _remove_comments(self, soup):
-        """
-        Removes all comments from the BeautifulSoup object.
+        self.attributes_to_ignore = {"title", "target", "style"}
 
-        :param soup: The BeautifulSoup object to process.
-        """
-        comments = soup.find_all(text=lambda text: isinstance(text, Comment))
-        for comment in comments:
-            comment.extract()
+        self.paths = ClassPathTrie()
 
-    def _get_class_name(self, tag, parent_classes):
+    def config_key(self) -> str:
         """
-        Constructs the class name for the tag based on its type and its parent’s class names.
-        Limits the depth of hierarchy to avoid overly long class names.
+        Identifies everything besides the page that changes the decoded output,
+        for caches of decode results (see grabber/page_cache.py).
 
-        :param tag: The current tag being processed.
-        :param parent_classes: A list of class names of the parent tags.
-        :return: The constructed class name.
+        :return: A short digest of the parser, tag map and removal rules.
         """
-        tag_type = self.tag_map.get(tag.name, "default")
-        limited_classes = parent_classes + [tag_type]
-        return "-".join(limited_classes) + "-class"
+        config = (
+            self.parser,
+            sorted(self.tag_map.items()),
+            sorted(self.tags_to_remove),
+            sorted(self.attributes_to_ignore),
+        )
+        return hashlib.blake2b(repr(config).encode("utf-8"), digest_size=8).hexdigest()
 
-    def _replace_attributes(self, tag, parent_classes):
+    def _replace_attributes(self, tag, path_id):
         """
-        Replaces the class and id attributes of a tag by prefixing them with 'fixed-' and their mapped value,
-        and removes style attributes.
+        Replaces the class attribute of a tag with its synthetic class and removes
+        the ignored attributes.
 
         :param tag: The current tag being processed.
-        :param parent_classes: A list of class names of the parent tags.
+        :param path_id: The tag's class path id in self.paths.
         """
-        class_name = self._get_class_name(tag, parent_classes)
-
-        if "class" in tag.attrs:
-            tag["class"] = [class_name]
-        else:
-            tag["class"] = [class_name]
+        tag["class"] = [self.paths.class_name(path_id)]
 
-        if self.attributes_to_ignore:
-            for attr in self.attributes_to_ignore:
-                if attr in tag.attrs:
-                    del tag[attr]
+        for attr in self.attributes_to_ignore:
+            tag.attrs.pop(attr, None)
 
-    def _traverse_and_replace(self, tag, parent_classes):
+    def _traverse_and_replace(self, soup, json_structure: list = None):
         """
-        Recursively traverses the HTML tree, replacing class and id attributes,
-        and removing any unnecessary tags.
+        Traverses the HTML tree with an explicit stack (deep pages cannot hit the
+        recursion limit), replacing class attributes and removing any
+        unnecessary tags.
 
-        :param tag: The current tag being processed.
-        :param parent_classes: A list of class names of the parent tags.
+        :param soup: The BeautifulSoup object to process.
+        :param json_structure: If given, a JSON representation of every kept tag
+            is appended to it, nested by "children".
         """
-        if tag.name in self.tags_to_remove:
-            tag.decompose()
-            return
-
-        self._replace_attributes(tag, parent_classes)
-
-        current_classes = parent_classes + [self.tag_map.get(tag.name, "default")]
-
-        children = []
-        for child in tag.find_all(True, recursive=False):
-            child_json = self._traverse_and_replace(child, current_classes)
-            if child_json:
-                children.append(child_json)
+        stack = [
+            (tag, ClassPathTrie.ROOT, json_structure)
+            for tag in reversed(soup.find_all(True, recursive=False))
+        ]
+        while stack:
+            tag, parent_id, siblings = stack.pop()
+            if tag.name in self.tags_to_remove:
+                tag.decompose()
+                continue
+
+            path_id = self.paths.intern(parent_id, self.tag_map.get(tag.name, "default"))
+            self._replace_attributes(tag, path_id)
+
+            children = None
+            if siblings is not None:
+                node = {
+                    "tag": tag.name,
+                    "class": tag.get("class", []),
+                    "attributes": {
+                        k: v
+                        for k, v in tag.attrs.items()
+                        if k not in self.attributes_to_ignore
+                    },
+                    "children": [],
+                }
+                siblings.append(node)
+                children = node["children"]
+
+            for child in reversed(tag.contents):
+                if isinstance(child, Tag):
+                    stack.append((child, path_id, children))
+
+    def _parse(self):
+        """
+        Parses the HTML, dropping comments and the tags in tags_to_remove
+        (with their content) while tokenizing.
 
-        return {
-            "tag": tag.name,
-            "class": tag.get("class", []),
-            "attributes": {
-                k: v for k, v in tag.attrs.items() if k not in self.attributes_to_ignore
-            },
-            "children": children,
-        }
+        :return: The BeautifulSoup object.
+        """
+        return PrunedSoup(
+            self._html, PARSERS[self.parser], tags_to_remove=self.tags_to_remove
+        )
 
     def _generate_json(self) -> dict:
         """
@@ -142,26 +317,93 @@ class HtmlDecoder:
         if not self._html:
             raise ValueError("HTML content is not provided")
 
-        soup = BeautifulSoup(self._html, "html.parser")
-        self._remove_comments(soup)
+        soup = self._parse()
 
         json_structure = []
-        for tag in soup.find_all(True, recursive=False):
-            tag_json = self._traverse_and_replace(tag, [])
-            if tag_json:
-                json_structure.append(tag_json)
+        self._traverse_and_replace(soup, json_structure)
 
         return json_structure
 
-    def _minify_html(self, minified_html: str) -> str:
-        minified_html = re.sub(r"\s+", " ", minified_html)
-        minified_html = re.sub(r">\s<", "><", minified_html)
-        minified_html = re.sub(r"(?<!\S)\s+|(?<=\S)\s+(?!\S)", "", minified_html)
-        minified_html = re.sub(r"\s*([\[\]{}()|^$*+?.\\])\s*", r"\1", minified_html)
-        minified_html = re.sub(r"<([a-z][a-z0-9]*)[^>]*>\s*</\1>", "", minified_html)
-        minified_html = minified_html.strip()
+    def _minify_html(self, soup) -> str:
+        """
+        Serializes the rewritten tree minified, in a single write.
+
+        The text-level rules are applied on the tree (see _normalize_tree) and
+        attribute values get the same whitespace and punctuation treatment, so
+        the output matches the old regex chain without copying the whole
+        document once per pattern.
+
+        :param soup: The rewritten BeautifulSoup object.
+        :return: The minified HTML as a string.
+        """
+        self._normalize_tree(soup)
+
+        for node in list(soup.contents):
+            if type(node) is Doctype:
+                node.replace_with(MinifiedDoctype(node))
+
+        for tag in soup.find_all(True):
+            for key, value in tag.attrs.items():
+                if isinstance(value, str):
+                    tag.attrs[key] = PUNCTUATION_PATTERN.sub(
+                        r"\1", WHITESPACE_PATTERN.sub(" ", value)
+                    )
+
+        return str(soup).strip()
+
+    def _normalize_tree(self, soup) -> None:
+        """
+        Applies the text-level minify rules directly on the tree,
+        so a soup returned by get_soup matches one re-parsed from get_html.
+
+        Whitespace runs collapse to a single space, whitespace-only strings are
+        dropped, spaces around punctuation are removed and elements that were
+        empty to begin with are deleted (a single pass, not repeated); strings
+        left next to each other are merged, as a re-parse would do.
+
+        :param soup: The rewritten BeautifulSoup object to normalize.
+        """
+        soup.smooth()
+
+        for string in list(soup.find_all(string=True)):
+            if type(string) is not NavigableString:
+                continue
+
+            text = WHITESPACE_PATTERN.sub(" ", string)
+            if text == " ":
+                string.extract()
+                continue
+
+            text = PUNCTUATION_PATTERN.sub(r"\1", text)
+            if text != string:
+                string.replace_with(text)
+
+        empty_tags = [
+            tag
+            for tag in soup.find_all(True)
+            if not tag.contents
+            and not tag.is_empty_element
+            and EMPTY_TAG_NAME_PATTERN.fullmatch(tag.name)
+        ]
+        for tag in empty_tags:
+            tag.decompose()
+
+        soup.smooth()
+
+    def _decode(self):
+        """
+        Parses the HTML without comments and unnecessary tags and rewrites every
+        class attribute in place.
+
+        :return: The rewritten BeautifulSoup object.
+        """
+        if not self._html:
+            raise ValueError("HTML content is not provided")
+
+        soup = self._parse()
+        self._traverse_and_replace(soup)
 
-        return minified_html
+        return soup
 
     def _dump_to_file(self, html: str = None) -> None:
         with open("dump.html", "w+") as f:
@@ -176,21 +418,72 @@ class HtmlDecoder:
         :param beautify: If True, returns the beautified (indented) HTML.
         :return: The modified HTML as a string.
         """
-        if not self._html:
-            raise ValueError("HTML content is not provided")
-
-        soup = BeautifulSoup(self._html, "html.parser")
-
-        self._remove_comments(soup)
+        soup = self._decode()
 
-        for tag in soup.find_all(True, recursive=False):
-            self._traverse_and_replace(tag, [])
-
-        result = soup.prettify() if beautify else self._minify_html(str(soup))
+        result = soup.prettify() if beautify else self._minify_html(soup)
         if dump:
             self._dump_to_file(result)
         return result
 
+    def get_soup(self):
+        """
+        Same rewrite as get_html, but hands back the tree instead of a string.
+        The page is tokenized once and never serialized, so callers can run
+        find/find_all on the result without parsing it a second time.
+
+        With the "lxml.html" backend the result is a LxmlDocument, which offers
+        the find/find_all/get_text subset the site extractors rely on.
+
+        :return: The rewritten BeautifulSoup object.
+        """
+        if self.parser == "lxml.html":
+            from grabber.lxml_tree import decode_lxml
+
+            return decode_lxml(self._html, self)
+
+        soup = self._decode()
+        self._normalize_tree(soup)
+        return soup
+
+    def iter_matches(self, matches, chunks=None, chunk_size: int = 16384):
+        """
+        Streams the page through an incremental tokenizer and yields only the
+        elements whose tag and synthetic class are requested, without building
+        a tree. Memory is bounded by the open-element stack plus the matched
+        elements; stop iterating to stop parsing the rest of the page.
+
+        Matched elements carry the same attributes and text get_soup would give
+        them, so flat find_all lookups can be answered from the stream.
+
+        :param matches: An iterable of (tag name, class name) pairs. A tag name
+            of None matches any tag.
+        :param chunks: An iterable of HTML text chunks, for example
+            response.iter_content(decode_unicode=True). Defaults to the HTML
+            passed to the decoder.
+        :param chunk_size: Chunk size used when slicing the decoder's HTML.
+        :return: A generator of StreamElement objects, in the order the
+            elements close.
+        """
+        from grabber.html_stream import PathStreamParser
+
+        if chunks is None:
+            if not self._html:
+                raise ValueError("HTML content is not provided")
+            chunks = (
+                self._html[start : start + chunk_size]
+                for start in range(0, len(self._html), chunk_size)
+            )
+
+        parser = PathStreamParser(matches, self)
+        for chunk in chunks:
+            parser.feed(chunk)
+            if parser.matched:
+                yield from parser.matched
+                parser.matched = []
+
+        parser.close()
+        yield from parser.matched
+
     def get_json(self) -> str:
         """
         Returns a JSON representation of the HTML structure.
@@ -199,3 +492,111 @@ class HtmlDecoder:
         """
         json_structure = self._generate_json()
         return json.dumps(json_structure, indent=2)
+
+    def _json_node(self, tag) -> dict:
+        """
+        The JSON representation of a rewritten tag, without its children and
+        without a second copy of the class inside "attributes".
+        """
+        return {
+            "tag": tag.name,
+            "class": tag.get("class", []),
+            "attributes": {k: v for k, v in tag.attrs.items() if k != "class"},
+        }
+
+    def _json_roots(self, soup, match: str = None) -> list:
+        """
+        The tags dump_json starts from: the top-level tags, or the outermost tags
+        whose synthetic class is match, in document order.
+        """
+        if match is None:
+            return soup.find_all(True, recursive=False)
+
+        roots = []
+        stack = list(reversed(soup.find_all(True, recursive=False)))
+        while stack:
+            tag = stack.pop()
+            if match in tag.get("class", ()):
+                roots.append(tag)
+                continue
+            stack.extend(reversed(tag.find_all(True, recursive=False)))
+
+        return roots
+
+    def dump_json(self, fp, ndjson: bool = False, match: str = None) -> int:
+        """
+        Writes the JSON representation of the HTML structure to a text file-like
+        object while walking the tree, without building it in memory first.
+
+        The output is compact and each node carries its class once. By default
+        it has the nested shape get_json returns; with ndjson=True every tag
+        is written on its own line as {"id", "parent", "tag", "class",
+        "attributes"}, ids following document order and parent being null for
+        the dumped roots.
+
+        :param fp: The sink, anything with a write(str) method.
+        :param ndjson: If True, writes one JSON object per line instead.
+        :param match: If given, only subtrees rooted at tags with this synthetic
+            class are written.
+        :return: The number of tags written.
+        """
+        if not self._html:
+            raise ValueError("HTML content is not provided")
+
+        soup = self._parse()
+        self._traverse_and_replace(soup)
+        roots = self._json_roots(soup, match)
+
+        if ndjson:
+            return self._dump_ndjson(fp, roots)
+        return self._dump_nested_json(fp, roots)
+
+    def _dump_nested_json(self, fp, roots: list) -> int:
+        count = 0
+        fp.write("[")
+
+        # Items are tags to open, separators to write, or None to close a tag.
+        stack = []
+        for index, root in enumerate(reversed(roots)):
+            if index:
+                stack.append(",")
+            stack.append(root)
+
+        while stack:
+            item = stack.pop()
+            if item is None:
+                fp.write("]}")
+                continue
+            if isinstance(item, str):
+                fp.write(item)
+                continue
+
+            fp.write(_encode_json(self._json_node(item))[:-1] + ',"children":[')
+            count += 1
+
+            stack.append(None)
+            for index, child in enumerate(reversed(item.find_all(True, recursive=False))):
+                if index:
+                    stack.append(",")
+                stack.append(child)
+
+        fp.write("]")
+        return count
+
+    def _dump_ndjson(self, fp, roots: list) -> int:
+        count = 0
+        stack = [(root, None) for root in reversed(roots)]
+        while stack:
+            tag, parent = stack.pop()
+
+            node = {"id": count, "parent": parent}
+            node.update(self._json_node(tag))
+            fp.write(_encode_json(node) + "\n")
+
+            stack.extend(
+                (child, count)
+                for child in reversed(tag.find_all(True, recursive=False))
+            )
+            count += 1
+
+        return count
@@ -0,0 +1,206 @@
+from html.parser import HTMLParser
+
+from bs4.builder import HTMLTreeBuilder
+
+from grabber.html_decoder import (
+    ClassPathTrie,
+    EMPTY_TAG_NAME_PATTERN,
+    PUNCTUATION_PATTERN,
+    WHITESPACE_PATTERN,
+    split_list_attributes,
+)
+
+
+VOID_TAGS = HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS
+
+
+class StreamElement:
+    """
+    An element matched by HtmlDecoder.iter_matches: its tag name, rewritten
+    attributes and text, with the get_text/text/attrs API of a Tag.
+    """
+
+    __slots__ = ("name", "attrs", "_strings")
+
+    def __init__(self, name: str, attrs: dict) -> None:
+        self.name = name
+        self.attrs = attrs
+        self._strings = []
+
+    @property
+    def text(self) -> str:
+        return self.get_text()
+
+    def get(self, key: str, default=None):
+        return self.attrs.get(key, default)
+
+    def __getitem__(self, key: str):
+        return self.attrs[key]
+
+    def get_text(self, separator: str = "", strip: bool = False) -> str:
+        strings = self._strings
+        if strip:
+            strings = [string.strip() for string in strings]
+            strings = [string for string in strings if string]
+        return separator.join(strings)
+
+
+class _OpenElement:
+    __slots__ = ("name", "path_id", "tentative", "element")
+
+    def __init__(self, name, path_id, tentative, element) -> None:
+        self.name = name
+        self.path_id = path_id
+        self.tentative = tentative
+        self.element = element
+
+
+class PathStreamParser(HTMLParser):
+    """
+    An incremental tokenizer that tracks the synthetic class path id of every
+    open element as a stack, without building a tree. Elements whose (tag, class)
+    is requested are collected in `matched` when they close.
+
+    Text is merged and normalized exactly as HtmlDecoder.get_soup does, so a
+    matched element's text equals the one found by find/find_all on the tree:
+    strings are joined across comments and removed subtrees, normalized, and
+    joined again across elements that turn out to be empty. An element stays
+    "tentative" until it is known not to be empty.
+    """
+
+    def __init__(self, matches, decoder) -> None:
+        super().__init__(convert_charrefs=True)
+        self.tag_map = decoder.tag_map
+        self.tags_to_remove = decoder.tags_to_remove
+        self.attributes_to_ignore = decoder.attributes_to_ignore
+        self.paths = decoder.paths
+
+        self.matches = {}
+        for name, class_name in matches:
+            self.matches.setdefault(class_name, set()).add(name)
+
+        self.matched = []
+        self._stack = []
+        self._captures = []
+        self._skip_stack = []
+        self._data = []
+        self._run = []
+
+    def _close_data(self) -> None:
+        if not self._data:
+            return
+
+        text = WHITESPACE_PATTERN.sub(" ", "".join(self._data))
+        self._data = []
+        if text == " ":
+            return
+
+        self._confirm_top()
+        self._run.append(PUNCTUATION_PATTERN.sub(r"\1", text))
+
+    def _flush_run(self) -> None:
+        if not self._run:
+            return
+
+        text = "".join(self._run)
+        self._run = []
+        for entry in self._captures:
+            entry.element._strings.append(text)
+
+    def _confirm_top(self) -> None:
+        if self._stack and self._stack[-1].tentative:
+            top = self._stack[-1]
+            self._flush_run()
+            top.tentative = False
+            if top.element is not None:
+                self._captures.append(top)
+
+    def _pop(self) -> None:
+        self._close_data()
+        entry = self._stack.pop()
+        if entry.tentative:
+            return
+
+        self._flush_run()
+        if entry.element is not None:
+            self._captures.pop()
+            self.matched.append(entry.element)
+
+    def handle_starttag(self, tag, attrs) -> None:
+        if self._skip_stack or tag in self.tags_to_remove:
+            if tag not in VOID_TAGS:
+                self._skip_stack.append(tag)
+            return
+
+        self._close_data()
+        self._confirm_top()
+
+        parent_id = self._stack[-1].path_id if self._stack else ClassPathTrie.ROOT
+        path_id = self.paths.intern(parent_id, self.tag_map.get(tag, "default"))
+        class_name = self.paths.class_name(path_id)
+
+        element = None
+        names = self.matches.get(class_name)
+        if names is not None and (None in names or tag in names):
+            attributes = {
+                key: "" if value is None else value
+                for key, value in attrs
+                if key not in self.attributes_to_ignore
+            }
+            attributes["class"] = class_name
+            element = StreamElement(tag, split_list_attributes(tag, attributes))
+
+        tentative = (
+            tag not in VOID_TAGS and EMPTY_TAG_NAME_PATTERN.fullmatch(tag) is not None
+        )
+        if not tentative:
+            self._flush_run()
+
+        entry = _OpenElement(tag, path_id, tentative, element)
+        self._stack.append(entry)
+        if not tentative and element is not None:
+            self._captures.append(entry)
+
+        if tag in VOID_TAGS:
+            self._pop()
+
+    def handle_startendtag(self, tag, attrs) -> None:
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag) -> None:
+        if self._skip_stack:
+            if tag in self._skip_stack:
+                while self._skip_stack.pop() != tag:
+                    pass
+                return
+            if not any(entry.name == tag for entry in self._stack):
+                return
+            self._skip_stack = []
+
+        for depth in range(len(self._stack) - 1, -1, -1):
+            if self._stack[depth].name == tag:
+                while len(self._stack) > depth:
+                    self._pop()
+                return
+
+    def handle_data(self, data) -> None:
+        if not self._skip_stack:
+            self._data.append(data)
+
+    def handle_decl(self, decl) -> None:
+        self._close_data()
+
+    def handle_pi(self, data) -> None:
+        self._close_data()
+
+    def unknown_decl(self, data) -> None:
+        self._close_data()
+
+    def close(self) -> None:
+        super().close()
+        self._skip_stack = []
+        while self._stack:
+            self._pop()
+        self._close_data()
@@ -0,0 +1,279 @@
+import json
+import os
+import random
+import threading
+import time
+
+
+# Statuses worth asking again for; 0 stands for a connection error or timeout.
+RETRYABLE_STATUSES = frozenset({0, 408, 425, 429, 500, 502, 503, 504})
+
+
+class RetryPolicy:
+    """
+    Bounded retries with full-jitter exponential backoff: attempt n waits a
+    random time between 0 and min(cap, base * 2 ** n), so clients that failed
+    together do not come back together. A Retry-After from the server wins
+    over the computed delay, up to max_retry_after.
+    """
+
+    def __init__(
+        self,
+        attempts: int = 4,
+        base: float = 1.0,
+        cap: float = 30.0,
+        max_retry_after: float = 120.0,
+        statuses=RETRYABLE_STATUSES,
+    ) -> None:
+        """
+        :param attempts: Tries per request, the first one included.
+        :param base: Backoff of the first retry, in seconds.
+        :param cap: Longest backoff, in seconds.
+        :param max_retry_after: Longest Retry-After honoured, in seconds.
+        :param statuses: Status codes that are retried.
+        """
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.max_retry_after = max_retry_after
+        self.statuses = statuses
+
+    def retryable(self, status_code: int) -> bool:
+        return status_code in self.statuses
+
+    def delay(self, attempt: int, retry_after: float = None) -> float:
+        """
+        :param attempt: The attempt that just failed, 0 for the first.
+        :param retry_after: The server's Retry-After, in seconds, if any.
+        :return: Seconds to wait before the next attempt.
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Stops sending to a host after failure_threshold failures in a row. While
+    open, requests fail at once instead of queueing up behind a dead server;
+    after reset_timeout one trial request is let through (half-open), and its
+    outcome closes the circuit again or reopens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 10, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        :return: True if a request may be sent now.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+
+            self.rejected += 1
+            return False
+
+    def retry_in(self) -> float:
+        """
+        :return: Seconds until an open circuit lets a trial request through.
+        """
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if success:
+                self.state = self.CLOSED
+                self.failures = 0
+                return
+
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """
+        Ends a request let through by allow() that has no outcome, as when it
+        was cancelled: a half-open circuit lets the next request be its trial
+        instead of waiting for this one forever.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_running = False
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+class Resilience:
+    """
+    The retry policy plus one circuit breaker per host, shared by the
+    HttpClient and the CrawlEngine of a process.
+    """
+
+    def __init__(self, policy: RetryPolicy = None, failure_threshold: int = 10,
+                 reset_timeout: float = 30.0) -> None:
+        self.policy = policy if policy is not None else RetryPolicy()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.retries = 0
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(
+                    self.failure_threshold, self.reset_timeout
+                )
+            return breaker
+
+    def retried(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def summary(self) -> str:
+        with self._lock:
+            breakers = dict(self._breakers)
+            retries = self.retries
+        lines = [f"Retries: {retries}"]
+        for host, breaker in breakers.items():
+            stats = breaker.as_dict()
+            lines.append(
+                f"{host}: circuit {stats['state']}, opened {stats['opened']} times, "
+                f"{stats['rejected']} requests rejected while open"
+            )
+        return "\n".join(lines)
+
+
+class DeadLetterQueue:
+    """
+    The URLs that still failed after every retry, with what each one is (a
+    listing, a search page, ...) so they can be re-driven on their own
+    instead of re-running the whole crawl. With a path, entries are appended
+    to a JSON lines file as they arrive and survive the process.
+    """
+
+    def __init__(self, path: str = None) -> None:
+        self.path = path
+        self.entries = []
+        self._lock = threading.Lock()
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def add(self, url: str, kind: str, status_code: int = 0, error: str = None, **context) -> None:
+        """
+        :param url: The URL as the crawler requests it.
+        :param kind: What the URL is, used to re-drive it.
+        :param status_code: The last status, 0 for a connection error.
+        :param error: The last exception, if any.
+        :param context: Anything else needed to re-drive it (a city, ...).
+        """
+        entry = {
+            "url": url,
+            "kind": kind,
+            "status_code": status_code,
+            "error": error,
+            "time": time.time(),
+        }
+        entry.update(context)
+
+        with self._lock:
+            self.entries.append(entry)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def take(self) -> list:
+        """
+        Returns every entry, in memory and on disk (deduplicated by kind and
+        URL), and empties the queue; entries that fail again are added back
+        by the re-drive. On disk the entries move to a ".redriving" file
+        until ack(): a re-drive killed before it saved its results leaves
+        them there, and the next take() returns them again.
+        """
+        with self._lock:
+            entries = list(self.entries)
+            if self.path:
+                taken = self.path + ".redriving"
+                if os.path.exists(self.path):
+                    # appended: those of a killed re-drive stay too
+                    with open(self.path, encoding="utf-8") as f:
+                        failed = f.read()
+                    with open(taken, "a", encoding="utf-8") as f:
+                        f.write(failed)
+                    os.remove(self.path)
+                if os.path.exists(taken):
+                    with open(taken, encoding="utf-8") as f:
+                        entries = [json.loads(line) for line in f if line.strip()]
+            self.entries = []
+
+        unique = {}
+        for entry in entries:
+            unique[(entry["kind"], entry["url"])] = entry
+        return list(unique.values())
+
+    def ack(self) -> None:
+        """
+        Drops the entries of the last take() for good, once their re-drive
+        has saved its results.
+        """
+        with self._lock:
+            if self.path and os.path.exists(self.path + ".redriving"):
+                os.remove(self.path + ".redriving")
+
+
+_shared_resilience = None
+_shared_lock = threading.Lock()
+
+
+def get_resilience() -> Resilience:
+    """
+    :return: The process-wide retry policy and circuit breakers.
+    """
+    global _shared_resilience
+    with _shared_lock:
+        if _shared_resilience is None:
+            _shared_resilience = Resilience()
+        return _shared_resilience
@@ -0,0 +1,151 @@
+import csv
+import json
+import os
+import queue
+import threading
+import time
+
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl"}
+
+# Tells the writer thread the sink is closed.
+_CLOSED = object()
+
+
+class ResultSink:
+    """
+    Writes records to a CSV or JSON lines file as they arrive instead of
+    holding them until the end of a crawl. Any thread or task may append;
+    a queue hands the records to one writer thread, which writes them in
+    batches of batch_size, or every flush_interval seconds however few
+    there are, and flushes the file after each batch. Memory stays flat
+    whatever the size of the crawl, and a crashed run leaves every record
+    up to its last flush behind.
+
+    The columns are the site's fixed schema, not the keys of the first
+    record: missing fields are left empty and unknown ones are dropped.
+    The file is only created with the first record.
+    """
+
+    def __init__(self, path: str, fields, batch_size: int = 100, flush_interval: float = 2.0,
+                 max_queued: int = 10_000) -> None:
+        """
+        :param path: The output file; ".jsonl" for JSON lines, CSV otherwise.
+        :param fields: The columns, in order.
+        :param batch_size: Records written at once.
+        :param flush_interval: Seconds after which queued records are
+            written, however few.
+        :param max_queued: Records waiting for the writer before append
+            blocks.
+        """
+        self.path = path
+        self.fields = tuple(fields)
+        self.format = FORMATS.get(os.path.splitext(path)[1], "csv")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.records = 0
+        self.written = 0
+        self.batches = 0
+        self._queue = queue.Queue(max_queued)
+        self._error = None
+        self._file = None
+        self._writer = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="result-sink", daemon=True)
+        self._thread.start()
+
+    def append(self, record: dict) -> None:
+        """Queues a record; the list-like name lets a sink replace a list."""
+        if self._error is not None:
+            raise self._error
+        if self._closed:
+            raise ValueError(f"{self.path} is closed")
+        if record:
+            self.records += 1
+            self._queue.put(record)
+
+    def extend(self, records) -> None:
+        for record in records:
+            self.append(record)
+
+    def __len__(self) -> int:
+        return self.records
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._file = open(self.path, "w", newline="", encoding="utf-8")
+        if self.format == "csv":
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fields, extrasaction="ignore")
+            self._writer.writeheader()
+
+    def _write(self, batch: list) -> None:
+        if self._file is None:
+            self._open()
+
+        if self.format == "csv":
+            self._writer.writerows(batch)
+        else:
+            self._file.writelines(
+                json.dumps({field: record.get(field) for field in self.fields},
+                           ensure_ascii=False, default=str) + "\n"
+                for record in batch
+            )
+        self._file.flush()
+        self.written += len(batch)
+        self.batches += 1
+
+    def _run(self) -> None:
+        batch = []
+        flushed_at = time.monotonic()
+        closed = False
+        while not closed:
+            timeout = max(0.0, flushed_at + self.flush_interval - time.monotonic())
+            try:
+                record = self._queue.get(timeout=timeout)
+                if record is _CLOSED:
+                    closed = True
+                else:
+                    batch.append(record)
+            except queue.Empty:
+                pass
+
+            if batch and (
+                closed
+                or len(batch) >= self.batch_size
+                or time.monotonic() - flushed_at >= self.flush_interval
+            ):
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    # raised in the crawl by the next append or close
+                    self._error = e
+                batch = []
+            if not batch:
+                flushed_at = time.monotonic()
+
+        if self._file is not None:
+            self._file.close()
+
+    def close(self) -> None:
+        """Writes what is queued and closes the file."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_CLOSED)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self) -> "ResultSink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def summary(self) -> str:
+        if not self.written:
+            return f"No records for {self.path}"
+        return f"{self.written} records written to {self.path} in {self.batches} batches"
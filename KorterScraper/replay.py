@@ -0,0 +1,11 @@
+import sys
+
+from grabber.Korter import Korter
+
+# Re-extracts every listing kept by `python3 run_export.py --archive`, with
+# the current extraction plans and no network:
+#
+#     python3 replay.py [archive directory or files]
+if __name__ == "__main__":
+    korter = Korter()
+    korter.replay(sys.argv[1:] or "archive")
@@ -1,7 +1,32 @@
+import sys
+
 from grabber.Korter import Korter
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from grabber.page_cache import PageCache
+from grabber.http_cache import HttpCache
+from grabber.resilience import DeadLetterQueue
+from grabber.listing_index import ListingIndex
+from grabber.crawl_frontier import CrawlFrontier
+from grabber.response_archive import ResponseArchive
 
-korter = Korter()
+# unchanged pages are revalidated instead of downloaded again, and their
+# extraction results come from the page cache; listings already in the index
+# are not fetched again, except for a 10% refresh sample
+korter = Korter(
+    cache=PageCache(path="cache/pages.sqlite"),
+    http_cache=HttpCache("cache/http.sqlite"),
+    dead_letters=DeadLetterQueue("cache/dead-letters.jsonl"),
+    index=ListingIndex("cache/listings.sqlite", refresh=0.1),
+    # a killed run resumes where it stopped, skipping the cities it saved
+    frontier=CrawlFrontier("cache/frontier.sqlite"),
+    # with --archive every response is kept for replay.py
+    archive=(
+        ResponseArchive("archive", prefix="korter")
+        if "--archive" in sys.argv[1:]
+        else None
+    ),
+    # records are written as they arrive, as JSON lines with --jsonl
+    output_format="jsonl" if "--jsonl" in sys.argv[1:] else "csv",
+)
 
 urls = {
     "bucurești": "https://korter.ro/vanzare-apartamente-bucure%C8%99ti",
@@ -40,17 +65,10 @@ urls = {
     "voluntari": "https://korter.ro/vanzare-apartamente-voluntari",
 }
 
-if urls:
-    # will not work
-    # the server cannot handle these many requests
-    # with ThreadPoolExecutor(max_workers=2) as executor:
-    #     futures = {
-    #         executor.submit(korter.process_listings, page_url, base_name): (page_url, base_name)
-    #         for base_name,page_url in urls.items()
-    #     }
-
-    #     for future in as_completed(futures):
-    #         future.result()
-
-    for base_name, url in urls.items():
-        korter.process_listings(base_name=base_name, base_url=url)
+if "--redrive" in sys.argv[1:]:
+    # only the pages that failed after every retry in earlier runs
+    korter.redrive()
+elif urls:
+    # all cities run at once; korter.ro's adaptive rate limiter, shared by
+    # every request, keeps the total rate at what the server tolerates
+    korter.process_cities(urls)
@@ -1,6 +1,13 @@
 from grabber.SkiaOneScraper import SkiaOneScrapper
+from grabber.http_client import configure
+from grabber.page_cache import PageCache
+from grabber.http_cache import HttpCache
+from grabber.resilience import DeadLetterQueue
+from grabber.crawl_frontier import CrawlFrontier
+from grabber.response_archive import ResponseArchive
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import csv
+import sys
 import time
 
 filters = {
@@ -16,22 +23,69 @@ def fetch_page_data(scraper, filters, page):
 
 
 def run_scraper():
-    scraper = SkiaOneScrapper()
-    all_properties = []
     max_workers = 16
-    last_page = scraper.grab_last_page(filters)
-    max_page = last_page if last_page else 10
+    # one pooled connection per worker thread; unchanged pages are
+    # revalidated instead of downloaded again and parsed from the page cache
+    scraper = SkiaOneScrapper(
+        client=configure(
+            pool_size=max_workers,
+            http_cache=HttpCache("cache/http.sqlite"),
+            # with --archive every response is kept for --replay
+            archive=(
+                ResponseArchive("archive", prefix="skiaone-filtered")
+                if "--archive" in sys.argv[1:]
+                else None
+            ),
+        ),
+        cache=PageCache(path="cache/pages.sqlite"),
+        dead_letters=DeadLetterQueue("cache/dead-letters.jsonl"),
+    )
+    frontier = None
+    all_properties = []
+
+    if "--redrive" in sys.argv[1:]:
+        # only the pages that failed after every retry in earlier runs
+        all_properties = scraper.redrive()
+    elif "--replay" in sys.argv[1:]:
+        # the archived pages parsed again, without network
+        all_properties = scraper.replay("archive")
+    else:
+        # a killed run resumes where it stopped: pages done are not fetched again
+        frontier = CrawlFrontier("cache/frontier-filtered.sqlite")
+        last_page = scraper.grab_last_page(filters)
+        max_page = last_page if last_page else 10
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(fetch_page_data, scraper, filters, page)
-            for page in range(0, max_page)
+        frontier.add([str(page) for page in range(0, max_page)], "page")
+        pages = [int(page) for page in frontier.pending(kind="page")]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(fetch_page_data, scraper, filters, page): page
+                for page in pages
+            }
+            for future in as_completed(futures):
+                try:
+                    frontier.done(str(futures[future]), future.result())
+                except Exception as e:
+                    print(f"Error fetching data: {e}")
+
+        # this run's pages and those done before an interruption
+        all_properties = [
+            property_data for page in frontier.records() for property_data in page
         ]
-        for future in as_completed(futures):
-            try:
-                all_properties.extend(future.result())
-            except Exception as e:
-                print(f"Error fetching data: {e}")
+
+    if len(scraper.dead_letters):
+        print(
+            f"{len(scraper.dead_letters)} pages failed after retries; "
+            "run with --redrive to fetch only those."
+        )
+    if not all_properties:
+        print("No properties found")
+        if frontier is not None:
+            frontier.clear()
+        if "--redrive" in sys.argv[1:]:
+            scraper.dead_letters.ack()
+        return
 
     csv_file = "exported/filtered_properties_" + str(int(time.time())) + ".csv"
 
@@ -48,6 +102,16 @@ def run_scraper():
             writer.writerow(row)
 
     print(f"Data collection complete and saved to {csv_file}")
+    if frontier is not None:
+        # saved; the next run starts from scratch
+        frontier.clear()
+    if "--redrive" in sys.argv[1:]:
+        # saved; the dead letters re-driven are not needed any more
+        scraper.dead_letters.ack()
+    print(scraper.client.summary())
+    print(scraper.client.http_cache.summary())
+    print(scraper.cache.summary())
 
 
-run_scraper()
+if __name__ == "__main__":
+    run_scraper()
@@ -1,7 +1,12 @@
 from bs4 import BeautifulSoup
-import requests
 import logging
 import json
+import requests
+from grabber.page_cache import PageCache, source_fingerprint
+from grabber.http_client import HttpClient, get_client
+from grabber.resilience import DeadLetterQueue, get_resilience
+from grabber.response_archive import ArchivedResponse, replay as replay_archive
+from functools import partial
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -13,100 +18,190 @@ def build_query_string(query: dict) -> str:
         return f"?{query_string}"
     return ""
 
+LABEL_MAP = {
+    "Etaj:": "floor",
+    "Suprafață:": "area",
+    "Dormitoare:": "bedrooms",
+    "Terasă:": "terrace",
+    "Parcare:": "parking",
+    "Preț:": "price",
+    "Preț cu TVA:": "price_with_vat",
+    "Disponibilitate:": "availability",
+    "Proiect:": "project",
+    "Fază:": "phase",
+    "Etaje clădire:": "building_floors",
+    "Tip imobil:": "building_type",
+    "Clasă energetică:": "energy_class",
+    "Structură clădire:": "building_structure",
+    "Starea clădirii:": "building_status",
+    "Termen finalizare:": "completion_date",
+    "Sector:": "sector",
+    "Cartier:": "neighborhood",
+}
+
+def empty_property_details() -> dict:
+    return {key: "N/A" for key in LABEL_MAP.values()}
+
+def parse_property_details(content, parser: str = "html.parser") -> dict:
+    metadata = empty_property_details()
+
+    soup = BeautifulSoup(content, parser)
+    details_container = soup.find(
+        "div", class_="row no-gutters property-details"
+    )
+
+    if details_container:
+        details = details_container.find_all(
+            "div", class_="col-6 col-lg-4 col-xl-3"
+        )
+
+        for detail in details:
+            field_label = detail.find(
+                "div", class_="property-details-field"
+            ).text.strip()
+            field_value_tag = detail.find(
+                "div", class_="property-details-value"
+            )
+
+            field_value = (
+                field_value_tag.text.strip().replace("\xa0", " ")
+                if field_value_tag
+                else "N/A"
+            )
+
+            field_key = LABEL_MAP.get(field_label)
+            if field_key:
+                metadata[field_key] = field_value
+
+    return metadata
+
+def parse_property_cards(content, parser: str = "html.parser") -> list:
+    soup = BeautifulSoup(content, parser)
+
+    property_container = soup.find(
+        "div", class_="row no-gutters my-3 properties-row"
+    )
+    if not property_container:
+        logging.error("No properties found")
+        return []
+
+    property_column_container = property_container.find_all(
+        "div", class_="property-col"
+    )
+    if not property_column_container:
+        logging.error("No property col container found")
+
+    property_list = []
+    for col in property_container:
+        property_card = col.find("div", class_="property-card")
+
+        title_tag = property_card.find("h3", class_="property-card-title")
+        title = title_tag.text.strip() if title_tag else "N/A"
+
+        price_tag = property_card.find("div", class_="pricing-btn")
+        price = (
+            price_tag.text.strip().replace("\xa0", " ") if price_tag else "N/A"
+        )
+
+        bedroom_tag = property_card.find("div", class_="bedroom-icon")
+        bedrooms = bedroom_tag.text.strip() if bedroom_tag else "N/A"
+
+        area_tag = property_card.find("div", class_="area-icon")
+        area = area_tag.text.strip() if area_tag else "N/A"
+
+        floor_tag = property_card.find("div", class_="floor-icon")
+        floor = floor_tag.text.strip() if floor_tag else "N/A"
+
+        link_tag = property_card.find("a", href=True)
+        link = link_tag["href"] if link_tag else "N/A"
+
+        property_list.append(
+            {
+                "title": title,
+                "price": price,
+                "bedrooms": bedrooms,
+                "area": area,
+                "floor": floor,
+                "link": link,
+            }
+        )
+
+    return property_list
+
+def replay_property_page(response: ArchivedResponse, parser: str = "html.parser"):
+    """
+    Parses an archived result or details page in a replay worker.
+
+    :return: ("cards", url, cards) for result pages, ("details", url, details)
+        for details pages, or None for failed responses.
+    """
+    if response.status_code != 200:
+        return None
+    if "/proprietati" in response.url:
+        return "cards", response.url, parse_property_cards(response.content, parser)
+    return "details", response.url, parse_property_details(response.content, parser)
+
 class SkiaOneScrapper:
-    def __init__(self, locale: str = "ro") -> None:
-        self.__main_url = "https://skia.one.ro"
+    def __init__(self, locale: str = "ro", parser: str = "html.parser", cache: PageCache = None, client: HttpClient = None,
+                 dead_letters: DeadLetterQueue = None, main_url: str = "https://skia.one.ro") -> None:
+        # a stand-in server's address in load tests (see benchmarks/standin_server.py)
+        self.__main_url = main_url
+        self.parser = parser
+        # byte-identical detail pages are only parsed once;
+        # pass PageCache(path=...) to keep the results between runs
+        self.cache = cache if cache is not None else PageCache()
+        # keep-alive connections shared with every other scraper in the process
+        self.client = client if client is not None else get_client()
+        # pages that still failed after every retry; pass
+        # DeadLetterQueue(path) to re-drive them later with redrive()
+        self.dead_letters = dead_letters if dead_letters is not None else DeadLetterQueue()
 
         self.__filter_properties_url = (
             self.__main_url + "/" + locale + "/" + "proprietati"
         )
 
-    def __fetch_property_data(self, request_url: str) -> dict:
+    def __get(self, request_url: str, kind: str, **context) -> requests.Response:
+        """
+        GETs a page; if it fails for a reason that may pass (429, 5xx,
+        connection errors) after the client's retries, it is dead-lettered
+        with the context needed to re-drive it and None is returned.
+        """
+        try:
+            response = self.client.get(request_url)
+        except requests.RequestException as e:
+            logging.error(f"Failed to fetch {request_url}: {e}")
+            self.dead_letters.add(request_url, kind, error=f"{type(e).__name__}: {e}", **context)
+            return None
+
+        if response.status_code != 200 and get_resilience().policy.retryable(response.status_code):
+            self.dead_letters.add(request_url, kind, response.status_code, **context)
+        return response
+
+    def __fetch_property_data(self, request_url: str, title: str = "N/A") -> dict:
         logging.info(f"Fetching property data for: {request_url}")
 
-        metadata = {
-            "floor": "N/A",
-            "area": "N/A",
-            "bedrooms": "N/A",
-            "terrace": "N/A",
-            "parking": "N/A",
-            "price": "N/A",
-            "price_with_vat": "N/A",
-            "availability": "N/A",
-            "project": "N/A",
-            "phase": "N/A",
-            "building_floors": "N/A",
-            "building_type": "N/A",
-            "energy_class": "N/A",
-            "building_structure": "N/A",
-            "building_status": "N/A",
-            "completion_date": "N/A",
-            "sector": "N/A",
-            "neighborhood": "N/A",
-        }
-
-        response = requests.get(request_url)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content, "html.parser")
-            details_container = soup.find(
-                "div", class_="row no-gutters property-details"
+        response = self.__get(request_url, "details", title=title)
+        if response is not None and response.status_code == 200:
+            key = self.cache.key(
+                response.content, "property-details", self.parser, source_fingerprint(parse_property_details)
             )
+            details = self.cache.get_or_compute(
+                key, lambda: parse_property_details(response.content, self.parser)
+            )
+            return dict(details)
 
-            if details_container:
-                details = details_container.find_all(
-                    "div", class_="col-6 col-lg-4 col-xl-3"
-                )
-
-                for detail in details:
-                    field_label = detail.find(
-                        "div", class_="property-details-field"
-                    ).text.strip()
-                    field_value_tag = detail.find(
-                        "div", class_="property-details-value"
-                    )
-
-                    field_value = (
-                        field_value_tag.text.strip().replace("\xa0", " ")
-                        if field_value_tag
-                        else "N/A"
-                    )
-                    label_map = {
-                        "Etaj:": "floor",
-                        "Suprafață:": "area",
-                        "Dormitoare:": "bedrooms",
-                        "Terasă:": "terrace",
-                        "Parcare:": "parking",
-                        "Preț:": "price",
-                        "Preț cu TVA:": "price_with_vat",
-                        "Disponibilitate:": "availability",
-                        "Proiect:": "project",
-                        "Fază:": "phase",
-                        "Etaje clădire:": "building_floors",
-                        "Tip imobil:": "building_type",
-                        "Clasă energetică:": "energy_class",
-                        "Structură clădire:": "building_structure",
-                        "Starea clădirii:": "building_status",
-                        "Termen finalizare:": "completion_date",
-                        "Sector:": "sector",
-                        "Cartier:": "neighborhood",
-                    }
-
-                    field_key = label_map.get(field_label)
-                    if field_key:
-                        metadata[field_key] = field_value
-
-        return metadata
+        return empty_property_details()
 
     def grab_last_page(self, filters: dict) -> int:
         last_page = 0
 
         request_url = self.__filter_properties_url + build_query_string(filters)
-        response = requests.get(request_url)
+        response = self.client.get(request_url)
 
         if response.status_code == 200:
             logging.info("Grabbing last page number")
 
-            soup = BeautifulSoup(response.content, "html.parser")
+            soup = BeautifulSoup(response.content, self.parser)
             pagination_nav = soup.find("nav", class_="pagination-container")
 
             if pagination_nav:
@@ -126,64 +221,84 @@ class SkiaOneScrapper:
             filters["page"] = page
 
         request_url = self.__filter_properties_url + build_query_string(filters)
-        response = requests.get(request_url)
+        response = self.__get(request_url, "page", filters=dict(filters), page=page)
+        if response is None:
+            return []
 
         if response.status_code == 200:
             logging.info(f"Grabbing properties for page: {page}")
-            soup = BeautifulSoup(response.content, "html.parser")
 
-            property_container = soup.find(
-                "div", class_="row no-gutters my-3 properties-row"
-            )
-            if not property_container:
-                logging.error("No properties found")
-                return []
-
-            property_column_container = property_container.find_all(
-                "div", class_="property-col"
-            )
-            if not property_column_container:
-                logging.error("No property col container found")
-
-            property_list = []
-            for col in property_container:
-                property_card = col.find("div", class_="property-card")
-
-                title_tag = property_card.find("h3", class_="property-card-title")
-                title = title_tag.text.strip() if title_tag else "N/A"
-
-                price_tag = property_card.find("div", class_="pricing-btn")
-                price = (
-                    price_tag.text.strip().replace("\xa0", " ") if price_tag else "N/A"
+            property_list = parse_property_cards(response.content, self.parser)
+            for property_data in property_list:
+                logging.info(
+                    f"Processing: {property_data['title']} with URL: {property_data['link']}"
+                )
+                property_data["details"] = self.__fetch_property_data(
+                    property_data["link"], property_data["title"]
                 )
 
-                bedroom_tag = property_card.find("div", class_="bedroom-icon")
-                bedrooms = bedroom_tag.text.strip() if bedroom_tag else "N/A"
-
-                area_tag = property_card.find("div", class_="area-icon")
-                area = area_tag.text.strip() if area_tag else "N/A"
-
-                floor_tag = property_card.find("div", class_="floor-icon")
-                floor = floor_tag.text.strip() if floor_tag else "N/A"
-
-                link_tag = property_card.find("a", href=True)
-                link = link_tag["href"] if link_tag else "N/A"
-
-                logging.info(f"Processing: {title} with URL: {link}")
+            return property_list
+        else:
+            logging.error(f"failed to retrieve properties: {response.status_code}")
+            return []
 
+    def redrive(self) -> list:
+        """
+        Fetches only the dead-lettered pages of earlier runs: result pages
+        are scraped again, and properties whose details failed get them now.
+        Pages that fail again are dead-lettered again; the caller acks the
+        dead letters once the properties are saved.
+
+        :return: The properties, as filtered_properties returns them.
+        """
+        entries = self.dead_letters.take()
+        logging.info(f"Re-driving {len(entries)} failed pages")
+
+        property_list = []
+        for entry in entries:
+            if entry["kind"] == "page":
+                property_list.extend(
+                    self.filtered_properties(entry["filters"], entry["page"])
+                )
+            else:
                 property_list.append(
                     {
-                        "title": title,
-                        "price": price,
-                        "bedrooms": bedrooms,
-                        "area": area,
-                        "floor": floor,
-                        "link": link,
-                        "details": self.__fetch_property_data(link),
+                        "title": entry["title"],
+                        "link": entry["url"],
+                        "details": self.__fetch_property_data(entry["url"], entry["title"]),
                     }
                 )
 
-            return property_list
-        else:
-            logging.error(f"failed to retrieve properties: {response.status_code}")
-            return []
+        return property_list
+
+    def replay(self, path, workers: int = None) -> list:
+        """
+        Parses archived result and details pages instead of the site, in one
+        process per CPU, and joins them as filtered_properties does. The
+        latest response of a page archived more than once wins.
+
+        :param path: An archive file, a directory of them, or a list of either.
+        :param workers: Worker processes, one per CPU by default.
+        :return: The properties, as filtered_properties returns them.
+        """
+        cards = {}
+        details = {}
+        for item in replay_archive(
+            path, partial(replay_property_page, parser=self.parser), workers
+        ):
+            if item is None:
+                continue
+            kind, url, parsed = item
+            if kind == "cards":
+                for card in parsed:
+                    cards[card["link"]] = card
+            else:
+                details[url] = parsed
+
+        property_list = []
+        for link, card in cards.items():
+            card["details"] = details.get(link, empty_property_details())
+            property_list.append(card)
+
+        logging.info(f"Replayed {len(property_list)} properties")
+        return property_list
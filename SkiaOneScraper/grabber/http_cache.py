@@ -0,0 +1,243 @@
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+CHARSET_PATTERN = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+
+# Response headers kept with a cached page. The body is stored decoded, so
+# Content-Encoding and Content-Length must not come back with it.
+STORED_HEADERS = ("content-type", "etag", "last-modified", "cache-control", "expires", "date")
+
+
+class CachedPage:
+    """A page stored in the HttpCache."""
+
+    __slots__ = ("url", "headers", "body", "etag", "last_modified", "expires_at")
+
+    def __init__(self, url, headers, body, etag, last_modified, expires_at) -> None:
+        self.url = url
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self) -> bool:
+        return self.expires_at > time.time()
+
+    @property
+    def encoding(self) -> str:
+        match = CHARSET_PATTERN.search(self.headers.get("content-type", ""))
+        return match.group(1) if match else None
+
+    def validators(self) -> dict:
+        """
+        :return: The headers that turn a GET for this page into a conditional
+            one, answered with 304 Not Modified if it has not changed.
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class SiteStats:
+    __slots__ = ("fresh", "revalidated", "modified", "misses", "bytes_saved")
+
+    def __init__(self) -> None:
+        self.fresh = 0
+        self.revalidated = 0
+        self.modified = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def as_dict(self) -> dict:
+        lookups = self.fresh + self.revalidated + self.modified + self.misses
+        hits = self.fresh + self.revalidated
+        return {
+            "fresh": self.fresh,
+            "revalidated": self.revalidated,
+            "modified": self.modified,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+class HttpCache:
+    """
+    A persistent HTTP cache keyed by URL, in one SQLite file. Pages are served
+    without a request while they are fresh (Cache-Control max-age, Expires,
+    or default_ttl when the site sends neither). Once stale, they are
+    revalidated with a conditional GET; a 304 costs a few hundred bytes
+    instead of the page, and the stored body - identical to the last run's -
+    is handed back, so a PageCache with a path reuses last run's extraction.
+
+    Only successful GETs without Cache-Control no-store are stored. Safe to
+    share between threads.
+    """
+
+    def __init__(self, path: str, default_ttl: float = 0) -> None:
+        """
+        :param path: The SQLite file.
+        :param default_ttl: Seconds a page without freshness headers is served
+            without revalidation; 0 revalidates it on every run.
+        """
+        self.path = path
+        self.default_ttl = default_ttl
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, headers TEXT, body BLOB, etag TEXT, "
+            "last_modified TEXT, expires_at REAL, stored_at REAL)"
+        )
+        self._db.commit()
+        self._sites = {}
+
+    def _site(self, url: str) -> SiteStats:
+        host = urlsplit(url).netloc
+        stats = self._sites.get(host)
+        if stats is None:
+            stats = self._sites[host] = SiteStats()
+        return stats
+
+    def _expires_at(self, headers: dict) -> float:
+        now = time.time()
+        cache_control = (headers.get("cache-control") or "").lower()
+        if "no-cache" in cache_control:
+            return now
+
+        match = MAX_AGE_PATTERN.search(cache_control)
+        if match:
+            return now + int(match.group(1))
+
+        expires = headers.get("expires")
+        if expires:
+            try:
+                return parsedate_to_datetime(expires).timestamp()
+            except (TypeError, ValueError):
+                return now
+
+        return now + self.default_ttl
+
+    def lookup(self, url: str) -> CachedPage:
+        """
+        :param url: The page URL.
+        :return: The stored page, fresh or not, or None.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT headers, body, etag, last_modified, expires_at "
+                "FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+
+            if row is None:
+                self._site(url).misses += 1
+                return None
+
+            page = CachedPage(
+                url, json.loads(row[0]), zlib.decompress(row[1]), row[2], row[3], row[4]
+            )
+            if page.fresh:
+                stats = self._site(url)
+                stats.fresh += 1
+                stats.bytes_saved += len(page.body)
+            return page
+
+    def store(self, url: str, headers, body: bytes) -> None:
+        """
+        Stores a 200 response, replacing the previous one. When a stale page
+        comes back changed this counts as "modified" for the site.
+
+        :param url: The requested URL.
+        :param headers: The response headers (any case-insensitive mapping).
+        :param body: The decoded body.
+        """
+        kept = {name: headers[name] for name in STORED_HEADERS if headers.get(name)}
+        if "no-store" in kept.get("cache-control", "").lower():
+            return
+
+        row = (
+            url,
+            json.dumps(kept),
+            zlib.compress(body),
+            kept.get("etag"),
+            kept.get("last-modified"),
+            self._expires_at(kept),
+            time.time(),
+        )
+        with self._lock:
+            replaced = self._db.execute(
+                "SELECT 1 FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if replaced:
+                self._site(url).modified += 1
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)", row
+            )
+            self._db.commit()
+
+    def revalidated(self, page: CachedPage, headers) -> CachedPage:
+        """
+        Records a 304 for a stored page: its freshness restarts from the new
+        response's headers.
+
+        :param page: The page returned by lookup.
+        :param headers: The 304 response headers.
+        :return: The page, fresh again.
+        """
+        merged = dict(page.headers)
+        merged.update({name: headers[name] for name in STORED_HEADERS if headers.get(name)})
+        page.headers = merged
+        page.expires_at = self._expires_at(merged)
+
+        with self._lock:
+            stats = self._site(page.url)
+            stats.revalidated += 1
+            stats.bytes_saved += len(page.body)
+            self._db.execute(
+                "UPDATE responses SET headers = ?, expires_at = ?, stored_at = ? WHERE url = ?",
+                (json.dumps(merged), page.expires_at, time.time(), page.url),
+            )
+            self._db.commit()
+        return page
+
+    def stats(self) -> dict:
+        """
+        :return: Host to fresh hits, 304 revalidations, modified pages, misses,
+            hit ratio and bytes not downloaded.
+        """
+        with self._lock:
+            return {host: stats.as_dict() for host, stats in self._sites.items()}
+
+    def summary(self) -> str:
+        return "\n".join(
+            f"HTTP cache {host}: {stats['hit_ratio']:.0%} hit ratio "
+            f"({stats['fresh']} fresh, {stats['revalidated']} not modified, "
+            f"{stats['modified']} modified, {stats['misses']} new), "
+            f"{stats['bytes_saved'] / 1_000_000:.1f} MB not downloaded"
+            for host, stats in self.stats().items()
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
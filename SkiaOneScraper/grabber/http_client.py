@@ -0,0 +1,324 @@
+from urllib.parse import urlsplit
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from grabber.header_profiles import HeaderProfilePool, get_profiles
+from grabber.http_cache import CachedPage, HttpCache
+from grabber.rate_limiter import RateLimiter, get_limiter, parse_retry_after
+from grabber.resilience import Resilience, get_resilience
+from grabber.response_archive import ResponseArchive
+
+
+DEFAULT_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+}
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (10, 30)
+
+# exceptions worth retrying, as opposed to e.g. an invalid URL
+TRANSIENT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of sending to a host whose circuit is open."""
+
+
+class HostStats:
+    """Request counters of one host, updated under HttpClient's lock."""
+
+    __slots__ = ("requests", "errors", "retries", "in_flight", "peak_in_flight", "saturated", "seconds")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        # requests that started while every pooled connection was busy,
+        # i.e. that had to wait for one
+        self.saturated = 0
+        self.seconds = 0.0
+
+    def as_dict(self, pool_size: int) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "pool_size": pool_size,
+            "saturated": self.saturated,
+            "avg_ms": self.seconds / self.requests * 1000 if self.requests else 0.0,
+        }
+
+
+def cached_response(page: CachedPage) -> requests.Response:
+    """A requests.Response for a page served by the HttpCache."""
+    response = requests.Response()
+    response.status_code = 200
+    response.url = page.url
+    response.headers = CaseInsensitiveDict(page.headers)
+    response.encoding = page.encoding or requests.utils.get_encoding_from_headers(
+        response.headers
+    )
+    response._content = page.body
+    return response
+
+
+class HttpClient:
+    """
+    One requests.Session shared by every scraper thread. Connections are kept
+    alive in a pool per host, so the thousands of detail requests of a run
+    reuse a handful of TCP/TLS connections instead of opening one each.
+    Every request carries a browser header profile from a HeaderProfilePool,
+    under the headers the caller passes, and waits for its host's RateLimiter.
+    Connection errors, 429s and 5xx are retried with backoff; what still
+    fails is returned (or raised) as before, for the caller to dead-letter.
+
+    The pools block when all their connections are busy: a thread waits for a
+    connection to come back rather than opening a throwaway one. Size them to
+    the number of threads that hit the same host at once.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 24,
+        hosts: int = 10,
+        headers: dict = None,
+        timeout=DEFAULT_TIMEOUT,
+        profiles: HeaderProfilePool = None,
+        limiter: RateLimiter = None,
+        http_cache: HttpCache = None,
+        resilience: Resilience = None,
+        archive: ResponseArchive = None,
+    ) -> None:
+        """
+        :param pool_size: Connections kept per host.
+        :param hosts: Number of hosts whose pools are kept.
+        :param headers: Sent with every request, on top of DEFAULT_HEADERS.
+        :param timeout: Default requests timeout, seconds or (connect, read).
+        :param profiles: Browser header profiles, the process-wide pool by
+            default.
+        :param limiter: Per-host request rates, the process-wide limiter by
+            default.
+        :param http_cache: If given, GETs are served from it while fresh and
+            revalidated with conditional requests once stale.
+        :param resilience: Retry policy and per-host circuit breakers, the
+            process-wide ones by default.
+        :param archive: If given, every GET response (cached ones included)
+            is appended to it, for offline re-extraction with replay().
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.profiles = profiles if profiles is not None else get_profiles()
+        self.limiter = limiter if limiter is not None else get_limiter()
+        self.http_cache = http_cache
+        self.resilience = resilience if resilience is not None else get_resilience()
+        self.archive = archive
+
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        if headers:
+            self.session.headers.update(headers)
+
+        adapter = HTTPAdapter(
+            pool_connections=hosts, pool_maxsize=pool_size, pool_block=True
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _start(self, host: str) -> HostStats:
+        with self._lock:
+            stats = self._hosts.get(host)
+            if stats is None:
+                stats = self._hosts[host] = HostStats()
+            if stats.in_flight >= self.pool_size:
+                stats.saturated += 1
+            stats.requests += 1
+            stats.in_flight += 1
+            stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+            return stats
+
+    def _finish(self, stats: HostStats, started: float, failed: bool) -> None:
+        with self._lock:
+            stats.in_flight -= 1
+            stats.seconds += time.perf_counter() - started
+            if failed:
+                stats.errors += 1
+
+    def _retried(self, host: str) -> None:
+        with self._lock:
+            stats = self._hosts.get(host)
+            if stats is not None:
+                stats.retries += 1
+        self.resilience.retried()
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Same arguments as requests.request; the session's headers, a header
+        profile and the headers given are merged, in that order, and the
+        default timeout applies unless one is set.
+        """
+        if method != "GET":
+            return self._send(method, url, **kwargs)
+
+        response = self._get(url, **kwargs)
+        if self.archive is not None:
+            self.archive.write(url, response.status_code, response.headers, response.content)
+        return response
+
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        if self.http_cache is None:
+            return self._send("GET", url, **kwargs)
+
+        page = self.http_cache.lookup(url)
+        if page is not None and page.fresh:
+            return cached_response(page)
+
+        if page is not None:
+            headers = CaseInsensitiveDict(kwargs.get("headers") or {})
+            headers.update(page.validators())
+            kwargs["headers"] = headers
+
+        response = self._send("GET", url, **kwargs)
+        if response.status_code == 304 and page is not None:
+            return cached_response(self.http_cache.revalidated(page, response.headers))
+        if response.status_code == 200:
+            self.http_cache.store(url, response.headers, response.content)
+        return response
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+
+        host = urlsplit(url).netloc
+        headers = CaseInsensitiveDict(self.profiles.for_host(host))
+        headers.update(kwargs.get("headers") or {})
+        kwargs["headers"] = headers
+
+        policy = self.resilience.policy
+        breaker = self.resilience.breaker(host)
+        last = policy.attempts - 1
+
+        for attempt in range(policy.attempts):
+            retry_after = None
+            if not breaker.allow():
+                if attempt == last:
+                    raise CircuitOpenError(f"circuit open for {host}")
+            else:
+                try:
+                    response = self._send_once(host, method, url, **kwargs)
+                except TRANSIENT_ERRORS:
+                    breaker.record(False)
+                    if attempt == last:
+                        raise
+                except Exception:
+                    # not worth a retry, but an outcome all the same; a
+                    # half-open circuit must not wait for it forever
+                    breaker.record(False)
+                    raise
+                except BaseException:
+                    breaker.release()
+                    raise
+                else:
+                    retryable = policy.retryable(response.status_code)
+                    breaker.record(not retryable)
+                    if not retryable or attempt == last:
+                        return response
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    response.close()
+
+            self._retried(host)
+            time.sleep(max(policy.delay(attempt, retry_after), breaker.retry_in()))
+
+    def _send_once(self, host: str, method: str, url: str, **kwargs) -> requests.Response:
+        self.limiter.acquire(host)
+
+        stats = self._start(host)
+        started = time.perf_counter()
+        status_code = 0
+        retry_after = None
+        try:
+            response = self.session.request(method, url, **kwargs)
+            status_code = response.status_code
+            if status_code == 429 or status_code == 503:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            return response
+        finally:
+            self._finish(stats, started, status_code == 0 or status_code >= 500)
+            self.limiter.record(
+                host, status_code, time.perf_counter() - started, retry_after
+            )
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def stats(self) -> dict:
+        """
+        :return: Host to its counters: requests, errors (exceptions and 5xx),
+            in_flight, peak_in_flight, pool_size, saturated and avg_ms.
+        """
+        with self._lock:
+            return {
+                host: stats.as_dict(self.pool_size)
+                for host, stats in self._hosts.items()
+            }
+
+    def summary(self) -> str:
+        lines = []
+        for host, stats in self.stats().items():
+            lines.append(
+                f"{host}: {stats['requests']} requests, {stats['errors']} errors, "
+                f"{stats['retries']} retries, "
+                f"peak {stats['peak_in_flight']}/{stats['pool_size']} connections, "
+                f"{stats['saturated']} waited for a connection, "
+                f"{stats['avg_ms']:.0f} ms average"
+            )
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """
+    :return: The process-wide client, created with the defaults on first use.
+    """
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = HttpClient()
+        return _shared_client
+
+
+def configure(**kwargs) -> HttpClient:
+    """
+    Replaces the process-wide client, e.g. configure(pool_size=16) before a
+    run with 16 workers. Takes the HttpClient arguments.
+
+    :return: The new client.
+    """
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is not None:
+            _shared_client.close()
+        _shared_client = HttpClient(**kwargs)
+        return _shared_client
@@ -0,0 +1,181 @@
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import zlib
+
+
+def body_digest(body) -> str:
+    """
+    The content address of a response body.
+
+    :param body: The raw page, str or bytes.
+    :return: A hex digest.
+    """
+    if isinstance(body, str):
+        body = body.encode("utf-8", "surrogatepass")
+    return hashlib.blake2b(body, digest_size=20).hexdigest()
+
+
+_source_digests = {}
+
+
+def source_fingerprint(*functions) -> str:
+    """
+    A digest of the source files of the modules that define the functions,
+    so a cached result is dropped when an extractor or any helper it calls
+    from its module is edited, not only the function itself. Functions
+    without a source file (builtins) go by name.
+
+    :param functions: The extractors a cached result depends on.
+    :return: A hex digest.
+    """
+    parts = []
+    for function in functions:
+        module = sys.modules.get(getattr(function, "__module__", None) or "")
+        path = getattr(module, "__file__", None)
+        if not path:
+            parts.append(getattr(function, "__qualname__", repr(function)))
+            continue
+        if path not in _source_digests:
+            with open(path, "rb") as f:
+                _source_digests[path] = hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+        parts.append(_source_digests[path])
+    return hashlib.blake2b(":".join(sorted(set(parts))).encode("utf-8"), digest_size=8).hexdigest()
+
+
+class PageCache:
+    """
+    A content-addressed cache of decode/extract results. Entries are keyed by
+    the hash of the raw page plus a key describing how it was processed (the
+    decoder config and the extraction plan), so a byte-identical page never
+    goes through HtmlDecoder or BeautifulSoup twice.
+
+    The first tier is a bounded in-memory LRU. The optional second tier is a
+    SQLite file of zlib-compressed pickles that survives between runs; entries
+    found there are promoted to memory. Both tiers are safe to share between
+    threads.
+    """
+
+    def __init__(self, max_entries: int = 1024, path: str = None) -> None:
+        """
+        :param max_entries: Size of the in-memory LRU; 0 disables it.
+        :param path: SQLite file for the on-disk tier, None to keep the cache
+            in memory only.
+        """
+        self.max_entries = max_entries
+        self.path = path
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, value BLOB)"
+            )
+            self._db.commit()
+
+    def key(self, body, *config) -> str:
+        """
+        :param body: The raw page.
+        :param config: Anything else the result depends on, e.g.
+            HtmlDecoder.config_key() and ExtractionPlan.fingerprint.
+        :return: The cache key.
+        """
+        return body_digest(body) + ":" + ":".join(str(part) for part in config)
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM pages WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value = pickle.loads(zlib.decompress(row[0]))
+                    self._remember(key, value)
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return default
+
+    def put(self, key: str, value) -> None:
+        with self._lock:
+            self._remember(key, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO pages (key, value) VALUES (?, ?)",
+                    (key, zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))),
+                )
+                self._db.commit()
+
+    def get_or_compute(self, key: str, compute):
+        """
+        Returns the cached result for key, or calls compute() and caches what
+        it returns. Two threads missing the same key at once may both compute
+        it; the results are identical, so the second store is harmless.
+
+        :param key: A key built with PageCache.key.
+        :param compute: Called without arguments on a miss.
+        :return: The result.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def _remember(self, key: str, value) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """
+        :return: Hit and miss counters; hits counts memory hits and disk_hits
+            entries loaded from the on-disk tier.
+        """
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    def summary(self) -> str:
+        stats = self.stats()
+        return (
+            f"Page cache: {stats['hits']} memory hits, {stats['disk_hits']} disk hits, "
+            f"{stats['misses']} misses ({stats['hit_ratio']:.0%} hit ratio)"
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,246 @@
+import asyncio
+import collections
+import threading
+import time
+
+
+# Latencies kept per host for the percentiles, the most recent ones.
+LATENCY_SAMPLES = 10_000
+
+
+class HostLimiter:
+    """
+    A token bucket for one host whose rate adapts AIMD style: every fast,
+    successful response adds a little to the rate, every 429/5xx (or a
+    response much slower than the latency target) cuts it by a factor. The
+    rate settles just under what the host tolerates.
+
+    Waiting is by reservation: acquire takes a token even when the bucket is
+    empty and returns how long the caller must wait for it, so the lock is
+    never held while sleeping and threads and tasks can share one bucket.
+    A Retry-After pauses the bucket: no tokens are earned during the pause,
+    and the requests reserved meanwhile are spread at the rate from its end
+    instead of all going out when it ends.
+    """
+
+    def __init__(
+        self,
+        rate: float = 5.0,
+        burst: float = 5.0,
+        min_rate: float = 0.5,
+        max_rate: float = 50.0,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_target: float = 2.0,
+        cooldown: float = 2.0,
+    ) -> None:
+        """
+        :param rate: Starting requests per second.
+        :param burst: Tokens the bucket holds when idle.
+        :param min_rate: Lowest rate a decrease can reach.
+        :param max_rate: Highest rate an increase can reach.
+        :param increase: Requests per second added per second of successes,
+            spread over the responses (each adds increase / rate).
+        :param decrease: Factor applied to the rate on a 429 or 5xx.
+        :param latency_target: Responses slower than this (seconds) do not
+            increase the rate; twice as slow decreases it a little.
+        :param cooldown: Seconds after a decrease during which further
+            failures do not decrease again; a burst of 429s answers one
+            overshoot.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._decreased_at = 0.0
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.throttled = 0
+        self.waited = 0.0
+        self.decreases = 0
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+
+    def reserve(self) -> float:
+        """
+        Takes a token.
+
+        :return: Seconds to wait before sending the request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+
+            # the debt is paid from the end of a pause, not during it
+            start = max(now, self._paused_until)
+            wait = (start - now) + max(0.0, -self._tokens / self.rate)
+            self.requests += 1
+            self.waited += wait
+            return wait
+
+    def _refill(self, now: float) -> None:
+        # _updated is the pause end while paused: nothing is earned before it
+        if now > self._updated:
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+
+    def acquire(self) -> None:
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    def record(self, status_code: int, latency: float, retry_after: float = None) -> None:
+        """
+        Feeds a response back into the rate.
+
+        :param status_code: The response status, 0 for a connection error.
+        :param latency: Seconds the request took.
+        :param retry_after: The host's Retry-After, in seconds, if it sent one;
+            nobody sends to it again before that.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.latencies.append(latency)
+            if retry_after and now + retry_after > self._paused_until:
+                self._refill(now)
+                self._paused_until = now + retry_after
+                # the host is overloaded: no saved-up burst right after the
+                # pause, one request at its end and the rest at the rate
+                self._tokens = min(self._tokens, 1.0)
+                self._updated = max(self._updated, self._paused_until)
+
+            overloaded = status_code == 429 or status_code == 0 or status_code >= 500
+            if overloaded or latency > 2 * self.latency_target:
+                if now - self._decreased_at >= self.cooldown:
+                    factor = self.decrease if overloaded else (1 + self.decrease) / 2
+                    self.rate = max(self.min_rate, self.rate * factor)
+                    self._decreased_at = now
+                    self.decreases += 1
+                if status_code == 429:
+                    self.throttled += 1
+            elif latency <= self.latency_target:
+                self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            stats = {
+                "rate": self.rate,
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "decreases": self.decreases,
+                "waited": self.waited,
+            }
+
+        for percent in (50, 95, 99):
+            index = min(len(latencies) - 1, len(latencies) * percent // 100)
+            stats[f"p{percent}_ms"] = latencies[index] * 1000 if latencies else 0.0
+        return stats
+
+
+class RateLimiter:
+    """
+    One HostLimiter per host, shared by every thread and task of the process,
+    so any number of crawls against the same host together stay within the
+    rate that host tolerates.
+    """
+
+    def __init__(self, **defaults) -> None:
+        """
+        :param defaults: HostLimiter arguments for hosts without their own.
+        """
+        self.defaults = defaults
+        self._hosts = {}
+        self._overrides = {}
+        self._lock = threading.Lock()
+
+    def configure(self, host: str, **settings) -> None:
+        """
+        Sets HostLimiter arguments for one host, before its first request.
+        """
+        with self._lock:
+            self._overrides[host] = settings
+            self._hosts.pop(host, None)
+
+    def host(self, host: str) -> HostLimiter:
+        with self._lock:
+            limiter = self._hosts.get(host)
+            if limiter is None:
+                settings = dict(self.defaults)
+                settings.update(self._overrides.get(host, {}))
+                limiter = self._hosts[host] = HostLimiter(**settings)
+            return limiter
+
+    def acquire(self, host: str) -> None:
+        self.host(host).acquire()
+
+    async def acquire_async(self, host: str) -> None:
+        await self.host(host).acquire_async()
+
+    def record(self, host: str, status_code: int, latency: float, retry_after: float = None) -> None:
+        self.host(host).record(status_code, latency, retry_after)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {host: limiter.as_dict() for host, limiter in hosts.items()}
+
+    def summary(self) -> str:
+        return "\n".join(
+            f"{host}: {stats['rate']:.1f} requests/sec, {stats['requests']} requests, "
+            f"{stats['throttled']} throttled (429), {stats['decreases']} slowdowns, "
+            f"{stats['waited']:.0f} s waited in total, latency p50/p95/p99 "
+            f"{stats['p50_ms']:.0f}/{stats['p95_ms']:.0f}/{stats['p99_ms']:.0f} ms"
+            for host, stats in self.stats().items()
+        )
+
+
+def parse_retry_after(value) -> float:
+    """
+    :param value: A Retry-After header, in seconds or as an HTTP date.
+    :return: Seconds to wait, or None if the header is missing or unreadable.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    from email.utils import parsedate_to_datetime
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_shared_limiter = None
+_shared_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    """
+    :return: The process-wide limiter, created with the defaults on first use.
+    """
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
@@ -1,12 +1,22 @@
 import requests
-from fake_useragent import UserAgent
-import random
 from grabber.html_decoder import HtmlDecoder
-from bs4 import BeautifulSoup
+from grabber.extraction_plan import ExtractionPlan, Field
+from grabber.page_cache import PageCache
+from grabber.http_client import HttpClient, get_client
+from grabber.crawl_engine import CrawlEngine
+from grabber.crawl_pipeline import CrawlPipeline
+from grabber.result_sink import ResultSink
+from grabber.search_shards import SearchShard, ShardPlanner
+from grabber.http_cache import HttpCache
+from grabber.resilience import DeadLetterQueue, get_resilience
+from grabber.listing_index import ListingIndex
+from grabber.crawl_frontier import CrawlFrontier
+from grabber.response_archive import ArchivedResponse, ResponseArchive, replay as replay_archive
+from functools import partial
 import re
 import math
-import csv
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import asyncio
 import os
 import time
 
@@ -69,229 +79,643 @@ def extract_price_per_sqm(tag_list):
     
     return 0, 0
 
+def stripped_texts(elements):
+    texts = []
+    for element in elements:
+        text = element.get_text(strip=True)
+        if text:
+            texts.append(text)
+    return texts
+
+def list_item(items, index, default):
+    return items[index] if len(items) > index else default
+
+# The serialized Next.js state; search pages hold every result card in it
+NEXT_DATA_PATTERN = re.compile(
+    r'<script[^>]*\bid=["\']__NEXT_DATA__["\'][^>]*>(.*?)</script>', re.DOTALL
+)
+
+ROOM_COUNTS = {
+    "ONE": 1, "TWO": 2, "THREE": 3, "FOUR": 4, "FIVE": 5,
+    "SIX": 6, "SEVEN": 7, "EIGHT": 8, "NINE": 9, "TEN": 10,
+}
+
+# The record fields a card must hold for its detail page to be skipped
+LISTING_FIELDS = ("title", "developer", "price", "price_per_square_m", "square_footage", "rooms", "address")
+
+# The columns of the exported files
+STORIA_FIELDS = ("title", "developer", "url", "price", "price_per_square_m", "square_footage", "rooms", "address")
+
+def extract_next_data(html):
+    """
+    :return: The page state Next.js serializes into the __NEXT_DATA__
+        script, or None if the page has none or it does not parse.
+    """
+    match = NEXT_DATA_PATTERN.search(html)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(1))
+    except ValueError:
+        return None
+
+def dig(value, *keys):
+    for key in keys:
+        if isinstance(value, dict):
+            value = value.get(key)
+        elif isinstance(value, list) and isinstance(key, int) and -len(value) <= key < len(value):
+            value = value[key]
+        else:
+            return None
+    return value
+
+def card_address(location):
+    # the most specific place comes last, as "Aparatorii Patriei, Sectorul 4, Bucuresti"
+    full_name = dig(location, "reverseGeocoding", "locations", -1, "fullName")
+    if full_name:
+        return full_name
+
+    names = [
+        dig(location, "address", part, "name")
+        for part in ("street", "city", "province")
+    ]
+    names = [name for name in names if name]
+    return ", ".join(names) if names else None
+
+def card_record(item : dict, root_url : str):
+    """
+    Turns a search result card of the page state into the record
+    parse_listing makes of its detail page; fields the card lacks are None.
+
+    :return: (listing URL, record), or None for cards without a slug.
+    """
+    slug = item.get("slug")
+    if not slug:
+        return None
+    url = f"{root_url}/ro/oferta/{slug}"
+
+    price = dig(item, "totalPrice", "value")
+    per_square_m = dig(item, "pricePerSquareMeter", "value")
+    area = item.get("areaInSquareMeters")
+    rooms = item.get("roomsNumber")
+    rooms = ROOM_COUNTS.get(rooms, int(rooms) if str(rooms).isdigit() else None)
+
+    return url, {
+        "title": item.get("title"),
+        "developer": dig(item, "agency", "name") or "Owner - N/A",
+        "url": url,
+        "price": int(float(price)) if price else None,
+        "price_per_square_m": int(float(per_square_m)) if per_square_m else None,
+        "square_footage": f"{float(area):g}m²" if area else None,
+        "rooms": (f"{rooms} camere" if rooms > 1 else "1 cameră") if rooms else None,
+        "address": card_address(item.get("location")),
+    }
+
+def card_complete(card) -> bool:
+    return card is not None and all(card.get(field) is not None for field in LISTING_FIELDS)
+
+def fill_missing(card, record : dict) -> dict:
+    """
+    :return: The card's fields, with the ones it lacks taken from the record
+        extracted from the detail page.
+    """
+    if card is None:
+        return record
+    filled = dict(record)
+    filled.update((key, value) for key, value in card.items() if value is not None)
+    return filled
+
+def dom_card(texts : list) -> dict:
+    """
+    Reads the fields a search result card shows from its texts, the title
+    first: the price, price per m², area and rooms. The agency and the
+    address are only on the detail page and stay None.
+    """
+    price = extract_price(texts)
+    per_square_m = extract_price_per_sqm(texts)
+    area = next((match for match in (
+        re.search(r"(\d+(?:[.,]\d+)?)\s*m²", text) for text in texts if "€" not in text
+    ) if match), None)
+    rooms = next((match for match in (
+        re.search(r"\d+\s*camer\w*", text) for text in texts
+    ) if match), None)
+
+    return {
+        "title": texts[0] if texts else None,
+        "developer": None,
+        "price": price if isinstance(price, int) else None,
+        "price_per_square_m": per_square_m if isinstance(per_square_m, int) else None,
+        "square_footage": area.group(1) + "m²" if area else None,
+        "rooms": rooms.group() if rooms else None,
+        "address": None,
+    }
+
+# Search result pages: the "1-36 din 1234" pagination block and the listing links
+STORIA_SEARCH_PLAN = ExtractionPlan({
+    "pages": Field(
+        "div",
+        "default-default-container-container-default-container-container-container-container-container-container-container-container-container-container-container-container-class",
+        lambda pages: [page.get_text(strip=True) for page in pages],
+    ),
+    "links": Field(
+        "a",
+        "default-default-container-container-default-container-container-container-container-container-container-ul-li-default-section-container-link-class",
+        lambda links: [link["href"] for link in links if "href" in link.attrs],
+    ),
+    # the cards holding the links, for the shallow depth
+    "cards": Field(
+        "article",
+        "default-default-container-container-default-container-container-container-container-container-container-ul-li-default-class",
+        lambda articles: [dom_card(article.get_text("\n", strip=True).split("\n")) for article in articles],
+    ),
+})
+
+# Listing detail pages
+STORIA_LISTING_PLAN = ExtractionPlan({
+    "title": Field(
+        "h1",
+        "default-default-container-container-default-container-container-container-container-default-class",
+        lambda title: title.text if title else "No title found.",
+        first=True,
+    ),
+    "developer": Field(
+        "strong",
+        "default-default-container-container-default-container-container-container-container-container-default-container-container-span-default-class",
+        lambda developer: developer.get_text(strip=True) if developer else "Owner - N/A",
+        first=True,
+    ),
+    "price": Field(
+        "div",
+        "default-default-container-container-default-container-container-container-container-container-container-class",
+        lambda prices: extract_price(stripped_texts(prices)),
+    ),
+    "price_per_square_m": Field(
+        "div",
+        "default-default-container-container-default-container-container-container-container-container-container-class",
+        lambda prices: extract_price_per_sqm(stripped_texts(prices)),
+    ),
+    # the buttons hold "Back to list", the area and the rooms, in that order
+    "square_footage": Field(
+        "button",
+        "default-default-container-container-default-container-container-container-container-default-class",
+        lambda buttons: list_item(stripped_texts(buttons), 1, "0"),
+    ),
+    "rooms": Field(
+        "button",
+        "default-default-container-container-default-container-container-container-container-default-class",
+        lambda buttons: list_item(stripped_texts(buttons), 2, "0"),
+    ),
+    "address": Field(
+        "a",
+        "default-default-container-container-default-container-container-container-container-container-link-class",
+        lambda links: links[-1].get_text(strip=True) if links else "Not found",
+    ),
+})
+
+# one scraper per replay worker process, built on first use
+_replay_scraper = None
+
+def replay_listing(response : ArchivedResponse, parser : str = "html.parser"):
+    """
+    Extracts the records of an archived page in a replay worker: the
+    complete cards of a search page, or the record of a listing page.
+
+    :return: A list of (url, record), empty for failed responses.
+    """
+    global _replay_scraper
+    if response.status_code != 200:
+        return []
+
+    if _replay_scraper is None or _replay_scraper.parser != parser:
+        _replay_scraper = Storia(parser=parser)
+    if "/rezultate/" in response.url:
+        cards = _replay_scraper.parse_search_page(response.text)['cards']
+        return [(url, card) for url, card in cards.items() if card_complete(card)]
+    return [(response.url, _replay_scraper.parse_listing(response.url, response.text))]
+
+# User-Agent, Accept and client hints come from the precomputed header profiles
+STORIA_REQUEST_HEADERS = {
+    "Referer": "https://www.google.com",
+    "Sec-Fetch-Site": "cross-site",
+    "DNT": "1"
+}
+
 class Storia:
-    def __init__(self, main_url : str = None) -> None:
+    # every listing's detail page is fetched unless its card holds every field
+    DEEP = "deep"
+    # only the search pages are fetched; records hold what the cards show
+    SHALLOW = "shallow"
+
+    def __init__(self, main_url : str = None, parser : str = "html.parser", cache : PageCache = None, client : HttpClient = None,
+                 concurrency : int = 64, per_host : int = 24, http_cache : HttpCache = None,
+                 dead_letters : DeadLetterQueue = None, index : ListingIndex = None,
+                 frontier : CrawlFrontier = None, archive : ResponseArchive = None,
+                 root_url : str = "https://storia.ro", depth : str = DEEP,
+                 page_workers : int = 4, detail_workers : int = None, queue_size : int = 256,
+                 output_format : str = "csv", shard_pages : int = None, districts : list = None) -> None:
+        if depth not in (self.DEEP, self.SHALLOW):
+            raise ValueError(f"Unknown depth: {depth}")
+
         self.main_url = main_url
-        self.root_url = "https://storia.ro"
+        # the site the listing links are relative to; a stand-in server's
+        # address in load tests (see benchmarks/standin_server.py)
+        self.root_url = root_url
+        self.parser = parser
+        # byte-identical pages are only decoded and extracted once;
+        # pass PageCache(path=...) to keep the results between runs
+        self.cache = cache if cache is not None else PageCache()
+        # keep-alive connections shared with every other scraper in the process
+        self.client = client if client is not None else get_client()
+        # requests in flight during crawl(), in total and to one host
+        self.concurrency = concurrency
+        self.per_host = per_host
+        # search pages fetched at once, listings crawled at once (as many as
+        # may be in flight to the host by default), and listings found but
+        # not crawled yet before the page fetchers wait
+        self.page_workers = page_workers
+        self.detail_workers = detail_workers if detail_workers is not None else per_host
+        self.queue_size = queue_size
+        # pass HttpCache(path) to revalidate unchanged pages instead of
+        # downloading them again; with a PageCache path their extraction
+        # results are reused too
+        self.http_cache = http_cache
+        # pages that still failed after every retry; pass
+        # DeadLetterQueue(path) to re-drive them later with redrive()
+        self.dead_letters = dead_letters if dead_letters is not None else DeadLetterQueue()
+        # with a ListingIndex the crawl is incremental: detail pages are only
+        # fetched for new listings and the index's refresh fraction of known
+        # ones, and listings gone from the search are marked delisted
+        self.index = index
+        # with a CrawlFrontier a killed crawl resumes where it stopped: done
+        # pages are not fetched again and their records come from it
+        self.frontier = frontier
+        # pass ResponseArchive(directory) to keep every response of crawl()
+        # and re-extract them later with replay(), without network
+        self.archive = archive
+        # Storia.SHALLOW for title, price, price/m², area and rooms from the
+        # search cards alone, one request per search page
+        self.depth = depth
+        # "csv" or "jsonl"; records are written as they are done
+        self.output_format = output_format
+        # with shard_pages the search is split by district, rooms and price
+        # until no shard has more pages than that, the site's pagination cap,
+        # and the shards are crawled side by side; districts are path
+        # segments below the city, e.g. ["sectorul-1", ...]
+        self.shard_pages = shard_pages
+        self.districts = districts
     
-    def make_legit_request(self, url : str = None) -> requests:
-        ua = UserAgent()
-        headers = {
-            "User-Agent": ua.random,
-            "Accept-Language": "en-US,en;q=0.9",
-            "Accept-Encoding": "gzip, deflate, br",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-            "Connection": "keep-alive",
-            "Referer": "https://www.google.com",
-            "DNT": "1"
-        }
-        return requests.get(url, headers=headers)
+    def make_legit_request(self, url : str = None) -> requests.Response:
+        return self.client.get(url, headers=STORIA_REQUEST_HEADERS)
     
     def decode_html(self, html : str = None, beautify : bool = False, dump : bool = True):
-        decode = HtmlDecoder(html)
+        decode = HtmlDecoder(html, parser=self.parser)
         return decode.get_html(beautify, dump)
+
+    def decode_soup(self, html : str = None):
+        decode = HtmlDecoder(html, parser=self.parser)
+        return decode.get_soup()
+
+    def extract(self, plan : ExtractionPlan, html : str = None) -> dict:
+        decode = HtmlDecoder(html, parser=self.parser)
+        key = self.cache.key(html, decode.config_key(), plan.fingerprint)
+        return self.cache.get_or_compute(key, lambda: plan.extract(decode))
         
-    def fetch_listing_metadata(self, url : str = None, appartments : list = None):
-        print(f"Using {url} to grab metadata...")
-        
-        response = self.make_legit_request(url)
-        if response.status_code == 200:
-            
-            print(f"Processing metadata for {url}...")
-            
-            content = self.decode_html(response.text)
-            soup = BeautifulSoup(content, "html.parser")
-            
-            metadata : dict = {}
-            metadata['title'] = "No tile found"
-            metadata['developer'] = "Owner - N/A"
-            metadata['url'] = url
-            metadata['price'] = '0'
-            metadata['price_per_square_m'] = '0'
-            metadata['square_footage'] = "0"
-            metadata['rooms'] = "0"
-            metadata['address'] = "Not found"
-            
-            title = soup.find("h1", class_="default-default-container-container-default-container-container-container-container-default-class")
-            metadata['title'] = title.text if title else "No title found."
-            
-            sq_rooms_list = []
-            sq_rooms = soup.find_all("div", class_="default-default-container-container-default-container-container-container-container-class")
-            if sq_rooms:
-                for room in sq_rooms:
-                    square_area = room.find_all("button", class_="default-default-container-container-default-container-container-container-container-default-class")
-                    if square_area:
-                        for sq in square_area:
-                            sq_text = sq.get_text(strip=True)
-                            if sq_text:
-                                sq_rooms_list.append(sq_text)
-            if sq_rooms_list:
-                metadata['square_footage'] = sq_rooms_list[1] if sq_rooms_list[1] else "0.0 m²"
-                metadata['rooms'] = sq_rooms_list[2] if sq_rooms_list[2] else "0"
-                
-            address = "Not found"    
-            div_address = soup.find_all("div", class_="default-default-container-container-default-container-container-container-container-container-class")
-            if div_address:
-                for div in div_address:
-                    address_link = div.find("a", class_= "default-default-container-container-default-container-container-container-container-container-link-class")
-                    if address_link:
-                        address = address_link.get_text(strip=True)
-            
-            metadata['address'] = address
-            
-            price_list = []
-            
-            prices_container = soup.find_all("div", class_="default-default-container-container-default-container-container-container-container-container-class")
-            if prices_container:
-                for price in prices_container:
-                    first_price_container = price.find_all("div", class_="default-default-container-container-default-container-container-container-container-container-container-class")   
-                    if first_price_container:
-                        for fp in first_price_container:
-                            fp_text = fp.get_text(strip=True)
-                            if fp_text:
-                                price_list.append(fp_text)
-            
-            metadata['price'] = extract_price(price_list)
-            metadata['price_per_square_m'] = extract_price_per_sqm(price_list)
-            
-            developer_container = soup.find("strong", class_="default-default-container-container-default-container-container-container-container-container-default-container-container-span-default-class")
-            if developer_container:
-                metadata['developer'] = developer_container.get_text(strip=True)
-            
-            appartments.append(metadata)
-        else:
-            print(f"Unable to parse listing: {response.status_code}. Aborting.")
+    def parse_listing(self, url : str, html : str) -> dict:
+        fields = self.extract(STORIA_LISTING_PLAN, html)
+
+        metadata : dict = {}
+        metadata['title'] = fields['title']
+        metadata['developer'] = fields['developer']
+        metadata['url'] = url
+        for key in ('price', 'price_per_square_m', 'square_footage', 'rooms', 'address'):
+            metadata[key] = fields[key]
+
+        return metadata
+
+    def parse_search_page(self, html : str) -> dict:
+        """
+        Reads a search result page from the Next.js state embedded in it,
+        before any decoding: one json.loads gives every card's record, and
+        most listings need no detail page. Pages without the state are
+        decoded and extracted with STORIA_SEARCH_PLAN instead; their cards
+        are only read at the shallow depth, since the detail pages give
+        better records at the deep one.
+
+        :return: "last_page", None if the page does not tell; "listings",
+            the listing URLs; "cards", listing URL to card record.
+        """
+        ads = dig(extract_next_data(html), "props", "pageProps", "data", "searchAds")
+        if isinstance(ads, dict) and isinstance(ads.get("items"), list):
+            cards = {}
+            for item in ads["items"]:
+                found = card_record(item, self.root_url) if isinstance(item, dict) else None
+                if found is not None:
+                    cards[found[0]] = found[1]
+
+            pagination = ads.get("pagination") or {}
+            last_page = pagination.get("totalPages")
+            if last_page is None and pagination.get("totalResults") and pagination.get("itemsPerPage"):
+                last_page = math.ceil(pagination["totalResults"] / pagination["itemsPerPage"])
+            return {"last_page": last_page, "listings": list(cards), "cards": cards}
+
+        fields = self.extract(STORIA_SEARCH_PLAN, html)
+        cards = {}
+        # one link per card, in the same order
+        if self.depth == self.SHALLOW and len(fields['cards']) == len(fields['links']):
+            for link, card in zip(fields['links'], fields['cards']):
+                url = self.root_url + link
+                cards[url] = {"title": card['title'], "developer": card['developer'], "url": url}
+                cards[url].update((field, card[field]) for field in LISTING_FIELDS[2:])
+
+        return {
+            "last_page": extract_last_page_from_list(fields['pages']) if fields['pages'] else None,
+            "listings": [self.root_url + url for url in fields['links']],
+            "cards": cards,
+        }
+
+    def dead_letter(self, url : str, kind : str, response) -> None:
+        """
+        Keeps a URL for redrive() if it failed for a reason that may pass
+        (429, 5xx, connection errors); a 404 is not retried.
+        """
+        if get_resilience().policy.retryable(response.status_code):
+            self.dead_letters.add(url, kind, response.status_code, getattr(response, "error", None))
     
+    def result_sink(self, prefix : str, output_dir : str = "exported") -> ResultSink:
+        return ResultSink(
+            os.path.join(output_dir, f"{prefix}_all_apartments_{int(time.time())}.{self.output_format}"),
+            STORIA_FIELDS,
+        )
+
     def fetch_listings(self):
-            response = self.make_legit_request(self.main_url)
-
-            if response.status_code == 200:
-                content = self.decode_html(response.text)
-                soup = BeautifulSoup(content, "html.parser")
-                
-                pages_list = []
-                pages_container = soup.find_all('div', class_="default-default-container-container-default-container-container-container-container-container-container-container-container-container-container-container-container-class")
-                if pages_container:
-                    for page in pages_container:
-                        pages_list.append(page.get_text(strip=True))
-                
-                last_page = 10
-                if pages_list:
-                    last_page = extract_last_page_from_list(pages_list)
-  
-                links = soup.find_all("a", class_="default-default-container-container-default-container-container-container-container-container-container-ul-li-default-section-container-link-class")
-    
-                found_urls = []
-                if links:
-                    for link in links:
-                        if "href" in link.attrs:
-                            found_urls.append(link["href"])
-                            
-                # implement the usage of pages
-                # if the page is larger than 1
-                # otherwise do not include the &page in the reuquest
-
-                appartments = []
-                if found_urls:
-                    # print(f"Found {len(found_urls)}, processing metadata...")
-                    # # only using the first one for testing
-                    
-                    # #to_query = self.root_url + found_urls[0]
-                    # for url in found_urls:
-                    #     self.fetch_listing_metadata(self.root_url + url, appartments)
-                    # Process all listing URLs in parallel
-                    with ThreadPoolExecutor(max_workers=6) as executor:
-                        futures = [
-                            executor.submit(self.fetch_listing_metadata, self.root_url + url, appartments)
-                            for url in found_urls
-                        ]
-                        for future in as_completed(futures):
-                            future.result()
-
-                else:
-                    print(f"Unable to fetch listing urls for: {self.main_url}")
-                    
-
-                # if last_page > 1:
-                #     for page_num in range(2, 5):
-                #         print(f"Processing page {page_num}...")
-                #         paginated_url = f"{self.main_url}&page={page_num}"
-                #         self.fetch_listings_for_page(paginated_url, appartments)
-                if last_page > 1:
-                    with ThreadPoolExecutor(max_workers=4) as executor:
-                        page_futures = []
-                        for page_num in range(2, last_page + 1):
-                            print(f"Processing page {page_num} in parallel...")
-                            paginated_url = f"{self.main_url}&page={page_num}"
-                            page_futures.append(executor.submit(self.fetch_listings_for_page, paginated_url, appartments))
-
-                        # Wait for all pages to finish processing
-                        for future in as_completed(page_futures):
-                            future.result()  # Ensure completion and handle potential errors
-
-                            
-
-                if len(appartments):
-                    self.save_apartments_to_csv(appartments, "storia-dd")        
-                    
-                print(f"Data parsing complete. Processed: {len(appartments)}")
-            else:
-                print(f"Unable to process request: {response.status_code}")
-    
-    def fetch_listings_for_page(self, request_url: str, appartments : list):
-        response = self.make_legit_request(request_url)
-        
+        # written while the crawl runs; a crashed run leaves its records behind
+        with self.result_sink("storia-dd" if self.depth == self.DEEP else "storia-dd-shallow") as appartments:
+            asyncio.run(self.crawl(appartments))
+        print(appartments.summary())
+
+        if self.frontier is not None:
+            # saved; the next run starts from scratch
+            self.frontier.clear()
+
+        print(f"Data parsing complete. Processed: {len(appartments)}")
+        if len(self.dead_letters):
+            print(f"{len(self.dead_letters)} pages failed after retries; run redrive() to fetch only those.")
+        if self.index is not None:
+            print(self.index.summary())
+        print(self.cache.summary())
+
+    def redrive(self):
+        """
+        Fetches only the dead-lettered pages of earlier runs, not the whole
+        search, and saves what they yield to their own CSV. Pages that fail
+        again are dead-lettered again.
+        """
+        entries = self.dead_letters.take()
+        print(f"Re-driving {len(entries)} failed pages...")
+
+        # the re-drive is not part of the crawl the frontier may be resuming
+        frontier, self.frontier = self.frontier, None
+        try:
+            with self.result_sink("storia-dd-redrive") as appartments:
+                asyncio.run(self.crawl_dead_letters(entries, appartments))
+        finally:
+            self.frontier = frontier
+        # saved; the entries taken are not needed any more
+        self.dead_letters.ack()
+        print(appartments.summary())
+
+        print(f"Re-drive complete. Processed: {len(appartments)}, still failing: {len(self.dead_letters)}")
+
+    def crawl_engine(self) -> CrawlEngine:
+        return CrawlEngine(self.concurrency, self.per_host, headers=STORIA_REQUEST_HEADERS,
+                           http_cache=self.http_cache, archive=self.archive)
+
+    def crawl_pipeline(self) -> CrawlPipeline:
+        return CrawlPipeline(self.page_workers, self.detail_workers, self.queue_size)
+
+    def shard_planner(self, engine : CrawlEngine) -> ShardPlanner:
+        return ShardPlanner(partial(self.probe_shard, engine), self.shard_pages, self.districts)
+
+    async def probe_shard(self, engine : CrawlEngine, shard : SearchShard):
+        """
+        Fetches the first page of a shard of the search.
+
+        :return: The page as parse_search_page returns it, None if it failed.
+        """
+        response = await engine.fetch(shard.url)
+        if response.status_code != 200:
+            print(f"Unable to process request: {shard.url}, status code: {response.status_code}")
+            if shard.url != self.main_url:
+                self.dead_letter(shard.url, "page", response)
+                if self.index is not None:
+                    # the shard's listings were not seen; none can be delisted
+                    self.index.incomplete(self.main_url)
+            return None
+
+        page = await engine.parse(self.parse_search_page, response.text)
+        if not page['listings']:
+            print(f"Unable to fetch listing urls for: {shard.url}")
+        return page
+
+    def replay(self, path, workers : int = None) -> list:
+        """
+        Runs decoding and extraction over archived responses instead of the
+        site: every listing page in the archive is extracted again with the
+        current plans, in one process per CPU, and saved to its own CSV.
+        Complete cards of archived search pages count as listings too. The
+        latest response of a listing archived more than once wins.
+
+        :param path: An archive file, a directory of them, or a list of either.
+        :param workers: Worker processes, one per CPU by default.
+        :return: The listing records.
+        """
+        records = {}
+        for items in replay_archive(path, partial(replay_listing, parser=self.parser), workers):
+            for url, record in items:
+                records[url] = record
+
+        appartments = list(records.values())
+        if len(appartments):
+            self.save_apartments_to_csv(appartments, "storia-dd-replay")
+
+        print(f"Replay complete. Processed: {len(appartments)}")
+        return appartments
+
+    async def crawl_dead_letters(self, entries : list, appartments = None):
+        appartments = appartments if appartments is not None else []
+        async with self.crawl_engine() as engine:
+            pipeline = self.crawl_pipeline()
+            await pipeline.run(
+                [entry['url'] for entry in entries if entry['kind'] == "page"],
+                partial(self.crawl_page, engine),
+                lambda item: self.crawl_listing(engine, item[0], appartments, item[1]),
+                [(entry['url'], None) for entry in entries if entry['kind'] != "page"],
+            )
+            print(pipeline.summary())
+            print(engine.summary())
+
+        return appartments
+
+    async def crawl(self, appartments = None):
+        """
+        Crawls the search result pages and every listing they link to as a
+        pipeline on one event loop: page fetchers put the listings they find
+        in a bounded queue and a fixed fleet of detail workers crawls them,
+        so discovery and detail fetching overlap with steady memory. The
+        engine's limits still bound the requests in flight. Listings whose
+        card on the search page holds every field are not fetched at all.
+
+        :param appartments: Where each record goes as soon as it is done, a
+            ResultSink or a list; a new list if None.
+        :return: appartments.
+        """
+        appartments = appartments if appartments is not None else []
+        if self.index is not None:
+            self.index.begin(self.main_url)
+
+        resuming = self.frontier is not None and self.frontier.has(self.main_url)
+        if resuming:
+            print(f"Resuming the interrupted crawl. {self.frontier.summary()}")
+            if self.index is not None:
+                # listings done before the interruption are not seen again
+                self.index.incomplete(self.main_url)
+            # their records first, then this run's
+            for record in self.frontier.records(self.main_url):
+                appartments.append(record)
+
+        async with self.crawl_engine() as engine:
+            planner = self.shard_planner(engine)
+            shards = await planner.plan(SearchShard(self.main_url))
+
+            if shards:
+                if self.shard_pages:
+                    print(planner.summary(shards))
+                if self.index is not None and not planner.exhaustive(shards):
+                    # listings the shards do not reach were not seen; none can be delisted
+                    self.index.incomplete(self.main_url)
+
+                # shards may overlap; every listing is crawled once
+                cards = {}
+                for shard in shards:
+                    cards.update(shard.first_page['cards'])
+                listing_urls = list(dict.fromkeys(
+                    url for shard in shards for url in shard.first_page['listings']
+                ))
+                page_urls = planner.page_urls(shards)
+                if self.frontier is not None:
+                    # known URLs keep their state; only unfinished ones are crawled
+                    self.frontier.add(listing_urls, "listing", self.main_url)
+                    self.frontier.add(page_urls, "page", self.main_url)
+                    listing_urls = self.frontier.pending(self.main_url, "listing")
+                    page_urls = self.frontier.pending(self.main_url, "page")
+
+                seen = set(listing_urls)
+                pipeline = self.crawl_pipeline()
+                await pipeline.run(
+                    page_urls,
+                    lambda page_url, emit: self.crawl_page(engine, page_url, emit, seen),
+                    lambda item: self.crawl_listing(engine, item[0], appartments, item[1]),
+                    [(url, cards.get(url)) for url in listing_urls],
+                )
+                print(pipeline.summary())
+
+                if self.index is not None:
+                    self.index.finish(self.main_url)
+
+            print(engine.summary())
+
+        return appartments
+
+    async def crawl_page(self, engine : CrawlEngine, request_url : str, emit, seen : set = None):
+        """
+        Fetches a search page and hands its new listings to the detail
+        workers as (url, card) items.
+
+        :param emit: The pipeline's emit; waits while the queue is full.
+        :param seen: The listing URLs handed over already, by any page of
+            any shard of the search; updated.
+        """
+        print(f"Processing page {request_url}...")
+        response = await engine.fetch(request_url)
+
         if response.status_code == 200:
-            content = self.decode_html(response.text)
-            soup = BeautifulSoup(content, "html.parser")
-            
-            links = soup.find_all("a", class_="default-default-container-container-default-container-container-container-container-container-container-ul-li-default-section-container-link-class")
-            
-            found_urls = []
-            if links:
-                for link in links:
-                    if "href" in link.attrs:
-                        found_urls.append(link["href"])
-            
-            if found_urls:
-                # for url in found_urls:
-                #     to_query = self.root_url + url
-                #     self.fetch_listing_metadata(to_query, appartments)
-                with ThreadPoolExecutor(max_workers=6) as executor:
-                        futures = [
-                            executor.submit(self.fetch_listing_metadata, self.root_url + url, appartments)
-                            for url in found_urls
-                        ]
-                        for future in as_completed(futures):
-                            future.result()
+            page = await engine.parse(self.parse_search_page, response.text)
+
+            listing_urls = page['listings']
+            if self.frontier is not None:
+                # listings known from before an interruption are resumed by crawl()
+                listing_urls = self.frontier.add(listing_urls, "listing", self.main_url)
+            if seen is not None:
+                listing_urls = [url for url in listing_urls if url not in seen]
+                seen.update(listing_urls)
+
+            if page['listings']:
+                for url in listing_urls:
+                    await emit((url, page['cards'].get(url)))
             else:
                 print(f"No listing URLs found on page: {request_url}")
+
+            if self.frontier is not None:
+                self.frontier.done(request_url, scope=self.main_url)
         else:
             print(f"Failed to fetch page: {request_url}, status code: {response.status_code}")
+            self.dead_letter(request_url, "page", response)
+            if self.index is not None:
+                # listings on this page were not seen; none can be delisted
+                self.index.incomplete(self.main_url)
+            if self.frontier is not None:
+                self.frontier.failed(request_url, self.main_url)
 
-    def save_apartments_to_csv(self, all_apartments, prefix, output_dir="exported"):
-        # Ensure the output directory exists
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        if all_apartments:
-            # Generate a unique filename with a timestamp
-            csv_file = os.path.join(
-                output_dir, f"{prefix}_all_apartments_{int(time.time())}.csv"
-            )
+    async def crawl_listing(self, engine : CrawlEngine, url : str, appartments : list, card : dict = None):
+        """
+        :param card: The record read from the search page, if any; the
+            detail page is only fetched for the fields it lacks, and not at
+            all at the shallow depth.
+        """
+        complete = card_complete(card)
+        if complete or (self.depth == self.SHALLOW and card is not None):
+            appartments.append(card)
+            if self.index is not None:
+                # a partial card would pass for a change of the full record
+                self.index.seen(self.main_url, url, card if complete else None)
+            if self.frontier is not None:
+                self.frontier.done(url, card, self.main_url)
+            return
 
-            headers = all_apartments[0].keys()
+        if self.index is not None:
+            record = self.index.reusable(url)
+            if record is not None:
+                self.index.seen(self.main_url, url)
+                appartments.append(record)
+                if self.frontier is not None:
+                    self.frontier.done(url, record, self.main_url)
+                return
 
-            # Write data to CSV file
-            with open(csv_file, mode="w", newline="", encoding="utf-8") as file:
-                writer = csv.DictWriter(file, fieldnames=headers)
-                writer.writeheader()
+        if self.frontier is not None:
+            self.frontier.claim(url, self.main_url)
+        response = await engine.fetch(url)
 
-                for property_data in all_apartments:
-                    if property_data:
-                        row = {key: str(property_data.get(key, "")) for key in headers}
-                        writer.writerow(row)
+        if response.status_code == 200:
+            print(f"Processing metadata for {url}...")
+            record = fill_missing(card, await engine.parse(self.parse_listing, url, response.text))
+            appartments.append(record)
+            if self.index is not None:
+                self.index.seen(self.main_url, url, record)
+            if self.frontier is not None:
+                self.frontier.done(url, record, self.main_url)
+        else:
+            print(f"Unable to parse listing {url}: {response.status_code}.")
+            self.dead_letter(url, "listing", response)
+            if self.index is not None and response.status_code not in (404, 410):
+                # still on the search page, only its details are missing
+                self.index.seen(self.main_url, url)
+            if self.frontier is not None:
+                self.frontier.failed(url, self.main_url)
 
-            print(f"Data collection complete and saved to {csv_file}")
+    def save_apartments_to_csv(self, all_apartments, prefix, output_dir="exported"):
+        if all_apartments:
+            with self.result_sink(prefix, output_dir) as sink:
+                sink.extend(all_apartments)
+            print(f"Data collection complete and saved to {sink.path}")
         else:
-            print("No apartments found")
\ No newline at end of file
+            print("No apartments found")
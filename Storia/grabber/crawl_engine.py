@@ -0,0 +1,314 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import asyncio
+import os
+import time
+
+import aiohttp
+from multidict import CIMultiDict
+
+from grabber.header_profiles import HeaderProfilePool, get_profiles
+from grabber.http_cache import CachedPage, HttpCache
+from grabber.rate_limiter import RateLimiter, get_limiter, parse_retry_after
+from grabber.resilience import Resilience, get_resilience
+from grabber.response_archive import ResponseArchive
+
+
+class FetchResult:
+    """
+    A downloaded page, with the attributes the scrapers read from a
+    requests.Response. status_code is 0 when the request raised.
+    """
+
+    __slots__ = ("url", "status_code", "headers", "content", "encoding", "error")
+
+    def __init__(
+        self,
+        url: str,
+        status_code: int,
+        headers=None,
+        content: bytes = b"",
+        encoding: str = None,
+        error: str = None,
+    ) -> None:
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers if headers is not None else CIMultiDict()
+        self.content = content
+        self.encoding = encoding
+        self.error = error
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    @classmethod
+    def cached(cls, page: CachedPage) -> "FetchResult":
+        return cls(page.url, 200, CIMultiDict(page.headers), page.body, page.encoding)
+
+
+class EngineStats:
+    """Counters of a CrawlEngine run; only touched from the event loop."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.parsing = 0
+        self.peak_parsing = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+
+    def as_dict(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "peak_parsing": self.peak_parsing,
+            "megabytes": self.bytes / 1_000_000,
+            "seconds": elapsed,
+            "requests_per_sec": self.requests / elapsed if elapsed else 0.0,
+        }
+
+
+class CrawlEngine:
+    """
+    Runs a whole crawl - listing pages and detail pages alike - as tasks on one
+    event loop. The number of requests in flight is set in one place: a global
+    limit plus a limit per host, enforced by semaphores, so concurrency no
+    longer depends on how thread pools happen to be nested. Within those
+    limits, each host's RateLimiter decides how fast requests start. Failed
+    requests are retried with backoff, and a host that keeps failing has its
+    circuit opened for a while (see Resilience). Decoding
+    and extraction run in a small thread pool, keeping the loop free to drive
+    the sockets.
+
+    Use it as an async context manager:
+
+        async with CrawlEngine(concurrency=64) as engine:
+            page = await engine.fetch(url)
+            fields = await engine.parse(storia.extract, plan, page.text)
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 64,
+        per_host: int = 24,
+        parse_workers: int = None,
+        timeout: float = 30,
+        headers: dict = None,
+        profiles: HeaderProfilePool = None,
+        limiter: RateLimiter = None,
+        http_cache: HttpCache = None,
+        resilience: Resilience = None,
+        archive: ResponseArchive = None,
+    ) -> None:
+        """
+        :param concurrency: Requests in flight at once, over all hosts.
+        :param per_host: Requests in flight at once to one host.
+        :param parse_workers: Threads decoding pages, one per CPU by default.
+        :param timeout: Total seconds allowed per request.
+        :param headers: Sent with every request, over the header profile.
+        :param profiles: Browser header profiles, the process-wide pool by
+            default.
+        :param limiter: Per-host request rates, the process-wide limiter by
+            default, which the threaded HttpClient shares.
+        :param http_cache: If given, pages are served from it while fresh and
+            revalidated with conditional requests once stale.
+        :param resilience: Retry policy and per-host circuit breakers, the
+            process-wide ones by default.
+        :param archive: If given, every response (cached ones included) is
+            appended to it, for offline re-extraction with replay().
+        """
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.parse_workers = parse_workers or os.cpu_count() or 4
+        self.timeout = timeout
+        self.headers = headers or {}
+        self.profiles = profiles if profiles is not None else get_profiles()
+        self.limiter = limiter if limiter is not None else get_limiter()
+        self.http_cache = http_cache
+        self.resilience = resilience if resilience is not None else get_resilience()
+        self.archive = archive
+
+        self.stats = EngineStats()
+        self._session = None
+        self._parse_pool = None
+        self._limit = None
+        self._host_limits = {}
+
+    async def __aenter__(self) -> "CrawlEngine":
+        self._limit = asyncio.Semaphore(self.concurrency)
+        self._parse_pool = ThreadPoolExecutor(
+            self.parse_workers, thread_name_prefix="parse"
+        )
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.concurrency,
+                limit_per_host=self.per_host,
+                ttl_dns_cache=300,
+            ),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        self.stats = EngineStats()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._session.close()
+        self._parse_pool.shutdown(wait=True)
+
+    def _host_limit(self, host: str) -> asyncio.Semaphore:
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return limit
+
+    async def fetch(self, url: str, headers: dict = None) -> FetchResult:
+        """
+        GETs a page once its host has a free slot and a token from the rate
+        limiter, and a global slot is free. With an HttpCache, fresh pages
+        are served without a request and stale ones are revalidated.
+
+        :param url: The page URL.
+        :param headers: Extra headers, over the engine's.
+        :return: The page; errors are reported as status_code 0, not raised,
+            once the retries are used up.
+        """
+        host = urlsplit(url).netloc
+        request_headers = CIMultiDict(self.profiles.for_host(host))
+        request_headers.update(self.headers)
+        if headers:
+            request_headers.update(headers)
+
+        loop = asyncio.get_running_loop()
+        page = None
+        if self.http_cache is not None:
+            # a SQLite query and a decompression of the page: off the loop, as store is
+            page = await loop.run_in_executor(self._parse_pool, self.http_cache.lookup, url)
+            if page is not None and not page.fresh:
+                request_headers.update(page.validators())
+
+        if page is not None and page.fresh:
+            result = FetchResult.cached(page)
+        else:
+            result = await self._fetch(url, host, request_headers)
+
+            if page is not None and result.status_code == 304:
+                page = await loop.run_in_executor(
+                    self._parse_pool, self.http_cache.revalidated, page, result.headers
+                )
+                result = FetchResult.cached(page)
+            elif self.http_cache is not None and result.status_code == 200:
+                await loop.run_in_executor(
+                    self._parse_pool, self.http_cache.store, url, result.headers, result.content
+                )
+
+        if self.archive is not None and result.status_code:
+            await loop.run_in_executor(
+                self._parse_pool,
+                self.archive.write, url, result.status_code, result.headers, result.content,
+            )
+        return result
+
+    async def _fetch(self, url: str, host: str, request_headers) -> FetchResult:
+        policy = self.resilience.policy
+        breaker = self.resilience.breaker(host)
+
+        for attempt in range(policy.attempts):
+            if breaker.allow():
+                try:
+                    async with self._host_limit(host):
+                        # waiting for a token inside the host's slot keeps at most
+                        # per_host reservations queued, so a rate change takes
+                        # effect within them
+                        await self.limiter.acquire_async(host)
+                        async with self._limit:
+                            result = await self._get(url, host, request_headers)
+                except Exception:
+                    # a half-open circuit must not wait for this trial forever
+                    breaker.record(False)
+                    raise
+                except BaseException:
+                    # cancelled: no outcome, the next request may be the trial
+                    breaker.release()
+                    raise
+                breaker.record(not policy.retryable(result.status_code))
+            else:
+                result = FetchResult(url, 0, error=f"circuit open for {host}")
+
+            if not policy.retryable(result.status_code) or attempt + 1 == policy.attempts:
+                return result
+
+            # the backoff is slept outside the host's slot, leaving it to
+            # requests that may succeed meanwhile
+            self.stats.retries += 1
+            self.resilience.retried()
+            delay = policy.delay(attempt, parse_retry_after(result.headers.get("Retry-After")))
+            await asyncio.sleep(max(delay, breaker.retry_in()))
+
+    async def _get(self, url: str, host: str, request_headers) -> FetchResult:
+        stats = self.stats
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        started = time.perf_counter()
+        try:
+            async with self._session.get(url, headers=request_headers) as response:
+                content = await response.read()
+                stats.bytes += len(content)
+                if response.status >= 500:
+                    stats.errors += 1
+                result = FetchResult(
+                    url,
+                    response.status,
+                    response.headers,
+                    content,
+                    response.charset,
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            stats.errors += 1
+            result = FetchResult(url, 0, error=f"{type(e).__name__}: {e}")
+        finally:
+            stats.in_flight -= 1
+
+        retry_after = None
+        if result.status_code == 429 or result.status_code == 503:
+            retry_after = parse_retry_after(result.headers.get("Retry-After"))
+        self.limiter.record(
+            host, result.status_code, time.perf_counter() - started, retry_after
+        )
+        return result
+
+    async def parse(self, function, *args):
+        """
+        Runs a decode/extract function in the parse pool.
+
+        :return: What function(*args) returns.
+        """
+        stats = self.stats
+        stats.parsing += 1
+        stats.peak_parsing = max(stats.peak_parsing, stats.parsing)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._parse_pool, function, *args)
+        finally:
+            stats.parsing -= 1
+
+    def summary(self) -> str:
+        stats = self.stats.as_dict()
+        return (
+            f"Crawl engine: {stats['requests']} requests, {stats['errors']} errors, "
+            f"{stats['retries']} retries, "
+            f"peak {stats['peak_in_flight']}/{self.concurrency} in flight, "
+            f"{stats['megabytes']:.1f} MB in {stats['seconds']:.1f} s "
+            f"({stats['requests_per_sec']:.1f} requests/sec)\n"
+            + self.limiter.summary() + "\n"
+            + self.resilience.summary()
+            + ("\n" + self.http_cache.summary() if self.http_cache is not None else "")
+            + ("\n" + self.archive.summary() if self.archive is not None else "")
+        )
@@ -0,0 +1,244 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def _scope_key(scope: str) -> str:
+    # NULLs never clash in a primary key; URLs of no scope share the empty one
+    return scope if scope is not None else ""
+
+
+class CrawlFrontier:
+    """
+    The URLs of a crawl and their state - pending, in flight, done or failed -
+    with the record extracted from each, in one SQLite file. A crawl that is
+    killed leaves its frontier behind; the next run adds the same URLs, which
+    are ignored if known, and only crawls the ones not done yet. Records of
+    finished URLs come back from the frontier, so nothing is fetched twice.
+    Once a run has saved its results, clear() empties the frontier for the
+    next one.
+
+    URLs belong to a scope (a search, a city) and have a kind (a search page,
+    a listing). A URL is known per scope: a listing shown by two cities'
+    searches is crawled, and its record kept, for both. State changes are
+    buffered and written batch_size at a time, or every flush_interval
+    seconds; an interrupted run loses at most that much work. URLs added
+    are written at once, since the crawl relies on them to resume.
+
+    Safe to share between threads.
+    """
+
+    PENDING = "pending"
+    IN_FLIGHT = "in_flight"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, path: str, batch_size: int = 100, flush_interval: float = 5.0) -> None:
+        """
+        :param path: The SQLite file.
+        :param batch_size: State changes buffered before they are written.
+        :param flush_interval: Seconds after which buffered changes are
+            written, however few.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._migrate()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS frontier ("
+            "url TEXT, kind TEXT, scope TEXT, state TEXT, "
+            "record TEXT, updated_at REAL, PRIMARY KEY (scope, url))"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS frontier_scope ON frontier (scope, kind, state)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS scopes (scope TEXT PRIMARY KEY, finished_at REAL)"
+        )
+        self._db.commit()
+
+        self._buffer = []
+        self._flushed_at = time.monotonic()
+
+    def _migrate(self) -> None:
+        # frontiers of earlier versions knew a URL once for all scopes
+        columns = self._db.execute("PRAGMA table_info(frontier)").fetchall()
+        if [column[1] for column in columns if column[5]] == ["url"]:
+            self._db.execute("ALTER TABLE frontier RENAME TO frontier_unscoped")
+            self._db.execute("DROP INDEX IF EXISTS frontier_scope")
+            self._db.execute(
+                "CREATE TABLE frontier ("
+                "url TEXT, kind TEXT, scope TEXT, state TEXT, "
+                "record TEXT, updated_at REAL, PRIMARY KEY (scope, url))"
+            )
+            self._db.execute(
+                "INSERT INTO frontier (url, kind, scope, state, record, updated_at) "
+                "SELECT url, kind, COALESCE(scope, ''), state, record, updated_at "
+                "FROM frontier_unscoped ORDER BY rowid"
+            )
+            self._db.execute("DROP TABLE frontier_unscoped")
+            self._db.commit()
+
+    def add(self, urls, kind: str, scope: str = None) -> list:
+        """
+        Adds URLs as pending, leaving the ones already known in the scope as
+        they are.
+
+        :param urls: The URLs.
+        :param kind: What they are, e.g. "page" or "listing".
+        :param scope: The search or city they belong to.
+        :return: The URLs that were not known in the scope, in the order given.
+        """
+        now = time.time()
+        added = []
+        with self._lock:
+            for url in urls:
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO frontier (url, kind, scope, state, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (url, kind, _scope_key(scope), self.PENDING, now),
+                )
+                if cursor.rowcount:
+                    added.append(url)
+            self._db.commit()
+        return added
+
+    def has(self, scope: str) -> bool:
+        """
+        :return: True if the frontier holds URLs of the scope, i.e. a run
+            crawling it was interrupted.
+        """
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM frontier WHERE scope = ? LIMIT 1", (scope,)
+            ).fetchone() is not None
+
+    def pending(self, scope: str = None, kind: str = None) -> list:
+        """
+        :return: The URLs not done yet: pending ones, and the ones left in
+            flight by an interrupted run. Failed URLs are left to the
+            dead-letter re-drive.
+        """
+        query = "SELECT url FROM frontier WHERE state IN (?, ?)"
+        params = [self.PENDING, self.IN_FLIGHT]
+        if scope is not None:
+            query += " AND scope = ?"
+            params.append(scope)
+        if kind is not None:
+            query += " AND kind = ?"
+            params.append(kind)
+
+        with self._lock:
+            self._flush()
+            return [row[0] for row in self._db.execute(query + " ORDER BY rowid", params)]
+
+    def claim(self, url: str, scope: str = None) -> None:
+        """Marks a URL of the scope in flight."""
+        self._change(url, scope, self.IN_FLIGHT)
+
+    def done(self, url: str, record=None, scope: str = None) -> None:
+        """
+        Marks a URL of the scope done.
+
+        :param record: What was extracted from it, anything json can store.
+        """
+        self._change(url, scope, self.DONE, record)
+
+    def failed(self, url: str, scope: str = None) -> None:
+        self._change(url, scope, self.FAILED)
+
+    def _change(self, url: str, scope: str, state: str, record=None) -> None:
+        data = json.dumps(record, ensure_ascii=False, default=str) if record is not None else None
+        with self._lock:
+            self._buffer.append((state, data, time.time(), url, _scope_key(scope)))
+            if (
+                len(self._buffer) >= self.batch_size
+                or time.monotonic() - self._flushed_at >= self.flush_interval
+            ):
+                self._flush()
+
+    def _flush(self) -> None:
+        if self._buffer:
+            self._db.executemany(
+                "UPDATE frontier SET state = ?, record = COALESCE(?, record), updated_at = ? "
+                "WHERE url = ? AND scope = ?",
+                self._buffer,
+            )
+            self._db.commit()
+            self._buffer = []
+        self._flushed_at = time.monotonic()
+
+    def flush(self) -> None:
+        """Writes the buffered state changes."""
+        with self._lock:
+            self._flush()
+
+    def records(self, scope: str = None) -> list:
+        """
+        :return: The records of the done URLs, in the order they were added.
+        """
+        query = "SELECT record FROM frontier WHERE state = ? AND record IS NOT NULL"
+        params = [self.DONE]
+        if scope is not None:
+            query += " AND scope = ?"
+            params.append(scope)
+
+        with self._lock:
+            self._flush()
+            return [json.loads(row[0]) for row in self._db.execute(query + " ORDER BY rowid", params)]
+
+    def finish_scope(self, scope: str) -> None:
+        """Records that a scope is complete and its results are saved."""
+        with self._lock:
+            self._flush()
+            self._db.execute(
+                "INSERT OR REPLACE INTO scopes VALUES (?, ?)", (scope, time.time())
+            )
+            self._db.commit()
+
+    def scope_done(self, scope: str) -> bool:
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM scopes WHERE scope = ?", (scope,)
+            ).fetchone() is not None
+
+    def counts(self) -> dict:
+        """
+        :return: State to the number of URLs in it.
+        """
+        with self._lock:
+            self._flush()
+            return dict(
+                self._db.execute("SELECT state, COUNT(*) FROM frontier GROUP BY state")
+            )
+
+    def summary(self) -> str:
+        counts = self.counts()
+        return (
+            f"Crawl frontier: {counts.get(self.DONE, 0)} done, "
+            f"{counts.get(self.PENDING, 0) + counts.get(self.IN_FLIGHT, 0)} left, "
+            f"{counts.get(self.FAILED, 0)} failed"
+        )
+
+    def clear(self) -> None:
+        """Empties the frontier once a run has saved its results."""
+        with self._lock:
+            self._buffer = []
+            self._db.execute("DELETE FROM frontier")
+            self._db.execute("DELETE FROM scopes")
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._db.close()
@@ -0,0 +1,158 @@
+import asyncio
+import collections
+import time
+
+
+# Tells an item worker the queue is closed.
+_CLOSED = object()
+
+
+class PipelineStats:
+    """Counters of a CrawlPipeline run; only touched from the event loop."""
+
+    def __init__(self) -> None:
+        self.pages = 0
+        self.pages_done = 0
+        self.items_queued = 0
+        self.items_done = 0
+        self.queue_depth = 0
+        self.peak_queue_depth = 0
+        self.busy = 0
+        self.blocked = 0
+        self.started = time.perf_counter()
+
+    def as_dict(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "pages": self.pages,
+            "pages_done": self.pages_done,
+            "items_queued": self.items_queued,
+            "items_done": self.items_done,
+            "queue_depth": self.queue_depth,
+            "peak_queue_depth": self.peak_queue_depth,
+            "busy": self.busy,
+            "blocked": self.blocked,
+            "seconds": elapsed,
+            "pages_per_sec": self.pages_done / elapsed if elapsed else 0.0,
+            "items_per_sec": self.items_done / elapsed if elapsed else 0.0,
+        }
+
+
+class CrawlPipeline:
+    """
+    A crawl as two stages joined by a bounded queue: page workers fetch the
+    search pages and put the items (listings) found on them in the queue,
+    a fixed fleet of item workers takes them out and crawls them, and each
+    result goes to the sink as soon as it is done. Discovery and detail
+    fetching overlap for the whole crawl. When the queue is full the page
+    workers wait, so memory stays flat whatever the size of the search. The
+    stage counters and the queue depth are reported while it runs.
+
+    Runs on the event loop of a CrawlEngine; the engine still bounds the
+    requests in flight.
+    """
+
+    def __init__(self, page_workers: int = 4, item_workers: int = 24, queue_size: int = 256,
+                 report_interval: float = 10.0) -> None:
+        """
+        :param page_workers: Search pages fetched at once.
+        :param item_workers: Items crawled at once; more than the engine lets
+            in flight only adds waiting tasks.
+        :param queue_size: Items found but not taken yet before the page
+            workers wait.
+        :param report_interval: Seconds between progress lines, None for none.
+        """
+        self.page_workers = page_workers
+        self.item_workers = item_workers
+        self.queue_size = queue_size
+        self.report_interval = report_interval
+        self.stats = PipelineStats()
+
+    async def run(self, pages, crawl_page, crawl_item, items=()) -> None:
+        """
+        Crawls the pages and every item they yield, then returns.
+
+        :param pages: What crawl_page takes, e.g. the search page URLs.
+        :param crawl_page: async (page, emit); awaits emit(item) for every
+            item found on the page. emit waits while the queue is full.
+        :param crawl_item: async (item); crawls one item.
+        :param items: Items known before any page is crawled, e.g. those of
+            the first page or of an interrupted run.
+        """
+        stats = self.stats = PipelineStats()
+        queue = asyncio.Queue(self.queue_size)
+        pending_pages = collections.deque(pages)
+        stats.pages = len(pending_pages)
+
+        async def emit(item) -> None:
+            if queue.full():
+                stats.blocked += 1
+            await queue.put(item)
+            stats.items_queued += 1
+            stats.queue_depth = queue.qsize()
+            stats.peak_queue_depth = max(stats.peak_queue_depth, stats.queue_depth)
+
+        async def seed() -> None:
+            for item in items:
+                await emit(item)
+
+        async def page_worker() -> None:
+            while pending_pages:
+                page = pending_pages.popleft()
+                try:
+                    await crawl_page(page, emit)
+                finally:
+                    stats.pages_done += 1
+
+        async def produce() -> None:
+            await asyncio.gather(seed(), *(page_worker() for _ in range(self.page_workers)))
+            for _ in range(self.item_workers):
+                await queue.put(_CLOSED)
+
+        async def item_worker() -> None:
+            while True:
+                item = await queue.get()
+                stats.queue_depth = queue.qsize()
+                if item is _CLOSED:
+                    return
+                stats.busy += 1
+                try:
+                    await crawl_item(item)
+                finally:
+                    stats.busy -= 1
+                    stats.items_done += 1
+
+        tasks = [asyncio.create_task(produce())]
+        tasks += [asyncio.create_task(item_worker()) for _ in range(self.item_workers)]
+        reporter = asyncio.create_task(self._report()) if self.report_interval else None
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # a failed stage must not leave the other waiting on the queue
+            for task in tasks:
+                task.cancel()
+            if reporter is not None:
+                reporter.cancel()
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(self.report_interval)
+            print(self.progress())
+
+    def progress(self) -> str:
+        stats = self.stats.as_dict()
+        return (
+            f"Pipeline: pages {stats['pages_done']}/{stats['pages']} "
+            f"({stats['pages_per_sec']:.1f}/sec), items {stats['items_done']}/{stats['items_queued']} "
+            f"({stats['items_per_sec']:.1f}/sec), queue {stats['queue_depth']}/{self.queue_size}, "
+            f"{stats['busy']}/{self.item_workers} item workers busy"
+        )
+
+    def summary(self) -> str:
+        stats = self.stats.as_dict()
+        return (
+            f"Crawl pipeline: {stats['pages_done']} pages ({stats['pages_per_sec']:.1f}/sec), "
+            f"{stats['items_done']} items ({stats['items_per_sec']:.1f}/sec) "
+            f"in {stats['seconds']:.1f} s, peak queue {stats['peak_queue_depth']}/{self.queue_size}, "
+            f"page workers waited on a full queue {stats['blocked']} times"
+        )
@@ -0,0 +1,154 @@
+import hashlib
+import types
+
+from grabber.page_cache import source_fingerprint
+
+
+def _code_signature(function) -> tuple:
+    """
+    The bytecode, constants and global names of a post-processor, nested
+    lambdas included. Callables without bytecode (bool, ...) go by name.
+    """
+    code = getattr(function, "__code__", None)
+    if code is None:
+        return (getattr(function, "__qualname__", repr(function)),)
+
+    def signature(code) -> tuple:
+        consts = tuple(
+            signature(const) if isinstance(const, types.CodeType) else const
+            for const in code.co_consts
+        )
+        return (code.co_code, consts, code.co_names)
+
+    return signature(code)
+
+
+class Field:
+    """
+    One field of a site's extraction plan: the tag and synthetic class that
+    hold it, and the post-processor that turns the matched elements into the
+    final value.
+    """
+
+    def __init__(
+        self, tag: str, class_name: str, process=None, first: bool = False
+    ) -> None:
+        """
+        :param tag: The tag name to match, or None for any tag.
+        :param class_name: The synthetic class given by HtmlDecoder.
+        :param process: Called with the matches (a list, or the first match or
+            None when `first` is set); its result is the field value.
+        :param first: Only the first match in document order is needed.
+        """
+        self.tag = tag
+        self.class_name = class_name
+        self.process = process
+        self.first = first
+
+
+class ExtractionPlan:
+    """
+    A declarative field schema compiled into a single lookup table, so every
+    field of a page is filled in one walk of the tree (or one pass of the
+    stream) instead of one find/find_all scan per field.
+    """
+
+    def __init__(self, fields: dict) -> None:
+        """
+        :param fields: Field name to Field, in the order results are returned.
+        """
+        self.fields = fields
+        self._fingerprint = None
+        self._selectors = {}
+        for name, field in fields.items():
+            self._selectors.setdefault((field.tag, field.class_name), []).append(name)
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        A digest of the fields, their selectors, the bytecode of their
+        post-processors and the source of the modules defining those, so
+        cached results are dropped when the plan or a helper its
+        post-processors call changes.
+        """
+        if self._fingerprint is None:
+            parts = [
+                (name, field.tag, field.class_name, field.first, _code_signature(field.process))
+                for name, field in self.fields.items()
+            ]
+            parts.append(source_fingerprint(*(
+                field.process for field in self.fields.values() if field.process is not None
+            )))
+            self._fingerprint = hashlib.blake2b(
+                repr(parts).encode("utf-8"), digest_size=8
+            ).hexdigest()
+        return self._fingerprint
+
+    @property
+    def matches(self) -> list:
+        """
+        The (tag, class) pairs the plan needs, as accepted by
+        HtmlDecoder.iter_matches.
+        """
+        return list(self._selectors)
+
+    def _add(self, found: dict, element) -> None:
+        classes = element.get("class")
+        if not classes:
+            return
+
+        for selector in ((element.name, classes[0]), (None, classes[0])):
+            for name in self._selectors.get(selector, ()):
+                found[name].append(element)
+
+    def _finish(self, found: dict) -> dict:
+        result = {}
+        for name, field in self.fields.items():
+            value = found[name]
+            if field.first:
+                value = value[0] if value else None
+            result[name] = field.process(value) if field.process else value
+        return result
+
+    def run(self, soup) -> dict:
+        """
+        Fills every field in one walk over a tree returned by
+        HtmlDecoder.get_soup.
+
+        :param soup: The rewritten tree.
+        :return: Field name to processed value.
+        """
+        found = {name: [] for name in self.fields}
+        for element in soup.find_all(True):
+            self._add(found, element)
+        return self._finish(found)
+
+    def run_stream(self, decoder) -> dict:
+        """
+        Fills every field from HtmlDecoder.iter_matches, without building a
+        tree. If every field only needs its first match, parsing stops as soon
+        as all of them are found.
+
+        :param decoder: The HtmlDecoder holding the page.
+        :return: Field name to processed value.
+        """
+        found = {name: [] for name in self.fields}
+        stop_early = all(field.first for field in self.fields.values())
+        for element in decoder.iter_matches(self.matches):
+            self._add(found, element)
+            if stop_early and all(found.values()):
+                break
+        return self._finish(found)
+
+    def extract(self, decoder) -> dict:
+        """
+        Runs the plan with the cheapest mode for the decoder's parser backend:
+        the stream for "html.parser", which gives the same elements as its
+        tree, and a single tree walk for the lxml backends.
+
+        :param decoder: The HtmlDecoder holding the page.
+        :return: Field name to processed value.
+        """
+        if decoder.parser == "html.parser":
+            return self.run_stream(decoder)
+        return self.run(decoder.get_soup())
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+
+def record_fingerprint(record: dict) -> str:
+    """
+    :return: A digest of an extracted record, equal for equal records
+        whatever the order of their keys.
+    """
+    data = json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class IndexStats:
+    __slots__ = ("new", "refreshed", "reused", "changed", "delisted")
+
+    def __init__(self) -> None:
+        self.new = 0
+        self.refreshed = 0
+        self.reused = 0
+        self.changed = 0
+        self.delisted = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "new": self.new,
+            "refreshed": self.refreshed,
+            "reused": self.reused,
+            "changed": self.changed,
+            "delisted": self.delisted,
+        }
+
+
+class ListingIndex:
+    """
+    Every listing URL seen so far, in one SQLite file, with when it was first
+    and last seen, its last extracted record and that record's fingerprint.
+    It makes a crawl incremental: the search pages are still crawled in full,
+    since they are what says which listings exist, but a detail page is only
+    fetched for a URL the index does not know, or for a random refresh
+    fraction of the known ones. The others get their last record back.
+
+    Listings belong to a scope (a search, a city). A scope's crawl is framed
+    by begin() and finish(); finish() marks the listings of the scope that
+    were not seen since begin() as delisted, unless a search page of the
+    scope failed and the crawl could not see them all.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: str, refresh: float = 0.1) -> None:
+        """
+        :param path: The SQLite file.
+        :param refresh: Fraction of known listings whose detail page is
+            fetched again anyway, to pick up price and status changes.
+        """
+        self.path = path
+        self.refresh = refresh
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS listings ("
+            "url TEXT PRIMARY KEY, scope TEXT, first_seen REAL, last_seen REAL, "
+            "fetched_at REAL, fingerprint TEXT, record TEXT, delisted_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS listings_scope ON listings (scope)")
+        self._db.commit()
+
+        self._started = {}
+        self._incomplete = set()
+        self.stats = IndexStats()
+
+    def begin(self, scope: str) -> None:
+        """Starts a crawl of a scope."""
+        with self._lock:
+            self._started[scope] = time.time()
+            self._incomplete.discard(scope)
+
+    def incomplete(self, scope: str) -> None:
+        """Records that a search page of the scope failed in this crawl."""
+        with self._lock:
+            self._incomplete.add(scope)
+
+    def reusable(self, url: str) -> dict:
+        """
+        :param url: A listing URL found on a search page.
+        :return: The last record of the listing if its detail page need not
+            be fetched, or None if it is new or picked for a refresh.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT record FROM listings WHERE url = ?", (url,)
+            ).fetchone()
+
+            if row is None or row[0] is None:
+                self.stats.new += 1
+                return None
+            if random.random() < self.refresh:
+                self.stats.refreshed += 1
+                return None
+
+            self.stats.reused += 1
+            return json.loads(row[0])
+
+    def seen(self, scope: str, url: str, record: dict = None) -> None:
+        """
+        Records that a listing is still listed, and its new record if its
+        detail page was fetched.
+
+        :param scope: The search or city it was found in.
+        :param url: The listing URL.
+        :param record: The record extracted from its detail page, if fetched.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO listings (url, scope, first_seen, last_seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (url) DO UPDATE SET scope = excluded.scope, "
+                "last_seen = excluded.last_seen, delisted_at = NULL",
+                (url, scope, now, now),
+            )
+
+            if record is not None:
+                fingerprint = record_fingerprint(record)
+                previous = self._db.execute(
+                    "SELECT fingerprint FROM listings WHERE url = ?", (url,)
+                ).fetchone()[0]
+                if previous is not None and previous != fingerprint:
+                    self.stats.changed += 1
+                self._db.execute(
+                    "UPDATE listings SET fetched_at = ?, fingerprint = ?, record = ? WHERE url = ?",
+                    (now, fingerprint, json.dumps(record, ensure_ascii=False, default=str), url),
+                )
+
+            self._db.commit()
+
+    def finish(self, scope: str) -> int:
+        """
+        Ends the crawl of a scope, marking its listings not seen since
+        begin() as delisted.
+
+        :return: The number of listings delisted now.
+        """
+        with self._lock:
+            started = self._started.pop(scope, None)
+            if started is None or scope in self._incomplete:
+                return 0
+
+            cursor = self._db.execute(
+                "UPDATE listings SET delisted_at = ? "
+                "WHERE scope = ? AND last_seen < ? AND delisted_at IS NULL",
+                (time.time(), scope, started),
+            )
+            self._db.commit()
+            self.stats.delisted += cursor.rowcount
+            return cursor.rowcount
+
+    def delisted(self, scope: str = None) -> list:
+        """
+        :param scope: Only this scope's listings; all of them if None.
+        :return: (url, last record, delisted_at) of the delisted listings.
+        """
+        query = "SELECT url, record, delisted_at FROM listings WHERE delisted_at IS NOT NULL"
+        params = ()
+        if scope is not None:
+            query += " AND scope = ?"
+            params = (scope,)
+
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [(url, json.loads(record) if record else None, at) for url, record, at in rows]
+
+    def summary(self) -> str:
+        stats = self.stats.as_dict()
+        return (
+            f"Listing index: {stats['new']} new, {stats['refreshed']} refreshed, "
+            f"{stats['reused']} reused without fetching, {stats['changed']} changed, "
+            f"{stats['delisted']} delisted"
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,183 @@
+from bs4.builder import HTMLTreeBuilder
+from lxml import etree
+
+from grabber.html_decoder import (
+    ClassPathTrie,
+    EMPTY_TAG_NAME_PATTERN,
+    PUNCTUATION_PATTERN,
+    WHITESPACE_PATTERN,
+    split_list_attributes,
+)
+
+
+class LxmlNode:
+    """
+    A thin, read-only view over an lxml element that mimics the part of the
+    BeautifulSoup Tag API used by the site extractors (find, find_all,
+    get_text, text, attrs and item access).
+    """
+
+    __slots__ = ("_element",)
+
+    def __init__(self, element) -> None:
+        self._element = element
+
+    def _iter_candidates(self, name):
+        return self._element.iterdescendants(name)
+
+    @property
+    def name(self) -> str:
+        return self._element.tag
+
+    @property
+    def attrs(self) -> dict:
+        return split_list_attributes(self._element.tag, dict(self._element.attrib))
+
+    @property
+    def text(self) -> str:
+        return self.get_text()
+
+    def get(self, key: str, default=None):
+        value = self._element.get(key)
+        if value is None:
+            return default
+        return split_list_attributes(self._element.tag, {key: value})[key]
+
+    def __getitem__(self, key: str):
+        return self.attrs[key]
+
+    def find_all(self, name: str = None, class_: str = None, limit: int = None) -> list:
+        """
+        Returns the descendants matching the tag name and class, like
+        BeautifulSoup's find_all(name, class_=...).
+
+        :param name: The tag name to match, or None (or True) for any tag.
+        :param class_: A class that must be present on the tag.
+        :param limit: Stop after this many matches.
+        :return: A list of LxmlNode objects.
+        """
+        if name is True:
+            name = None
+
+        results = []
+        for element in self._iter_candidates(name):
+            if class_ is not None:
+                classes = element.get("class")
+                if classes is None or (
+                    classes != class_ and class_ not in classes.split()
+                ):
+                    continue
+
+            results.append(LxmlNode(element))
+            if limit and len(results) >= limit:
+                break
+
+        return results
+
+    def find(self, name: str = None, class_: str = None):
+        found = self.find_all(name, class_, limit=1)
+        return found[0] if found else None
+
+    def get_text(self, separator: str = "", strip: bool = False) -> str:
+        strings = self._element.itertext()
+        if strip:
+            strings = [string.strip() for string in strings]
+            strings = [string for string in strings if string]
+        return separator.join(strings)
+
+
+class LxmlDocument(LxmlNode):
+    """
+    The document returned by HtmlDecoder.get_soup for the "lxml.html" backend.
+    Searches include the root element, as they do on a BeautifulSoup object.
+    """
+
+    __slots__ = ()
+
+    def _iter_candidates(self, name):
+        return self._element.iter(name)
+
+
+def _drop(element) -> None:
+    """
+    Removes an element but keeps its tail text, merging it into the previous
+    sibling (or the parent) like a BeautifulSoup decompose followed by smooth.
+    """
+    parent = element.getparent()
+    if element.tail:
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or "") + element.tail
+        else:
+            parent.text = (parent.text or "") + element.tail
+    parent.remove(element)
+
+
+def _normalize_text(text):
+    if not text:
+        return None
+
+    text = WHITESPACE_PATTERN.sub(" ", text)
+    if text == " ":
+        return None
+    return PUNCTUATION_PATTERN.sub(r"\1", text)
+
+
+def decode_lxml(html: str, decoder) -> LxmlDocument:
+    """
+    Parses the HTML with lxml and applies the same rewrite and normalization as
+    HtmlDecoder.get_soup, producing identical class paths and text.
+
+    :param html: The input HTML string.
+    :param decoder: The HtmlDecoder whose tag map, removal rules and class
+        path trie are used.
+    :return: The rewritten document.
+    """
+    if not html:
+        raise ValueError("HTML content is not provided")
+
+    parser = etree.HTMLParser(remove_comments=True, remove_pis=True)
+    root = etree.fromstring(html, parser)
+    if root is None:
+        raise ValueError("HTML content is not provided")
+
+    tag_map = decoder.tag_map
+    tags_to_remove = decoder.tags_to_remove
+    attributes_to_ignore = decoder.attributes_to_ignore
+    paths = decoder.paths
+
+    # Unwanted subtrees are cut in C before the Python-level walk; comments and
+    # processing instructions were already dropped by the parser.
+    etree.strip_elements(root, *tags_to_remove, with_tail=False)
+
+    stack = [(root, ClassPathTrie.ROOT)]
+    while stack:
+        element, parent_id = stack.pop()
+        if element.tag in tags_to_remove:
+            _drop(element)
+            continue
+
+        path_id = paths.intern(parent_id, tag_map.get(element.tag, "default"))
+        element.set("class", paths.class_name(path_id))
+        for attr in attributes_to_ignore:
+            element.attrib.pop(attr, None)
+
+        for child in reversed(element):
+            stack.append((child, path_id))
+
+    empty_tags = []
+    for element in root.iter():
+        element.text = _normalize_text(element.text)
+        element.tail = _normalize_text(element.tail)
+        if (
+            element.text is None
+            and len(element) == 0
+            and element.tag not in HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS
+            and EMPTY_TAG_NAME_PATTERN.fullmatch(element.tag)
+        ):
+            empty_tags.append(element)
+
+    for element in empty_tags:
+        _drop(element)
+
+    return LxmlDocument(root)
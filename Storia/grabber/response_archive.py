@@ -0,0 +1,271 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from http import HTTPStatus
+import collections
+import gzip
+import io
+import os
+import re
+import threading
+import uuid
+
+try:
+    import zstandard
+except ImportError:
+    # optional: without it archives are gzip-compressed
+    zstandard = None
+
+
+CHARSET_PATTERN = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+
+# The body is archived decoded, so these must not come back with it.
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+EXTENSIONS = {"zstd": ".warc.zst", "gzip": ".warc.gz"}
+
+
+class ArchivedResponse:
+    """A response read back from an archive."""
+
+    __slots__ = ("url", "status_code", "headers", "content", "date")
+
+    def __init__(self, url: str, status_code: int, headers: dict, content: bytes, date: str) -> None:
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.date = date
+
+    @property
+    def encoding(self) -> str:
+        match = CHARSET_PATTERN.search(self.headers.get("content-type", ""))
+        return match.group(1) if match else None
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+def warc_record(url: str, status_code: int, headers, body: bytes) -> bytes:
+    """
+    :return: A WARC/1.0 response record holding the HTTP status line, the
+        headers (with Content-Length set to the decoded body's) and the body.
+    """
+    try:
+        reason = HTTPStatus(status_code).phrase
+    except ValueError:
+        reason = ""
+
+    lines = [f"HTTP/1.1 {status_code} {reason}"]
+    for name, value in headers.items():
+        if name.lower() not in DROPPED_HEADERS:
+            lines.append(f"{name}: {value}")
+    lines.append(f"Content-Length: {len(body)}")
+    block = ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8") + body
+
+    warc_headers = (
+        "WARC/1.0\r\n"
+        "WARC-Type: response\r\n"
+        f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n"
+        f"WARC-Date: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}\r\n"
+        f"WARC-Target-URI: {url}\r\n"
+        "Content-Type: application/http; msgtype=response\r\n"
+        f"Content-Length: {len(block)}\r\n"
+        "\r\n"
+    )
+    return warc_headers.encode("utf-8") + block + b"\r\n\r\n"
+
+
+class ResponseArchive:
+    """
+    Appends every response a scraper receives - URL, status, headers and
+    body - to WARC files in a directory, one compressed member (a zstd frame,
+    or a gzip member without zstandard installed) per record, so a file is
+    valid however abruptly the crawl stops. Files are rotated at
+    max_bytes. read_archive and replay bring them back without a network.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, directory: str, prefix: str = "crawl", compression: str = None,
+                 max_bytes: int = 512 * 1024 * 1024, level: int = None) -> None:
+        """
+        :param directory: Where the archive files go.
+        :param prefix: Start of their names, e.g. the site.
+        :param compression: "zstd" or "gzip"; zstd when zstandard is
+            installed by default.
+        :param max_bytes: Compressed size at which a new file is started.
+        :param level: Compression level, the codec's default if None.
+        """
+        if compression is None:
+            compression = "zstd" if zstandard is not None else "gzip"
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+
+        self.directory = directory
+        self.prefix = prefix
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.level = level
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.records = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_bytes = 0
+        self._segment = 0
+        self._started = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor(level=self.level or 3).compress(data)
+        return gzip.compress(data, compresslevel=self.level or 6)
+
+    def _open(self) -> None:
+        self._segment += 1
+        name = f"{self.prefix}-{self._started}-{os.getpid()}-{self._segment:05d}"
+        self._file = open(
+            os.path.join(self.directory, name + EXTENSIONS[self.compression]), "ab"
+        )
+        self._file_bytes = 0
+
+    def write(self, url: str, status_code: int, headers, body: bytes) -> None:
+        """
+        Archives a response; compression happens in the calling thread.
+
+        :param headers: The response headers, any mapping.
+        :param body: The decoded body.
+        """
+        member = self._compress(warc_record(url, status_code, headers, body))
+        with self._lock:
+            if self._file is None or self._file_bytes >= self.max_bytes:
+                if self._file is not None:
+                    self._file.close()
+                self._open()
+            self._file.write(member)
+            self._file.flush()
+            self._file_bytes += len(member)
+            self.records += 1
+            self.bytes += len(member)
+
+    def summary(self) -> str:
+        return (
+            f"Archive {self.directory}: {self.records} responses, "
+            f"{self.bytes / 1_000_000:.1f} MB {self.compression}"
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def archive_files(path) -> list:
+    """
+    :param path: An archive file, a directory of them, or a list of either.
+    :return: The archive files, sorted by name, i.e. in the order written.
+    """
+    if isinstance(path, (list, tuple)):
+        return [name for item in path for name in archive_files(item)]
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(path, name)
+            for name in os.listdir(path)
+            if name.endswith(tuple(EXTENSIONS.values()))
+        )
+    return [path]
+
+
+def _open_archive(path: str):
+    if path.endswith(EXTENSIONS["zstd"]):
+        if zstandard is None:
+            raise ValueError(f"{path} needs the zstandard package")
+        stream = zstandard.ZstdDecompressor().stream_reader(
+            open(path, "rb"), read_across_frames=True, closefd=True
+        )
+        return io.BufferedReader(stream)
+    return gzip.open(path, "rb")
+
+
+def _read_headers(stream) -> list:
+    lines = []
+    while True:
+        line = stream.readline()
+        if not line or line in (b"\r\n", b"\n"):
+            return lines
+        lines.append(line.decode("utf-8", errors="replace").rstrip("\r\n"))
+
+
+def read_archive(path):
+    """
+    Reads archive files back, one record at a time.
+
+    :param path: As for archive_files.
+    :return: An iterator of ArchivedResponse.
+    """
+    for name in archive_files(path):
+        with _open_archive(name) as stream:
+            while True:
+                lines = _read_headers(stream)
+                if not lines:
+                    break
+                warc = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+                block = stream.read(int(warc["Content-Length"]))
+                stream.read(4)
+
+                if warc.get("WARC-Type") != "response":
+                    continue
+
+                head, _, body = block.partition(b"\r\n\r\n")
+                head_lines = head.decode("utf-8", errors="replace").split("\r\n")
+                headers = {}
+                for line in head_lines[1:]:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                yield ArchivedResponse(
+                    warc["WARC-Target-URI"],
+                    int(head_lines[0].split(" ")[1]),
+                    headers,
+                    body,
+                    warc.get("WARC-Date"),
+                )
+
+
+def _apply(function, responses: list) -> list:
+    return [function(response) for response in responses]
+
+
+def replay(path, function, workers: int = None, chunk_size: int = 32):
+    """
+    Runs function over every archived response, in worker processes, so
+    decoding and extraction use every core while the archive is read here.
+    At most a few chunks per worker are held in memory at once.
+
+    :param path: As for archive_files.
+    :param function: Called with each ArchivedResponse in a worker; it must
+        be picklable, i.e. a module-level function (or a partial of one).
+    :param workers: Worker processes, one per CPU by default.
+    :param chunk_size: Responses sent to a worker at once.
+    :return: An iterator of what function returns, in archive order.
+    """
+    workers = workers or os.cpu_count() or 4
+    with ProcessPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        chunk = []
+        for response in read_archive(path):
+            chunk.append(response)
+            if len(chunk) == chunk_size:
+                pending.append(executor.submit(_apply, function, chunk))
+                chunk = []
+                if len(pending) >= workers * 4:
+                    yield from pending.popleft().result()
+        if chunk:
+            pending.append(executor.submit(_apply, function, chunk))
+        while pending:
+            yield from pending.popleft().result()
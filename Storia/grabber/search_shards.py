@@ -0,0 +1,240 @@
+import asyncio
+import itertools
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+# roomsNumber values of the site's filter; the larger flats are rare enough
+# to share a shard
+ROOM_SHARDS = (
+    ("ONE",),
+    ("TWO",),
+    ("THREE",),
+    ("FOUR",),
+    ("FIVE", "SIX", "SEVEN", "EIGHT", "NINE", "TEN", "MORE"),
+)
+
+# where an open-ended price band is cut when its first page gives no prices
+PRICE_PIVOT = 100_000
+# price bands are not split below this width, in euro
+MIN_PRICE_BAND = 1_000
+
+
+class SearchShard:
+    """
+    One search of the site: the base search narrowed to a district, a set
+    of room counts and a price band. Shards split from one another never
+    share a listing, except where the site files a listing under several
+    of them; the crawl drops those by URL.
+    """
+
+    def __init__(self, base_url: str, district: str = None, rooms: tuple = None,
+                 price_min: int = None, price_max: int = None) -> None:
+        """
+        :param base_url: The unfiltered search URL, query included.
+        :param district: A path segment below the city, e.g. "sectorul-1".
+        :param rooms: roomsNumber values, e.g. ("ONE", "TWO").
+        :param price_min: Lowest price in euro, included.
+        :param price_max: Highest price in euro, included; None for no limit.
+        """
+        self.base_url = base_url
+        self.district = district
+        self.rooms = rooms
+        self.price_min = price_min
+        self.price_max = price_max
+        self.url = self._url()
+
+        # filled in by ShardPlanner: the first page as parse_search_page
+        # returns it, and the pages of the shard to crawl
+        self.first_page = None
+        self.pages = 0
+
+    def _url(self) -> str:
+        if self.district is None and self.rooms is None and self.price_min is None and self.price_max is None:
+            # the search as given, so its page URLs stay those of earlier runs
+            return self.base_url
+
+        scheme, netloc, path, query, fragment = urlsplit(self.base_url)
+        if self.district is not None:
+            path = f"{path.rstrip('/')}/{self.district}"
+        params = [(key, value) for key, value in parse_qsl(query) if key not in ("roomsNumber", "priceMin", "priceMax")]
+        if self.rooms is not None:
+            params.append(("roomsNumber", f"[{','.join(self.rooms)}]"))
+        if self.price_min is not None:
+            params.append(("priceMin", str(self.price_min)))
+        if self.price_max is not None:
+            params.append(("priceMax", str(self.price_max)))
+        return urlunsplit((scheme, netloc, path, urlencode(params, safe="[],"), fragment))
+
+    def page_url(self, page: int) -> str:
+        if page == 1:
+            return self.url
+        return f"{self.url}{'&' if '?' in self.url else '?'}page={page}"
+
+    def narrow(self, **filters) -> "SearchShard":
+        values = {
+            "district": self.district,
+            "rooms": self.rooms,
+            "price_min": self.price_min,
+            "price_max": self.price_max,
+        }
+        values.update(filters)
+        return SearchShard(self.base_url, **values)
+
+    def split(self, districts: list = None, parts: int = 2) -> list:
+        """
+        Splits the shard along the first filter it does not narrow yet: the
+        district, then the rooms, then the price, whose band is cut at
+        quantiles of the prices on the first page.
+
+        :param districts: The districts of the search, None to not split by
+            district.
+        :param parts: Shards wanted at least, for a price split.
+        :return: The shards, an empty list if the shard cannot be split.
+        """
+        if self.district is None and districts:
+            return [self.narrow(district=district) for district in districts]
+        if self.rooms is None:
+            return [self.narrow(rooms=rooms) for rooms in ROOM_SHARDS]
+        return [
+            self.narrow(price_min=low, price_max=high)
+            for low, high in self.price_bands(parts)
+        ]
+
+    def price_bands(self, parts: int) -> list:
+        low = self.price_min or 0
+        high = self.price_max
+        if high is not None and high - low < MIN_PRICE_BAND:
+            return []
+
+        # the first page is a sample of the shard's results
+        prices = sorted(
+            card['price'] for card in (self.first_page or {}).get('cards', {}).values()
+            if card.get('price') is not None and low <= card['price'] and (high is None or card['price'] <= high)
+        )
+        cuts = sorted({
+            round(prices[len(prices) * part // parts], -3)
+            for part in range(1, parts)
+        }) if prices else []
+        cuts = [cut for cut in cuts if low + MIN_PRICE_BAND <= cut and (high is None or cut <= high)]
+        if not cuts:
+            if high is None:
+                cuts = [max(2 * low, PRICE_PIVOT)]
+            else:
+                cuts = [(low + high + 1) // 2]
+
+        bounds = [low] + cuts + [None if high is None else high + 1]
+        return [
+            (bottom if bottom else None, None if top is None else top - 1)
+            for bottom, top in zip(bounds, bounds[1:])
+        ]
+
+    def __repr__(self) -> str:
+        filters = []
+        if self.district is not None:
+            filters.append(self.district)
+        if self.rooms is not None:
+            filters.append("rooms " + ",".join(self.rooms))
+        if self.price_min is not None or self.price_max is not None:
+            filters.append(f"{self.price_min or 0}-{'' if self.price_max is None else self.price_max} €")
+        return f"SearchShard({'; '.join(filters) or 'all'})"
+
+
+class ShardPlanner:
+    """
+    Splits a search into shards small enough that every one of their
+    results sits within the first page_cap pages, since the site does not
+    serve the pages past its cap, and so a crawl no longer walks one long
+    result list: the pages of the shards are independent and can all be
+    fetched at once. A shard's first page tells its size; shards over the
+    cap are split again and their parts probed concurrently.
+
+    Listings outside every shard's filters are lost to a split: a price
+    split drops the listings without a price, so prices are split last.
+    """
+
+    def __init__(self, probe, page_cap: int = None, districts: list = None,
+                 default_pages: int = 10) -> None:
+        """
+        :param probe: async (shard) fetching the shard's first page; returns
+            it as parse_search_page does, or None if it failed.
+        :param page_cap: Pages the site serves per search; None to crawl the
+            search as one.
+        :param districts: Districts to split the search by first, as path
+            segments below the city.
+        :param default_pages: Pages crawled of a shard whose first page does
+            not tell how many it has.
+        """
+        self.probe = probe
+        self.page_cap = page_cap
+        self.districts = districts
+        self.default_pages = default_pages
+
+        self.probes = 0
+        self.failed = 0
+        self.capped = []
+
+    async def plan(self, search: SearchShard) -> list:
+        """
+        :return: Every shard probed, first pages included; the pages of
+            those that were split are covered by their parts and set to 0.
+        """
+        self.probes = self.failed = 0
+        self.capped = []
+        return await self._plan(search)
+
+    async def _plan(self, shard: SearchShard) -> list:
+        self.probes += 1
+        shard.first_page = await self.probe(shard)
+        if shard.first_page is None:
+            self.failed += 1
+            return []
+
+        last_page = shard.first_page['last_page']
+        shard.pages = last_page if last_page is not None else self.default_pages
+        if not self.page_cap or shard.pages <= self.page_cap:
+            return [shard]
+
+        parts = shard.split(self.districts, -(-shard.pages // self.page_cap))
+        if not parts:
+            # as much of it as the site serves
+            shard.pages = self.page_cap
+            self.capped.append(shard)
+            return [shard]
+
+        shard.pages = 0
+        planned = await asyncio.gather(*(self._plan(part) for part in parts))
+        return [shard] + [part for shards in planned for part in shards]
+
+    def exhaustive(self, shards: list) -> bool:
+        """
+        :return: Whether the shards hold every result of the search: no
+            probe failed, none was left over the cap and none was split by
+            price, which drops the listings without one.
+        """
+        return not self.failed and not self.capped and all(
+            shard.price_min is None and shard.price_max is None for shard in shards
+        )
+
+    def page_urls(self, shards: list) -> list:
+        """
+        :return: The URLs of every shard's pages but the first, one page of
+            each shard in turn, so the shards are crawled side by side.
+        """
+        pages = [
+            [shard.page_url(page) for page in range(2, shard.pages + 1)]
+            for shard in shards
+        ]
+        return [url for turn in itertools.zip_longest(*pages) for url in turn if url is not None]
+
+    def summary(self, shards: list) -> str:
+        crawled = [shard for shard in shards if shard.pages]
+        summary = (
+            f"Search planned as {len(crawled)} shards of at most "
+            f"{max((shard.pages for shard in crawled), default=0)} pages, "
+            f"{sum(shard.pages for shard in crawled)} pages in all, after {self.probes} probes"
+        )
+        if self.failed:
+            summary += f", {self.failed} of them failed"
+        if self.capped:
+            summary += f"; {len(self.capped)} shards could not be split under the cap: {self.capped}"
+        return summary
@@ -0,0 +1,11 @@
+import sys
+
+from grabber.Storia import Storia
+
+# Re-extracts every listing kept by `python3 run.py --archive`, with the
+# current extraction plans and no network:
+#
+#     python3 replay.py [archive directory or files]
+if __name__ == "__main__":
+    storia = Storia()
+    storia.replay(sys.argv[1:] or "archive")
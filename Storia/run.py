@@ -1,5 +1,38 @@
+import sys
+
 from grabber.Storia import Storia
+from grabber.page_cache import PageCache
+from grabber.http_cache import HttpCache
+from grabber.resilience import DeadLetterQueue
+from grabber.listing_index import ListingIndex
+from grabber.crawl_frontier import CrawlFrontier
+from grabber.response_archive import ResponseArchive
 
-storia = Storia("https://www.storia.ro/ro/rezultate/vanzare/apartament/bucuresti?limit=36&ownerTypeSingleSelect=ALL&by=BEST_MATCH&direction=DESC&viewType=listing")
+# unchanged pages are revalidated instead of downloaded again, and their
+# extraction results come from the page cache; listings already in the index
+# are not fetched again, except for a 10% refresh sample
+storia = Storia(
+    "https://www.storia.ro/ro/rezultate/vanzare/apartament/bucuresti?limit=36&ownerTypeSingleSelect=ALL&by=BEST_MATCH&direction=DESC&viewType=listing",
+    cache=PageCache(path="cache/pages.sqlite"),
+    http_cache=HttpCache("cache/http.sqlite"),
+    dead_letters=DeadLetterQueue("cache/dead-letters.jsonl"),
+    index=ListingIndex("cache/listings.sqlite", refresh=0.1),
+    # a killed run resumes where it stopped when started again
+    frontier=CrawlFrontier("cache/frontier.sqlite"),
+    # with --archive every response is kept for replay.py
+    archive=ResponseArchive("archive", prefix="storia") if "--archive" in sys.argv[1:] else None,
+    # with --shallow only the search pages are fetched: title, price, price/m²,
+    # area and rooms come from the result cards
+    depth=Storia.SHALLOW if "--shallow" in sys.argv[1:] else Storia.DEEP,
+    # records are written as they arrive, as JSON lines with --jsonl
+    output_format="jsonl" if "--jsonl" in sys.argv[1:] else "csv",
+    # with --sharded the search is split by rooms and price into searches of
+    # at most 100 pages, past the pagination cap, crawled side by side
+    shard_pages=100 if "--sharded" in sys.argv[1:] else None,
+)
 
-storia.fetch_listings()
\ No newline at end of file
+if "--redrive" in sys.argv[1:]:
+    # only the pages that failed after every retry in earlier runs
+    storia.redrive()
+else:
+    storia.fetch_listings()
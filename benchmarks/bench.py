@@ -0,0 +1,334 @@
+"""
+Offline micro-benchmarks over the checked-in HTML fixtures.
+
+Times the decoder (get_html, get_json, the re-parse of its output, get_soup)
+and each site's field extraction on Storia/dump.html, KorterScraper/dump.html,
+ImobiliareScraper/sample.html and SkiaOneScraper/sample_details.html, then
+compares pages/sec and peak memory with benchmarks/baseline.json. No network
+is used and the page caches are bypassed.
+
+    python3 benchmarks/bench.py                    # run and compare
+    python3 benchmarks/bench.py --update-baseline  # store a new baseline
+    python3 benchmarks/bench.py --site korter --parser lxml
+
+Every scraper ships its own `grabber` package, so each site runs in its own
+interpreter with the scraper directory as working directory. Speed is compared
+on the median page, and a case that looks slower or heavier than the baseline
+by more than the tolerance is measured again in fresh interpreters (--confirm
+times); only a regression that every re-run repeats fails the run, with exit
+code 1. Baselines are machine specific: refresh them on the box the
+comparisons run on, and with every change to a benchmarked path.
+"""
+
+import argparse
+import gc
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+SITES = {
+    "storia": "Storia",
+    "korter": "KorterScraper",
+    "skiaone": "SkiaOneScraper",
+}
+
+
+def read_fixture(path: str) -> str:
+    with open(os.path.join(ROOT, path), encoding="utf-8") as f:
+        return f.read()
+
+
+def decoder_cases(prefix: str, html: str, parser: str) -> dict:
+    from bs4 import BeautifulSoup
+    from grabber.html_decoder import HtmlDecoder
+
+    return {
+        f"{prefix}/get_html": lambda: HtmlDecoder(html, parser=parser).get_html(),
+        f"{prefix}/get_json": lambda: HtmlDecoder(html, parser=parser).get_json(),
+        f"{prefix}/reparse": lambda: BeautifulSoup(
+            HtmlDecoder(html, parser=parser).get_html(), "html.parser"
+        ),
+        f"{prefix}/get_soup": lambda: HtmlDecoder(html, parser=parser).get_soup(),
+    }
+
+
+def uncached(cache_owner) -> None:
+    """Turns a scraper's PageCache into a pass-through, so every round decodes."""
+    cache_owner.cache.max_entries = 0
+
+
+def storia_cases(parser: str) -> dict:
+    from grabber.Storia import STORIA_SEARCH_PLAN, Storia
+
+    html = read_fixture("Storia/dump.html")
+    storia = Storia(parser=parser)
+    uncached(storia)
+
+    cases = decoder_cases("storia", html, parser)
+    cases["storia/extract_listing"] = lambda: storia.parse_listing("/", html)
+    cases["storia/extract_search"] = lambda: storia.extract(STORIA_SEARCH_PLAN, html)
+    cases.update(
+        decoder_cases("imobiliare", read_fixture("ImobiliareScraper/sample.html"), parser)
+    )
+    return cases
+
+
+def korter_cases(parser: str) -> dict:
+    from grabber.Korter import KORTER_PAGE_PLAN, KORTER_SEARCH_PLAN, Korter
+
+    html = read_fixture("KorterScraper/dump.html")
+    korter = Korter(parser=parser)
+    uncached(korter)
+
+    cases = decoder_cases("korter", html, parser)
+    cases["korter/extract_search"] = lambda: korter.extract_listing_pages(
+        korter.extract(KORTER_SEARCH_PLAN, html)["pages"]
+    )
+    cases["korter/extract_page"] = lambda: korter.extract(KORTER_PAGE_PLAN, html)
+    cases["korter/extract_listing"] = lambda: korter.parse_listing(html)
+    return cases
+
+
+def skiaone_cases(parser: str) -> dict:
+    from grabber.SkiaOneScraper import parse_property_details
+
+    html = read_fixture("SkiaOneScraper/sample_details.html")
+    return {"skiaone/extract_details": lambda: parse_property_details(html, parser)}
+
+
+CASES = {
+    "storia": storia_cases,
+    "korter": korter_cases,
+    "skiaone": skiaone_cases,
+}
+
+
+def measure(function, rounds: int, min_time: float) -> dict:
+    """
+    :return: The best and median seconds per page over at least `rounds` calls
+        (and at least min_time seconds), and the lowest tracemalloc peak of
+        three more calls. pages/sec is taken from the median round, which one
+        lucky or unlucky round does not move, and is what the baseline compares.
+    """
+    function()
+
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < rounds or time.perf_counter() - started < min_time:
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    peak = None
+    for _ in range(3):
+        gc.collect()
+        tracemalloc.start()
+        function()
+        _, traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak = traced if peak is None else min(peak, traced)
+
+    median = statistics.median(timings)
+    return {
+        "rounds": len(timings),
+        "best_ms": min(timings) * 1000,
+        "median_ms": median * 1000,
+        "pages_per_sec": 1 / median if median else float("inf"),
+        "peak_kb": peak / 1024,
+    }
+
+
+def run_worker(site: str, parser: str, rounds: int, min_time: float, cases: list = None) -> None:
+    sys.path.insert(0, os.getcwd())
+    results = {
+        name: measure(function, rounds, min_time)
+        for name, function in CASES[site](parser).items()
+        if not cases or name in cases
+    }
+    json.dump(results, sys.stdout)
+
+
+def run_site(site: str, parser: str, rounds: int, min_time: float, cases: list = None) -> dict:
+    """
+    :param cases: The cases to measure, all of the site's if None.
+    """
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--worker",
+        site,
+        "--parser",
+        parser,
+        "--rounds",
+        str(rounds),
+        "--min-time",
+        str(min_time),
+    ]
+    for case in cases or ():
+        command += ["--case", case]
+    output = subprocess.run(
+        command,
+        cwd=os.path.join(ROOT, SITES[site]),
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+    return json.loads(output)
+
+
+def median_results(runs: list) -> dict:
+    """
+    :param runs: Results of the same cases, one dict per run.
+    :return: Per case, the median of every number over the runs.
+    """
+    return {
+        name: {
+            key: statistics.median(run[name][key] for run in runs)
+            for key in runs[0][name]
+        }
+        for name in runs[0]
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float, memory_tolerance: float) -> dict:
+    """
+    :return: Case name to its messages, for every case that regressed against
+        the baseline.
+    """
+    regressions = {}
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+
+        slowest = expected["pages_per_sec"] * (1 - tolerance)
+        if result["pages_per_sec"] < slowest:
+            regressions.setdefault(name, []).append(
+                f"{name}: {result['pages_per_sec']:.1f} pages/sec, "
+                f"baseline {expected['pages_per_sec']:.1f}"
+            )
+
+        heaviest = expected["peak_kb"] * (1 + memory_tolerance)
+        if result["peak_kb"] > heaviest:
+            regressions.setdefault(name, []).append(
+                f"{name}: peak {result['peak_kb']:.0f} KB, "
+                f"baseline {expected['peak_kb']:.0f} KB"
+            )
+    return regressions
+
+
+def confirm(regressions: dict, sites: list, options, baseline: dict) -> dict:
+    """
+    Measures the regressed cases again, each time in fresh interpreters, and
+    keeps those that regress in every re-run, with their last messages.
+    """
+    for attempt in range(options.confirm):
+        if not regressions:
+            break
+        print(f"Re-measuring {len(regressions)} regressed cases ({attempt + 1}/{options.confirm})...")
+        results = {}
+        for site in sites:
+            cases = [name for name in regressions if name.split("/")[0] in site_prefixes(site)]
+            if cases:
+                results.update(run_site(site, options.parser, options.rounds, options.min_time, cases))
+        again = compare(results, baseline, options.tolerance, options.memory_tolerance)
+        regressions = {name: again[name] for name in regressions if name in again}
+    return regressions
+
+
+def site_prefixes(site: str) -> tuple:
+    """The case prefixes a site's worker measures."""
+    return ("storia", "imobiliare") if site == "storia" else (site,)
+
+
+def print_table(results: dict, baseline: dict) -> None:
+    print(
+        f"{'case':32} {'best':>10} {'median':>10} {'pages/sec':>10} {'peak':>10} {'vs base':>8}"
+    )
+    for name, result in results.items():
+        expected = baseline.get(name)
+        change = (
+            f"{result['pages_per_sec'] / expected['pages_per_sec'] - 1:+.0%}"
+            if expected
+            else "new"
+        )
+        print(
+            f"{name:32} {result['best_ms']:8.2f}ms {result['median_ms']:8.2f}ms "
+            f"{result['pages_per_sec']:10.1f} "
+            f"{result['peak_kb']:8.0f}KB {change:>8}"
+        )
+
+
+def main() -> int:
+    arguments = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arguments.add_argument("--site", choices=sorted(SITES), action="append")
+    arguments.add_argument("--parser", default="html.parser")
+    arguments.add_argument("--rounds", type=int, default=20)
+    arguments.add_argument("--min-time", type=float, default=1.0)
+    arguments.add_argument("--tolerance", type=float, default=0.25,
+                           help="allowed pages/sec drop, as a fraction")
+    arguments.add_argument("--memory-tolerance", type=float, default=0.10,
+                           help="allowed peak memory growth, as a fraction")
+    arguments.add_argument("--confirm", type=int, default=2,
+                           help="re-runs a regression must repeat in before it fails the run")
+    arguments.add_argument("--update-baseline", action="store_true")
+    arguments.add_argument("--baseline-runs", type=int, default=3,
+                           help="runs whose median --update-baseline stores, so one fast run "
+                                "does not set the bar")
+    arguments.add_argument("--worker", choices=sorted(SITES), help=argparse.SUPPRESS)
+    arguments.add_argument("--case", action="append", help=argparse.SUPPRESS)
+    options = arguments.parse_args()
+
+    if options.worker:
+        run_worker(options.worker, options.parser, options.rounds, options.min_time, options.case)
+        return 0
+
+    baselines = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE, encoding="utf-8") as f:
+            baselines = json.load(f)
+    baseline = baselines.get(options.parser, {})
+
+    sites = options.site or sorted(SITES)
+    runs = []
+    for _ in range(options.baseline_runs if options.update_baseline else 1):
+        results = {}
+        for site in sites:
+            results.update(run_site(site, options.parser, options.rounds, options.min_time))
+        runs.append(results)
+    results = median_results(runs)
+
+    print_table(results, baseline)
+
+    if options.update_baseline:
+        baseline.update(
+            {
+                name: {"pages_per_sec": round(result["pages_per_sec"], 1),
+                       "peak_kb": round(result["peak_kb"])}
+                for name, result in results.items()
+            }
+        )
+        baselines[options.parser] = baseline
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline for {options.parser} written to {BASELINE}")
+        return 0
+
+    regressions = compare(results, baseline, options.tolerance, options.memory_tolerance)
+    regressions = confirm(regressions, sites, options, baseline)
+    for messages in regressions.values():
+        for message in messages:
+            print(f"REGRESSION {message}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
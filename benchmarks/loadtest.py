@@ -0,0 +1,257 @@
+"""
+End-to-end throughput of the scrapers against the local stand-in server.
+
+Starts benchmarks/standin_server.py once per scenario (latency distribution,
+error rate, rate limit) and runs each site's crawl against it at every
+concurrency level, then prints pages/sec, records/sec, the client-side
+p50/p95/p99 latency, retries and peak memory per configuration:
+
+    python3 benchmarks/loadtest.py
+    python3 benchmarks/loadtest.py --scenario flaky --site korter --concurrency 16 64
+    python3 benchmarks/loadtest.py --pages 20 --json results.json
+    python3 benchmarks/loadtest.py --site storia --depth shallow
+    python3 benchmarks/loadtest.py --site storia --pages 40 --page-cap 10
+
+Every scraper ships its own `grabber` package, so each run is a worker
+interpreter with the scraper directory as working directory, as in bench.py.
+The stand-in host's rate limiter is raised to --rate so the scrapers, not
+the politeness defaults, are measured; the server's own rate limit is what
+the "throttled" scenario exercises. On a small machine the server competes
+with the scraper for CPU: compare runs made on the same box.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = os.path.join(ROOT, "benchmarks", "standin_server.py")
+
+SITES = {
+    "storia": "Storia",
+    "korter": "KorterScraper",
+    "skiaone": "SkiaOneScraper",
+}
+
+# standin_server.py arguments per scenario
+SCENARIOS = {
+    "clean": ["--latency-ms", "50", "--sigma", "0.3"],
+    # Storia search pages without the Next.js state: every listing's detail page is fetched
+    "dom-only": ["--latency-ms", "50", "--sigma", "0.3", "--no-next-data"],
+    "slow-tail": ["--latency-ms", "80", "--sigma", "0.8", "--slow-rate", "0.02", "--slow-ms", "2000"],
+    "flaky": ["--latency-ms", "80", "--sigma", "0.5", "--error-rate", "0.05", "--drop-rate", "0.01"],
+    "throttled": ["--latency-ms", "50", "--sigma", "0.3", "--rate-limit", "40"],
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def standin(scenario: str, pages: int, seed: int, page_cap: int = 0):
+    """Runs the stand-in server for one scenario; yields its address."""
+    port = free_port()
+    command = [sys.executable, SERVER, "--port", str(port), "--pages", str(pages),
+               "--seed", str(seed), "--page-cap", str(page_cap)] + SCENARIOS[scenario]
+    server = subprocess.Popen(command, stderr=subprocess.DEVNULL)
+    address = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(address + "/__stats", timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError(f"The stand-in server did not start on {address}")
+        yield address
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def crawl_storia(address: str, concurrency: int, depth: str, page_cap: int) -> int:
+    from grabber.Storia import Storia
+
+    storia = Storia(
+        f"{address}/ro/rezultate/vanzare/apartament/bucuresti?limit=36",
+        root_url=address,
+        concurrency=concurrency,
+        per_host=concurrency,
+        depth=depth,
+        # split into searches under the stand-in's cap
+        shard_pages=page_cap or None,
+    )
+    return len(asyncio.run(storia.crawl()))
+
+
+def crawl_korter(address: str, concurrency: int, depth: str, page_cap: int) -> int:
+    from grabber.Korter import Korter
+
+    korter = Korter(root_url=address, concurrency=concurrency, per_host=concurrency)
+    records = asyncio.run(
+        korter.crawl_city(f"{address}/vanzare-apartamente-bucuresti", "bucuresti")
+    )
+    return len(records or [])
+
+
+def crawl_skiaone(address: str, concurrency: int, depth: str, page_cap: int) -> int:
+    from concurrent.futures import ThreadPoolExecutor
+    from grabber.SkiaOneScraper import SkiaOneScrapper
+    from grabber.http_client import configure
+
+    # grab_all.py and grab_filtered.py: one pooled connection per worker thread
+    scraper = SkiaOneScrapper(client=configure(pool_size=concurrency), main_url=address)
+    last_page = scraper.grab_last_page({})
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pages = executor.map(lambda page: scraper.filtered_properties({}, page), range(last_page))
+        return sum(len(page) for page in pages)
+
+
+CRAWLS = {
+    "storia": crawl_storia,
+    "korter": crawl_korter,
+    "skiaone": crawl_skiaone,
+}
+
+
+def run_worker(site: str, address: str, concurrency: int, rate: float, depth: str,
+               page_cap: int) -> None:
+    sys.path.insert(0, os.getcwd())
+    from urllib.parse import urlsplit
+    from grabber.rate_limiter import get_limiter
+    from grabber.resilience import get_resilience
+
+    host = urlsplit(address).netloc
+    get_limiter().configure(host, rate=rate, burst=rate, max_rate=rate)
+    # backoff scaled to a local server, so a flaky scenario ends in seconds
+    policy = get_resilience().policy
+    policy.base, policy.cap = 0.1, 2.0
+
+    logging.disable(logging.CRITICAL)
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        records = CRAWLS[site](address, concurrency, depth, page_cap)
+    elapsed = time.perf_counter() - started
+
+    stats = get_limiter().stats().get(host, {})
+    result = {
+        "records": records,
+        "requests": stats.get("requests", 0),
+        "seconds": elapsed,
+        "pages_per_sec": stats.get("requests", 0) / elapsed,
+        "records_per_sec": records / elapsed,
+        "p50_ms": stats.get("p50_ms", 0.0),
+        "p95_ms": stats.get("p95_ms", 0.0),
+        "p99_ms": stats.get("p99_ms", 0.0),
+        "throttled": stats.get("throttled", 0),
+        "retries": get_resilience().retries,
+        # kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    json.dump(result, sys.stdout)
+
+
+def run_site(site: str, address: str, concurrency: int, rate: float, depth: str,
+             page_cap: int) -> dict:
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--worker",
+        site,
+        "--address",
+        address,
+        "--concurrency",
+        str(concurrency),
+        "--rate",
+        str(rate),
+        "--depth",
+        depth,
+        "--page-cap",
+        str(page_cap),
+    ]
+    output = subprocess.run(
+        command,
+        cwd=os.path.join(ROOT, SITES[site]),
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+    return json.loads(output)
+
+
+def print_table(results: list) -> None:
+    print(
+        f"{'scenario':10} {'site':8} {'conc':>5} {'records':>8} {'pages/s':>8} "
+        f"{'recs/s':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'retries':>7} {'429':>5} {'rss':>7}"
+    )
+    for result in results:
+        print(
+            f"{result['scenario']:10} {result['site']:8} {result['concurrency']:5d} "
+            f"{result['records']:8d} {result['pages_per_sec']:8.1f} "
+            f"{result['records_per_sec']:8.1f} {result['p50_ms']:5.0f}ms "
+            f"{result['p95_ms']:5.0f}ms {result['p99_ms']:5.0f}ms "
+            f"{result['retries']:7d} {result['throttled']:5d} {result['peak_rss_mb']:5.0f}MB"
+        )
+
+
+def main() -> int:
+    arguments = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arguments.add_argument("--site", choices=sorted(SITES), action="append")
+    arguments.add_argument("--scenario", choices=list(SCENARIOS), action="append")
+    arguments.add_argument("--concurrency", type=int, nargs="+", default=[8, 32],
+                           help="requests in flight (worker threads for skiaone)")
+    arguments.add_argument("--pages", type=int, default=5,
+                           help="search pages the stand-in serves per search")
+    arguments.add_argument("--rate", type=float, default=1000.0,
+                           help="requests/sec the client's limiter allows the stand-in")
+    arguments.add_argument("--depth", choices=["deep", "shallow"], default="deep",
+                           help="Storia's crawl depth; the other sites only crawl deep")
+    arguments.add_argument("--page-cap", type=int, default=0,
+                           help="Storia search pages the stand-in serves per search; "
+                                "Storia shards its search under it. 0 for no cap")
+    arguments.add_argument("--seed", type=int, default=1)
+    arguments.add_argument("--json", help="also write the results to this file")
+    arguments.add_argument("--worker", choices=sorted(SITES), help=argparse.SUPPRESS)
+    arguments.add_argument("--address", help=argparse.SUPPRESS)
+    options = arguments.parse_args()
+
+    if options.worker:
+        run_worker(options.worker, options.address, options.concurrency[0], options.rate,
+                   options.depth, options.page_cap)
+        return 0
+
+    results = []
+    for scenario in options.scenario or list(SCENARIOS):
+        for site in options.site or sorted(SITES):
+            for concurrency in options.concurrency:
+                # a fresh server per run, so its rate limit and counters start over
+                with standin(scenario, options.pages, options.seed, options.page_cap) as address:
+                    result = run_site(site, address, concurrency, options.rate, options.depth,
+                                      options.page_cap)
+                result.update(scenario=scenario, site=site, concurrency=concurrency)
+                results.append(result)
+
+    print_table(results)
+
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
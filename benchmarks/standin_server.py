@@ -0,0 +1,419 @@
+"""
+A local stand-in for storia.ro, korter.ro and skia.one.ro, for end-to-end
+throughput tests of the scrapers without touching the real sites.
+
+Serves pages shaped like each site's, built from the checked-in fixtures:
+Storia search pages (synthesized along STORIA_SEARCH_PLAN, with the cards
+in a __NEXT_DATA__ state as on the real site, filtered by district, rooms
+and price and paginated up to an optional cap) and detail pages
+(Storia/dump.html), Korter city pages (KorterScraper/dump.html) and listing
+pages (synthesized along KORTER_LISTING_PLAN), SkiaOne result pages
+(synthesized) and details pages (SkiaOneScraper/sample_details.html). Every
+listing page differs, so the page caches do not short-circuit the decoding.
+
+Latency, failures and rate limiting are configurable:
+
+    python3 benchmarks/standin_server.py --port 8900
+    python3 benchmarks/standin_server.py --latency-ms 150 --sigma 0.6 \\
+        --slow-rate 0.01 --slow-ms 3000 --error-rate 0.02 --rate-limit 200
+
+The scrapers are pointed at it with their root_url / main_url arguments, see
+benchmarks/loadtest.py. GET /__stats returns the requests served by status.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import math
+import os
+import random
+import re
+import sys
+import time
+import zlib
+
+from aiohttp import web
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STORIA_SEARCH_PATH = "/ro/rezultate/vanzare/apartament/bucuresti"
+STORIA_PER_PAGE = 36
+STORIA_ROOMS = ["ONE", "TWO", "THREE", "FOUR", "FIVE"]
+SKIAONE_PER_PAGE = 12
+
+
+def read_fixture(path: str) -> str:
+    with open(os.path.join(ROOT, path), encoding="utf-8") as f:
+        return f.read()
+
+
+def nest(tags: list, inner: str) -> str:
+    """Wraps inner in the tags, the first one outermost."""
+    for tag in reversed(tags):
+        inner = f"<{tag}>{inner}</{tag}>"
+    return inner
+
+
+def page_random(request: web.Request) -> random.Random:
+    """The same numbers for the same URL, so a page is stable across requests."""
+    return random.Random(zlib.crc32(request.path_qs.encode("utf-8")))
+
+
+def page_number(request: web.Request, first: int = 1) -> int:
+    try:
+        return int(request.query.get("page", first))
+    except ValueError:
+        return first
+
+
+class StandinSite:
+    """The page templates, the failure knobs and the counters of the server."""
+
+    def __init__(
+        self,
+        pages: int = 10,
+        latency_ms: float = 50.0,
+        sigma: float = 0.5,
+        slow_rate: float = 0.0,
+        slow_ms: float = 2000.0,
+        error_rate: float = 0.0,
+        drop_rate: float = 0.0,
+        rate_limit: float = 0.0,
+        next_data: bool = True,
+        page_cap: int = 0,
+        seed: int = None,
+    ) -> None:
+        """
+        :param pages: Search pages per search or city; for Storia the pages
+            of the unfiltered search, which its filters narrow.
+        :param latency_ms: Median response time; latencies are lognormal
+            around it.
+        :param sigma: Spread of the lognormal, 0 for a fixed latency.
+        :param slow_rate: Fraction of responses delayed by slow_ms on top,
+            the tail that a lognormal alone does not give.
+        :param slow_ms: Extra delay of the slow responses.
+        :param error_rate: Fraction answered 500 or 503.
+        :param drop_rate: Fraction whose connection is closed unanswered.
+        :param rate_limit: Requests per second over all sites, answered 429
+            with a Retry-After above it; 0 for no limit.
+        :param next_data: Embed the Next.js state in Storia search pages;
+            every twelfth card in it has no price, as for hidden prices.
+        :param page_cap: Storia search pages served per search; the ones
+            past it are empty, as on the real site. 0 for no cap.
+        :param seed: Seed of the latency and failure draws.
+        """
+        self.pages = pages
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.rate_limit = rate_limit
+        self.next_data = next_data
+        self.page_cap = page_cap
+        self.random = random.Random(seed)
+        # every search of the stand-in is a filter over the same listings
+        self.storia_ads = [self._storia_ad(number) for number in range(pages * STORIA_PER_PAGE)]
+
+        self._tokens = rate_limit
+        self._updated = time.monotonic()
+        self.statuses = collections.Counter()
+        self.started = time.time()
+
+        self.storia_detail_html = self._storia_detail_template()
+        self.korter_city_html = self._korter_city_template()
+        self.skiaone_details_html = read_fixture("SkiaOneScraper/sample_details.html")
+
+    @staticmethod
+    def _storia_detail_template() -> str:
+        html = read_fixture("Storia/dump.html")
+        # @title@, @price@ and @per_sqm@ are filled per request
+        html = html.replace(
+            ">Apartament 2 camere de vanzare||aproape de metrou Aparatorii Patriei</h1>",
+            ">@title@</h1>",
+        )
+        return html.replace("59 339 €", "@price@ €").replace("1 390 €/m²", "@per_sqm@ €/m²")
+
+    @staticmethod
+    def _storia_ad(number: int) -> dict:
+        draw = random.Random(number)
+        area = draw.randint(35, 120)
+        per_sqm = draw.randint(1200, 3500)
+        return {
+            "slug": f"standin-{number}",
+            "title": f"Apartament {number}",
+            "agency": {"name": "Stand-in Imobiliare"} if number % 3 else None,
+            # every twelfth price is hidden, and no price filter finds it
+            "totalPrice": {"value": area * per_sqm, "currency": "EUR"} if number % 12 else None,
+            "pricePerSquareMeter": {"value": per_sqm, "currency": "EUR"},
+            "areaInSquareMeters": area,
+            "roomsNumber": STORIA_ROOMS[min(int(draw.expovariate(0.6)), len(STORIA_ROOMS) - 1)],
+            "location": {"reverseGeocoding": {"locations": [
+                {"fullName": "Bucuresti"},
+                {"fullName": f"Sectorul {draw.randint(1, 6)}, Bucuresti"},
+            ]}},
+        }
+
+    def storia_results(self, request: web.Request) -> list:
+        """The listings a Storia search asks for, by district, rooms and price."""
+        ads = self.storia_ads
+        district = request.match_info.get("district")
+        if district is not None:
+            sector = f"Sectorul {district.rsplit('-', 1)[-1]}, Bucuresti"
+            ads = [ad for ad in ads if ad["location"]["reverseGeocoding"]["locations"][-1]["fullName"] == sector]
+        rooms = request.query.get("roomsNumber")
+        if rooms:
+            rooms = set(rooms.strip("[]").split(","))
+            ads = [ad for ad in ads if ad["roomsNumber"] in rooms]
+        low = request.query.get("priceMin")
+        high = request.query.get("priceMax")
+        if low or high:
+            ads = [
+                ad for ad in ads
+                if ad["totalPrice"]
+                and (not low or ad["totalPrice"]["value"] >= int(low))
+                and (not high or ad["totalPrice"]["value"] <= int(high))
+            ]
+        return ads
+
+    @staticmethod
+    def _korter_city_template() -> str:
+        html = read_fixture("KorterScraper/dump.html")
+        # pagination links point at the served city, listing links at the
+        # served listings; @city@ and @page@ are filled per request
+        html = re.sub(
+            r'href="/vanzare-apartamente-bucure%C8%99ti(\?page=(\d+))?"',
+            lambda match: f'href="/vanzare-apartamente-@city@?page=@page{match.group(2) or 1}@"',
+            html,
+        )
+        listing = iter(range(1000))
+        return re.sub(
+            r'href="/[^"?#/]+/[^"?#/]+/\d+"',
+            lambda match: f'href="/standin-@city@/page-@page@/{next(listing)}"',
+            html,
+        )
+
+    def latency(self) -> float:
+        """:return: Seconds to wait before answering."""
+        delay = self.latency_ms
+        if self.sigma:
+            delay *= math.exp(self.sigma * self.random.gauss(0, 1))
+        if self.random.random() < self.slow_rate:
+            delay += self.slow_ms
+        return delay / 1000
+
+    def _take_token(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.rate_limit, self._tokens + (now - self._updated) * self.rate_limit)
+        self._updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    @web.middleware
+    async def conditions(self, request: web.Request, handler):
+        """Applies the rate limit, the latency and the failures to every page."""
+        if request.path == "/__stats":
+            return await handler(request)
+
+        if self.rate_limit and not self._take_token():
+            self.statuses[429] += 1
+            return web.Response(status=429, headers={"Retry-After": "1"})
+
+        await asyncio.sleep(self.latency())
+
+        draw = self.random.random()
+        if draw < self.drop_rate:
+            self.statuses["dropped"] += 1
+            request.transport.close()
+            raise asyncio.CancelledError()
+        if draw < self.drop_rate + self.error_rate:
+            status = self.random.choice((500, 503))
+            self.statuses[status] += 1
+            return web.Response(status=status, text="stand-in failure")
+
+        response = await handler(request)
+        self.statuses[response.status] += 1
+        return response
+
+    def html(self, text: str) -> web.Response:
+        return web.Response(text=text, content_type="text/html", charset="utf-8")
+
+    async def storia_search(self, request: web.Request) -> web.Response:
+        page = page_number(request)
+        results = self.storia_results(request)
+        total_pages = math.ceil(len(results) / STORIA_PER_PAGE)
+        if page > total_pages or (self.page_cap and page > self.page_cap):
+            return self.html(nest(["html", "body"], "Nu am gasit anunturi"))
+
+        first = (page - 1) * STORIA_PER_PAGE
+        ads = results[first:first + STORIA_PER_PAGE]
+        pagination = nest(
+            ["div"] * 12,
+            f"{first + 1}-{first + STORIA_PER_PAGE} din {len(results)}",
+        )
+        cards = []
+        for ad in ads:
+            area = ad["areaInSquareMeters"]
+            per_sqm = ad["pricePerSquareMeter"]["value"]
+            link = nest(["div"], f'<a href="/ro/oferta/{ad["slug"]}"><p>{ad["title"]}</p></a>')
+            facts = "".join(f"<span>{fact}</span>" for fact in (
+                f"{area * per_sqm:,} €".replace(",", " "),
+                f"{per_sqm:,} €/m²".replace(",", " "),
+                f"{STORIA_ROOMS.index(ad['roomsNumber']) + 1} camere",
+                f"{area} m²",
+            ))
+            cards.append(nest(["li", "article", "section"], link + f"<div>{facts}</div>"))
+        cards = "".join(cards)
+        listings = nest(["div"] * 6, f"<ul>{cards}</ul>")
+        html = nest(["html", "body", "div", "div", "main"], pagination + listings)
+        if self.next_data:
+            html = html.replace("</body>", self.storia_state(ads, page, len(results)) + "</body>")
+        return self.html(html)
+
+    def storia_state(self, ads: list, page: int, total: int) -> str:
+        state = {"props": {"pageProps": {"data": {"searchAds": {
+            "items": ads,
+            "pagination": {"page": page, "totalPages": math.ceil(total / STORIA_PER_PAGE),
+                           "itemsPerPage": STORIA_PER_PAGE, "totalResults": total},
+        }}}}}
+        return f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(state)}</script>'
+
+    async def storia_listing(self, request: web.Request) -> web.Response:
+        draw = page_random(request)
+        area = draw.randint(35, 120)
+        per_sqm = draw.randint(1200, 3500)
+        html = self.storia_detail_html.replace(
+            "@title@", f"Apartament {draw.randint(1, 4)} camere de vanzare||{request.match_info['slug']}"
+        )
+        html = html.replace("@price@", f"{area * per_sqm:,}".replace(",", " "))
+        return self.html(html.replace("@per_sqm@", f"{per_sqm:,}".replace(",", " ")))
+
+    async def korter_city(self, request: web.Request) -> web.Response:
+        page = page_number(request)
+        city = request.match_info["city"]
+        html = re.sub(
+            r"@page(\d+)@",
+            lambda match: str(min(int(match.group(1)), self.pages)),
+            self.korter_city_html,
+        )
+        return self.html(html.replace("@city@", city).replace("@page@", str(page)))
+
+    async def korter_listing(self, request: web.Request) -> web.Response:
+        draw = page_random(request)
+        area = draw.randint(35, 120)
+        per_sqm = draw.randint(1200, 3500)
+        tags = [
+            f"Bucuresti, Sector {draw.randint(1, 6)}",
+            f"{draw.randint(1, 4)} camere",
+            f"{area} m2",
+            f"{area * per_sqm:,} €".replace(",", " "),
+            f"{per_sqm:,} € / m2".replace(",", " "),
+            f"etaj {draw.randint(0, 12)}",
+            f"{draw.randint(1, 2)} baie",
+            f"{draw.randint(1, 3)} dormitoare",
+        ]
+        body = f"<h1>Ansamblu {request.match_info['complex']} {request.match_info['id']}</h1>"
+        body += nest(["div", "div"], "".join(f"<div>{tag}</div>" for tag in tags))
+        return self.html(nest(["html", "body"] + ["div"] * 7, body))
+
+    async def skiaone_results(self, request: web.Request) -> web.Response:
+        page = page_number(request, 0)
+        origin = f"{request.scheme}://{request.host}"
+        draw = page_random(request)
+        cards = "".join(
+            '<div class="property-col"><div class="property-card">'
+            f'<a href="{origin}/ro/proprietate/standin-{page}-{index}">'
+            f'<h3 class="property-card-title">Apartament {page}-{index}</h3></a>'
+            f'<div class="pricing-btn">{draw.randint(80, 400) * 1000:,}\xa0€</div>'
+            f'<div class="bedroom-icon">{draw.randint(1, 4)}</div>'
+            f'<div class="area-icon">{draw.randint(35, 120)} mp</div>'
+            f'<div class="floor-icon">{draw.randint(0, 12)}</div>'
+            "</div></div>"
+            for index in range(SKIAONE_PER_PAGE if page < self.pages else 0)
+        )
+        paging = json.dumps({"pages": self.pages, "page": page})
+        return self.html(
+            "<!DOCTYPE html><html><body>"
+            f"<div class=\"row no-gutters my-3 properties-row\">{cards}</div>"
+            f"<nav class=\"pagination-container\" data-paging='{paging}'></nav>"
+            "</body></html>"
+        )
+
+    async def skiaone_details(self, request: web.Request) -> web.Response:
+        return self.html(
+            self.skiaone_details_html.replace(
+                "<body>", f"<body><!-- {request.match_info['slug']} -->", 1
+            )
+        )
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "uptime": time.time() - self.started,
+            "statuses": {str(status): count for status, count in self.statuses.items()},
+            "requests": sum(self.statuses.values()),
+        })
+
+    def application(self) -> web.Application:
+        app = web.Application(middlewares=[self.conditions])
+        app.router.add_get("/__stats", self.stats)
+        app.router.add_get(STORIA_SEARCH_PATH, self.storia_search)
+        app.router.add_get(STORIA_SEARCH_PATH + "/{district}", self.storia_search)
+        app.router.add_get("/ro/oferta/{slug}", self.storia_listing)
+        app.router.add_get("/vanzare-apartamente-{city}", self.korter_city)
+        app.router.add_get("/{complex}/{district}/{id:\\d+}", self.korter_listing)
+        app.router.add_get("/{locale}/proprietati", self.skiaone_results)
+        app.router.add_get("/{locale}/proprietate/{slug}", self.skiaone_details)
+        return app
+
+
+def main() -> int:
+    arguments = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arguments.add_argument("--host", default="127.0.0.1")
+    arguments.add_argument("--port", type=int, default=8900)
+    arguments.add_argument("--pages", type=int, default=10,
+                           help="search pages per search, city or filter")
+    arguments.add_argument("--latency-ms", type=float, default=50.0, help="median latency")
+    arguments.add_argument("--sigma", type=float, default=0.5,
+                           help="lognormal spread of the latency")
+    arguments.add_argument("--slow-rate", type=float, default=0.0,
+                           help="fraction of responses delayed by --slow-ms")
+    arguments.add_argument("--slow-ms", type=float, default=2000.0)
+    arguments.add_argument("--error-rate", type=float, default=0.0,
+                           help="fraction answered 500/503")
+    arguments.add_argument("--drop-rate", type=float, default=0.0,
+                           help="fraction of connections closed unanswered")
+    arguments.add_argument("--rate-limit", type=float, default=0.0,
+                           help="requests/sec above which 429 is answered, 0 for none")
+    arguments.add_argument("--no-next-data", action="store_true",
+                           help="Storia search pages without the Next.js state")
+    arguments.add_argument("--page-cap", type=int, default=0,
+                           help="Storia search pages served per search, 0 for no cap")
+    arguments.add_argument("--seed", type=int)
+    options = arguments.parse_args()
+
+    site = StandinSite(
+        pages=options.pages,
+        latency_ms=options.latency_ms,
+        sigma=options.sigma,
+        slow_rate=options.slow_rate,
+        slow_ms=options.slow_ms,
+        error_rate=options.error_rate,
+        drop_rate=options.drop_rate,
+        rate_limit=options.rate_limit,
+        next_data=not options.no_next_data,
+        page_cap=options.page_cap,
+        seed=options.seed,
+    )
+    print(f"Stand-in serving on http://{options.host}:{options.port}", file=sys.stderr, flush=True)
+    web.run_app(site.application(), host=options.host, port=options.port,
+                print=None, access_log=None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())